@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""Check headerexposer's import time against a budget.
+
+The CLI is often run from cron jobs and scripts, where its startup
+dominates each run. Importing headerexposer and its __main__ therefore
+must not load the heavy dependencies (jsonschema, requests, urllib3,
+colorama), which are only imported by the commands that need them.
+
+This script measures the import with python's -X importtime option,
+keeps the best of several runs, prints the slowest modules, and exits
+with status 1 if the import exceeds the budget or loads a deferred
+dependency.
+
+Usage:
+python3 benchmarks/import_time.py [--budget-ms 30] [--runs 5]
+"""
+
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# The module whose cumulative import time is checked.
+MODULE = "headerexposer.__main__"
+
+# The dependencies which must only be imported when needed.
+DEFERRED_MODULES = ["jsonschema", "requests", "urllib3", "colorama"]
+
+
+def run_python(*arguments):
+    """Run python from the repository's root, returning its output."""
+    environment = dict(os.environ, PYTHONPATH=ROOT)
+
+    return subprocess.run(
+        [sys.executable, *arguments],
+        cwd=ROOT,
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def measure_import():
+    """Import MODULE once, returning {module: (self_us, cumulative_us)}."""
+    stderr = run_python("-X", "importtime", "-c", f"import {MODULE}").stderr
+
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        timings[module.strip()] = (int(self_us), int(cumulative_us))
+
+        # Leave out the modules imported by the interpreter's startup.
+        if module.strip() == "site":
+            timings.clear()
+
+    return timings
+
+
+def loaded_deferred_modules():
+    """Return the deferred modules which are loaded by importing MODULE."""
+    stdout = run_python(
+        "-c",
+        f"import sys, {MODULE}\n"
+        f"print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))",
+    ).stdout
+
+    return stdout.split()
+
+
+def main():
+    """Measure the import time and check it against the budget."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=30,
+        help="The maximum cumulative import time of"
+        f" {MODULE}, in milliseconds. Default: 30.",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="The number of measured imports, the best one is kept."
+        " Default: 5.",
+    )
+    args = parser.parse_args()
+
+    # Measure the import itself rather than the compilation to bytecode,
+    # which does not happen on installed packages.
+    compileall.compile_dir(
+        os.path.join(ROOT, "headerexposer"), quiet=1, force=False
+    )
+
+    best = min(
+        (measure_import() for _ in range(args.runs)),
+        key=lambda timings: timings[MODULE][1],
+    )
+    total_ms = best[MODULE][1] / 1000
+
+    print(f"{'module':<40} {'self (ms)':>10} {'cumulative (ms)':>16}")
+    slowest = sorted(best.items(), key=lambda item: item[1][0], reverse=True)
+    for module, (self_us, cumulative_us) in slowest[:15]:
+        print(
+            f"{module:<40} {self_us / 1000:>10.2f} {cumulative_us / 1000:>16.2f}"
+        )
+
+    print(f"\n{MODULE}: {total_ms:.2f} ms (budget: {args.budget_ms} ms)")
+
+    failed = False
+
+    if total_ms > args.budget_ms:
+        print("FAIL: the import time exceeds the budget.")
+        failed = True
+
+    deferred = loaded_deferred_modules()
+    if deferred:
+        print(
+            f"FAIL: deferred modules imported eagerly: {', '.join(deferred)}"
+        )
+        failed = True
+
+    if not failed:
+        print("OK")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+
+"""Benchmark analysis, baseline loading and rendering on synthetic corpora.
+
+Each benchmark is run against both bundled baselines (baseline.json and
+baseline_short.json) and, where it takes header values, on each of the
+synthetic corpora, generated from a fixed seed so that every run
+measures the same work:
+
+- "realistic": the values commonly seen in the wild, with repetitions;
+- "hostile": long values, such as thousands of repeated directives,
+  separators or spaces, tokens without any break, and unicode;
+- "huge-csp": Content-Security-Policy-like directive lists of hundreds
+  of sources. As the bundled baselines do not rate CSP, such lists are
+  also set as the values of their directive-list headers
+  (Feature-Policy, Cache-Control...).
+
+The benchmarked paths are:
+
+- load_baseline: parsing, validating and compiling a baseline, and
+  loading it from the compiled baseline cache;
+- analyse_header: matching each value against its header rule, with no
+  cache involved;
+- analyse_headers: analysing each header map, the caches being cleared
+  before each pass, as in a fresh process;
+- wrap_and_join: wrapping each value in a table cell, uncached;
+- tabulate_findings: rendering the findings of each header map, the
+  wrapping caches being cleared before each pass.
+
+Each benchmark is timed over several passes, and the best pass is kept.
+A pass lasting more than --timeout seconds, e.g. because a pattern
+backtracks catastrophically on a hostile value, is interrupted, and its
+benchmark reported as timed out (which relies on SIGALRM, hence Unix).
+Nothing is fetched: the suite runs offline. The results can be written
+as JSON with --output, and compared to a previous run with --compare,
+in which case the exit status is 1 if a benchmark got slower than
+--max-slowdown.
+
+Usage:
+python3 benchmarks/suite.py [--quick] [--output results.json]
+                            [--compare previous.json] [--filter analyse]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.insert(0, ROOT)
+
+import headerexposer as he  # noqa: E402  # pylint: disable=C0413
+
+# The version of the results' format, to be increased whenever it
+# changes incompatibly.
+RESULTS_VERSION = 1
+
+# The bundled baselines, which every benchmark is run against.
+BASELINES = ["baseline.json", "baseline_short.json"]
+
+# The seed of the synthetic corpora.
+SEED = 20240521
+
+# The number of header maps of each corpus, and of timed passes.
+CORPUS_SIZE = 500
+REPEAT = 3
+
+# The same, with --quick.
+QUICK_CORPUS_SIZE = 100
+QUICK_REPEAT = 2
+
+# The width of the rendered tables.
+MAX_WIDTH = 120
+
+# The number of baseline loads timed per pass.
+LOADS = 20
+
+# How many seconds a pass may last before its benchmark is reported as
+# timed out, e.g. because of catastrophic backtracking in a pattern.
+TIMEOUT = 10
+
+# The values commonly seen in the wild, by header.
+REALISTIC_VALUES = {
+    "Strict-Transport-Security": [
+        "max-age=31536000",
+        "max-age=31536000; includeSubDomains",
+        "max-age=63072000; includeSubDomains; preload",
+        "max-age=0",
+        "max-age=300",
+    ],
+    "X-Frame-Options": ["DENY", "SAMEORIGIN", "ALLOW-FROM https://a.com"],
+    "X-Content-Type-Options": ["nosniff", "none"],
+    "X-Permitted-Cross-Domain-Policies": ["none", "master-only", "all"],
+    "Referrer-Policy": [
+        "no-referrer",
+        "strict-origin-when-cross-origin",
+        "same-origin",
+        "unsafe-url",
+        "no-referrer, strict-origin-when-cross-origin",
+    ],
+    "Feature-Policy": [
+        "geolocation 'none'; camera 'none'; microphone 'none'",
+        "geolocation 'self' https://maps.example.com; fullscreen *",
+        "vibrate 'none'",
+    ],
+    "X-XSS-Protection": ["0", "1", "1; mode=block", "1; report=/xss"],
+    "Cache-Control": [
+        "no-store",
+        "no-cache, no-store, must-revalidate",
+        "private, max-age=0",
+        "public, max-age=3600",
+        "max-age=604800, immutable",
+    ],
+    "Content-Security-Policy": [
+        "default-src 'self'",
+        "default-src 'self'; script-src 'self' https://cdn.example.com",
+        "default-src *; script-src 'unsafe-inline' 'unsafe-eval'",
+        "frame-ancestors 'none'",
+    ],
+}
+
+# The headers whose values are lists of directives.
+DIRECTIVE_LIST_HEADERS = [
+    "Strict-Transport-Security",
+    "Referrer-Policy",
+    "Feature-Policy",
+    "X-XSS-Protection",
+    "Cache-Control",
+    "Content-Security-Policy",
+]
+
+
+def realistic_corpus(rng, size):
+    """Return header maps of common values, most headers present."""
+    return [
+        {
+            name: rng.choice(values)
+            for name, values in REALISTIC_VALUES.items()
+            if rng.random() < 0.7
+        }
+        for _ in range(size)
+    ]
+
+
+def hostile_value(rng, name):
+    """Return a long value meant to stress the matching and wrapping."""
+    length = rng.choice([1024, 4096, 16384])
+    kind = rng.randrange(6)
+
+    if kind == 0:
+        # A valid-looking directive, repeated.
+        value = "; ".join(
+            [rng.choice(REALISTIC_VALUES[name])] * (length // 16)
+        )
+    elif kind == 1:
+        # Separators and spaces, which patterns often repeat.
+        value = rng.choice([";", " ", "; ", ",", "= "]) * length
+    elif kind == 2:
+        # A single token which cannot be wrapped at spaces.
+        value = "".join(rng.choice("abcdef0123456789") for _ in range(length))
+    elif kind == 3:
+        # A valid prefix followed by garbage.
+        value = rng.choice(REALISTIC_VALUES[name]) + "x" * length
+    elif kind == 4:
+        # Unicode, including wide characters.
+        characters = "éà漢字🔒 ;="
+        value = "".join(rng.choice(characters) for _ in range(length // 4))
+    else:
+        # Many distinct directives.
+        value = "; ".join(f"d{i}={i}" for i in range(length // 8))
+
+    return value[:length]
+
+
+def hostile_corpus(rng, size):
+    """Return header maps of long, hostile values."""
+    return [
+        {
+            name: hostile_value(rng, name)
+            for name in REALISTIC_VALUES
+            if rng.random() < 0.5
+        }
+        for _ in range(size)
+    ]
+
+
+def huge_csp(rng):
+    """Return a CSP-like list of hundreds of sources."""
+    directives = [
+        "default-src",
+        "script-src",
+        "style-src",
+        "img-src",
+        "connect-src",
+        "font-src",
+        "frame-src",
+    ]
+
+    return "; ".join(
+        f"{directive} 'self' "
+        + " ".join(
+            rng.choice(
+                [
+                    f"https://cdn{i}.example{rng.randrange(100)}.com",
+                    f"'sha256-{'%043x' % rng.getrandbits(172)}='",
+                    f"'nonce-{rng.getrandbits(64):x}'",
+                    "'unsafe-inline'",
+                    "data:",
+                ]
+            )
+            for i in range(rng.randrange(20, 80))
+        )
+        for directive in directives
+    )
+
+
+def huge_csp_corpus(rng, size):
+    """Return header maps whose directive lists are huge CSPs."""
+    return [
+        {
+            name: huge_csp(rng)
+            for name in DIRECTIVE_LIST_HEADERS
+            if rng.random() < 0.5
+        }
+        for _ in range(size)
+    ]
+
+
+def corpora(size):
+    """Return {name: [he.Headers]}, generated from SEED."""
+    rng = random.Random(SEED)
+
+    return {
+        name: [he.Headers(headers.items()) for headers in generate(rng, size)]
+        for name, generate in [
+            ("realistic", realistic_corpus),
+            ("hostile", hostile_corpus),
+            ("huge-csp", huge_csp_corpus),
+        ]
+    }
+
+
+def clear_caches():
+    """Clear headerexposer's in-memory caches."""
+    he.clear_findings_cache()
+    he.clear_value_cache()
+    he.clear_wrap_cache()
+
+
+class PassTimeout(Exception):
+    """Raised when a pass lasts more than its timeout."""
+
+
+def raise_timeout(signum, frame):
+    """Interrupt the current pass, see measure()."""
+    raise PassTimeout()
+
+
+def measure(function, repeat, setup=None, timeout=TIMEOUT):
+    """Time repeat passes of function(), returning their durations.
+
+    Each pass, including its setup, is interrupted after timeout
+    seconds, in which case None is returned.
+    """
+    durations = []
+    handler = signal.signal(signal.SIGALRM, raise_timeout)
+
+    try:
+        for _ in range(repeat):
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+
+            if setup is not None:
+                setup()
+
+            start = time.perf_counter()
+            function()
+            durations += [time.perf_counter() - start]
+
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    except PassTimeout:
+        return None
+
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, handler)
+
+    return durations
+
+
+def benchmarks(baseline_name, corpus_by_name, cache_dir):
+    """Yield the (name, corpus, items, function, setup) benchmarks."""
+    path = he._package_file(baseline_name)
+    baseline = he.load_baseline(path, compiled=True)
+
+    def load_baseline():
+        for _ in range(LOADS):
+            he.load_baseline(path, compiled=True)
+
+    def load_cached_baseline():
+        for _ in range(LOADS):
+            he.load_baseline(path, compiled=True, cache_dir=cache_dir)
+
+    yield "load_baseline", None, LOADS, load_baseline, None
+
+    # Fill the cache, so that it is loaded by each timed pass.
+    he.load_baseline(path, compiled=True, cache_dir=cache_dir)
+
+    yield (
+        "load_baseline (cached)",
+        None,
+        LOADS,
+        load_cached_baseline,
+        None,
+    )
+
+    for corpus_name, corpus in corpus_by_name.items():
+        pairs = [
+            (rule, headers[rule.name])
+            for headers in corpus
+            for rule in baseline.headers
+            if rule.name in headers
+        ]
+        findings = []
+        values = [value for headers in corpus for value in headers.values()]
+
+        def analyse_header(pairs=pairs):
+            for rule, value in pairs:
+                he._analyse_header(value, rule)
+
+        def analyse_headers(corpus=corpus):
+            for headers in corpus:
+                he.analyse_headers(headers, baseline, True)
+
+        def wrap_and_join(values=values):
+            for value in values:
+                he._wrap_and_join(value, 40, "\\\n")
+
+        def analyse_corpus(corpus=corpus, findings=findings):
+            clear_caches()
+
+            if not findings:
+                findings += [
+                    he.analyse_headers(h, baseline, True) for h in corpus
+                ]
+
+        def tabulate_findings(findings=findings):
+            for header_findings in findings:
+                he.tabulate_findings(header_findings, MAX_WIDTH)
+
+        yield "analyse_header", corpus_name, len(pairs), analyse_header, None
+        yield (
+            "analyse_headers",
+            corpus_name,
+            len(corpus),
+            analyse_headers,
+            clear_caches,
+        )
+        yield "wrap_and_join", corpus_name, len(values), wrap_and_join, None
+        yield (
+            "tabulate_findings",
+            corpus_name,
+            len(corpus),
+            tabulate_findings,
+            analyse_corpus,
+        )
+
+
+def result_key(result):
+    """Identify a result, for comparisons."""
+    return (result["benchmark"], result["baseline"], result["corpus"])
+
+
+def git_revision():
+    """Return the repository's current commit, or None."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """Run the selected benchmarks, returning the results document."""
+    size = QUICK_CORPUS_SIZE if args.quick else CORPUS_SIZE
+    repeat = args.repeat or (QUICK_REPEAT if args.quick else REPEAT)
+    corpus_by_name = corpora(size)
+    results = []
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for baseline_name in BASELINES:
+            for name, corpus, items, function, setup in benchmarks(
+                baseline_name, corpus_by_name, cache_dir
+            ):
+                if args.filter and args.filter not in name:
+                    continue
+
+                durations = measure(function, repeat, setup, args.timeout)
+                result = {
+                    "benchmark": name,
+                    "baseline": baseline_name,
+                    "corpus": corpus,
+                    "items": items,
+                    "repeat": repeat,
+                    "timed_out": durations is None,
+                    "best_s": None,
+                    "median_s": None,
+                    "us_per_item": None,
+                }
+
+                if durations is not None:
+                    result["best_s"] = min(durations)
+                    result["median_s"] = statistics.median(durations)
+                    result["us_per_item"] = (
+                        min(durations) * 1e6 / max(items, 1)
+                    )
+
+                results += [result]
+
+                print_result(results[-1])
+
+    return {
+        "version": RESULTS_VERSION,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "corpus_size": size,
+        "timeout": args.timeout,
+        "results": results,
+    }
+
+
+def format_time(seconds, scale):
+    """Format a duration, or a timeout."""
+    return "timeout" if seconds is None else f"{seconds * scale:.2f}"
+
+
+def print_result(result):
+    """Print a result as a row."""
+    print(
+        f"{result['benchmark']:<23} {result['baseline']:<20}"
+        f" {result['corpus'] or '-':<10} {result['items']:>7}"
+        f" {format_time(result['best_s'], 1000):>10}"
+        f" {format_time(result['us_per_item'], 1):>10}",
+        flush=True,
+    )
+
+
+def compare(previous, current, max_slowdown):
+    """Print the slowdowns since a previous run, returning the failures."""
+    previous_results = {result_key(r): r for r in previous["results"]}
+    failures = 0
+
+    print(
+        f"\n{'benchmark':<23} {'baseline':<20} {'corpus':<10}"
+        f" {'before (us)':>11} {'after (us)':>10} {'ratio':>6}"
+    )
+
+    for result in current["results"]:
+        before = previous_results.get(result_key(result))
+
+        if before is None:
+            continue
+
+        after_us, before_us = result["us_per_item"], before["us_per_item"]
+
+        # A timeout is slower than anything but another timeout.
+        if after_us is None or before_us is None:
+            ratio = None
+            slower = after_us is None and before_us is not None
+        else:
+            ratio = after_us / before_us
+            slower = ratio > max_slowdown
+
+        failures += slower
+
+        print(
+            f"{result['benchmark']:<23} {result['baseline']:<20}"
+            f" {result['corpus'] or '-':<10}"
+            f" {format_time(before_us, 1):>11} {format_time(after_us, 1):>10}"
+            f" {'-' if ratio is None else f'{ratio:.2f}x':>6}"
+            + ("  SLOWER" if slower else "")
+        )
+
+    if previous.get("corpus_size") != current["corpus_size"]:
+        print("\nWarning: the runs' corpus sizes differ.")
+
+    return failures
+
+
+def main():
+    """Run the benchmarks and print, store or compare their results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help=f"Use corpora of {QUICK_CORPUS_SIZE} header maps instead of"
+        f" {CORPUS_SIZE}, and {QUICK_REPEAT} passes instead of {REPEAT}.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        help="The number of timed passes, the best one is kept.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=TIMEOUT,
+        help="How many seconds a pass may last before its benchmark is"
+        f" reported as timed out. Default: {TIMEOUT}.",
+    )
+    parser.add_argument(
+        "--filter",
+        help="Only run the benchmarks whose name contains this string.",
+    )
+    parser.add_argument(
+        "-o", "--output", help="Path to write the results to, as JSON."
+    )
+    parser.add_argument(
+        "--compare",
+        help="Path to the JSON results of a previous run to compare to.",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="The ratio to the previous run's time per item above which"
+        " a benchmark fails the comparison. Default: 1.25.",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'benchmark':<23} {'baseline':<20} {'corpus':<10} {'items':>7}"
+        f" {'best (ms)':>10} {'per item':>10}"
+    )
+
+    results = run(args)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+            output.write("\n")
+
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as previous_file:
+            previous = json.load(previous_file)
+
+        failures = compare(previous, results, args.max_slowdown)
+
+        if failures:
+            print(f"FAIL: {failures} benchmarks got slower.")
+            sys.exit(1)
+
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""Benchmark wrap_and_join() against the previous width-decrement loop.
+
+wrap_and_join() used to re-wrap the whole text with a width decreased
+by one until every joined line fitted. It now jumps right below the
+longest wrapped line instead. This script checks that both produce the
+same output on long header values, and compares their number of
+wrapping passes and their timings.
+
+Note that the previous loop needed at most one pass more than the
+separator's width (e.g. 2 passes for the "\\" + newline separator of
+table cells), since any width that leaves room for the separator
+fits. The gains therefore grow with the separator's width.
+
+Usage:
+python3 benchmarks/wrap_and_join.py
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import headerexposer as he  # noqa: E402  # pylint: disable=C0413
+
+# The number of timed calls for each case.
+NUMBER = 20
+
+
+def linear_wrap_and_join(text, width=70, sep="\n", **kwargs):
+    """The previous wrap_and_join() implementation, for reference."""
+    ansi_pattern = re.compile(r"(\033|\u001b\x1b)\[\d+m")
+
+    optimal_width = width
+
+    lines = he._safe_wrap(text, width=width, **kwargs)
+
+    max_line_length = max(
+        [
+            len(ansi_pattern.sub("", line))
+            for line in sep.join(lines).splitlines()
+        ]
+    )
+
+    while max_line_length > width:
+        optimal_width -= 1
+
+        lines = he._safe_wrap(text, width=optimal_width, **kwargs)
+        max_line_length = max(
+            [
+                len(ansi_pattern.sub("", line))
+                for line in sep.join(lines).splitlines()
+            ]
+        )
+
+    return sep.join(lines)
+
+
+def count_passes(function, *args):
+    """Count the calls to _safe_wrap() made by function(*args)."""
+    safe_wrap = he._safe_wrap
+    passes = [0]
+
+    def counting_safe_wrap(*wrap_args, **wrap_kwargs):
+        passes[0] += 1
+        return safe_wrap(*wrap_args, **wrap_kwargs)
+
+    he._safe_wrap = counting_safe_wrap
+
+    try:
+        function(*args)
+
+    finally:
+        he._safe_wrap = safe_wrap
+
+    return passes[0]
+
+
+def cases():
+    """Return the (name, text, width, sep) benchmark cases."""
+    csp = "default-src 'self'; " + "; ".join(
+        f"script-src https://cdn{i}.example.com 'sha256-{'A' * 43}='"
+        for i in range(60)
+    )
+
+    colored = he.special_to_ansi(
+        " ".join(
+            f"[red]This header's value is dangerous.[normal] [green]This"
+            f" directive number {i} is fine.[normal]"
+            for i in range(40)
+        )
+    )
+
+    hsts = "max-age=31536000; includeSubDomains; preload; " * 50
+
+    return [
+        ("huge CSP value", csp, 40, "\\\n"),
+        ("huge CSP value", csp, 40, "    \\\n"),
+        ("huge CSP value", csp, 100, "\\\n"),
+        ("repeated HSTS value", hsts, 30, "\\\n"),
+        ("repeated HSTS value", hsts, 30, " | \n  > "),
+        ("colored explanation", colored, 60, "\n"),
+        ("colored explanation", colored, 120, " | \n  > "),
+        ("colored value", colored, 80, "\\\n"),
+        ("colored value", colored, 80, " | \n  > "),
+    ]
+
+
+def main():
+    """Run the benchmark and print its results."""
+    print(
+        f"{'case':<21} {'width':>5} {'sep':>9} {'passes':>13}"
+        f" {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}"
+    )
+
+    for name, text, width, sep in cases():
+
+        expected = linear_wrap_and_join(text, width, sep)
+        assert he._wrap_and_join(text, width, sep) == expected, name
+
+        before_passes = count_passes(linear_wrap_and_join, text, width, sep)
+        after_passes = count_passes(he._wrap_and_join, text, width, sep)
+
+        before = timeit.timeit(
+            lambda: linear_wrap_and_join(text, width, sep), number=NUMBER
+        )
+        after = timeit.timeit(
+            lambda: he._wrap_and_join(text, width, sep), number=NUMBER
+        )
+
+        print(
+            f"{name:<21} {width:>5} {sep!r:>9}"
+            f" {before_passes:>6} -> {after_passes:<3}"
+            f" {before * 1000 / NUMBER:>12.2f} {after * 1000 / NUMBER:>11.2f}"
+            f" {before / after:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -41,17 +41,44 @@ __all__ = [
     "special_to_ansi",
     "b_special_to_ansi",
     "print_special",
+    "init_colors",
     "safe_wrap",
     "wrap_and_join",
+    "wrap_cache_info",
+    "clear_wrap_cache",
+    "tabulate_rows",
     "tabulate_dict",
     "tabulate_findings",
     "string_to_dict",
     "parse_request_cookies",
     "parse_request_headers",
     "parse_request_parameters",
+    "MatchLimits",
+    "MatchTimeout",
+    "CompiledExplanationPattern",
+    "CompiledHeaderRule",
+    "CompiledBaseline",
+    "compile_header_rule",
+    "compile_baseline",
+    "guard_baseline",
+    "baseline_version",
+    "default_cache_dir",
     "load_baseline",
+    "Headers",
+    "CacheInfo",
+    "findings_cache_info",
+    "clear_findings_cache",
+    "value_cache_info",
+    "clear_value_cache",
     "analyse_header",
+    "iter_findings",
     "analyse_headers",
+    "plain_rating",
+    "plain_finding",
+    "write_jsonl",
+    "write_json",
+    "write_csv",
+    "write_sarif",
 ]
 __author__ = "Alexandre Janvrin"
 __description__ = "Analyse the security of your website's headers!"
@@ -59,19 +86,33 @@ __license__ = "AGPLv3+"
 __title__ = "headerexposer"
 __url__ = "https://github.com/LivinParadoX/headerexposer"
 
+import bisect
+import contextlib
+import csv
 import functools
 import json
+import os
 import re
 import shutil
-from importlib import resources
-from typing import Any, List, Optional, Tuple, Union
-
-import ansiwrap  # type: ignore
-import colorama  # type: ignore
-import jsonschema  # type: ignore
-import tabulate
-
-colorama.init()
+import sys
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Match,
+    NamedTuple,
+    Optional,
+    Pattern,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 _SPECIALS = {
     "[red]": 91,
@@ -83,10 +124,82 @@ _SPECIALS = {
     "[normal]": 0,
 }
 
-with resources.path(
-    "headerexposer", "baseline_schema.json"
-) as baseline_schema_path:
-    BASELINE_SCHEMA_PATH = baseline_schema_path
+# The maximum number of entries of each of the wrapping caches, see
+# wrap_cache_info().
+WRAP_CACHE_SIZE = 4096
+
+# The maximum number of header sets whose findings are cached by
+# analyse_headers(), see findings_cache_info().
+FINDINGS_CACHE_SIZE = 4096
+
+# The maximum number of (header rule, value) couples whose analysis is
+# cached by analyse_header(), see value_cache_info().
+VALUE_CACHE_SIZE = 16384
+
+# The maximum number of (header rule, value) couples whose timed out
+# analysis is remembered, and for how many seconds, see analyse_header().
+TIMEOUT_CACHE_SIZE = 1024
+TIMEOUT_CACHE_SECONDS = 60.0
+
+# Any SGR ANSI code such as "\033[91m", and its parameters.
+_SGR_PATTERN = re.compile(r"\033\[([\d;]*)m")
+
+# The parameters of the SGR ANSI codes which reset the style.
+_RESET_PARAMETERS = ("", "0")
+
+# textwrap's whitespaces, which it replaces with spaces.
+_WHITESPACE_TO_SPACE = str.maketrans("\t\n\x0b\x0c\r", "     ")
+
+# The cells which make a column right-aligned in tables.
+_NUMBER_PATTERN = re.compile(r"^[-+]?\d+(\.\d+)?$")
+
+# The ratings as printed in the findings, i.e. special_to_ansi() of
+# "[green][G O O D][normal]" etc.
+_NICE_RATINGS = {
+    "good": "\033[92m[G O O D]\033[0m",
+    "medium": "\033[93m[M E D]\033[0m",
+    "bad": "\033[91m[B A D]\033[0m",
+}
+
+# The rating keys, indexed by their printed form.
+_PLAIN_RATINGS = {nice: plain for plain, nice in _NICE_RATINGS.items()}
+
+# Any ANSI code, as found in baselines' explanations.
+_ANSI_PATTERN = re.compile(r"(\033|\u001b|\x1b)\[\d+m")
+
+# Marks the patterns which were not yet matched in analyse_header().
+_UNMATCHED = object()
+
+# The version of the baseline cache files' format, see load_baseline().
+# It must be increased whenever the compiled baseline's structure
+# changes, so that outdated cache files are ignored.
+_BASELINE_CACHE_VERSION = 3
+
+# Group references (and any other escape) in re.sub() templates.
+_TEMPLATE_ESCAPE_PATTERN = re.compile(
+    r"\\(?:g<([^>]*)>|([1-9]\d?)(?![0-7])|.)", re.DOTALL
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _package_file(name: str) -> Any:
+    """Return the path to one of the package's data files.
+
+    importlib.resources is only imported on the first call, as it is
+    not needed by most imports of the module.
+    """
+    from importlib import resources  # pylint: disable=C0415
+
+    with resources.path("headerexposer", name) as path:
+        return path
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve BASELINE_SCHEMA_PATH lazily, on first access."""
+    if name == "BASELINE_SCHEMA_PATH":
+        return _package_file("baseline_schema.json")
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def special_to_ansi(string: str, no_colors: Optional[bool] = False) -> str:
@@ -161,6 +274,42 @@ def print_special(text: str) -> None:
     print(special_to_ansi(text))
 
 
+class _AnsiStrippingStream:
+    """A text stream wrapper which strips the ANSI codes written to it."""
+
+    def __init__(self, stream: TextIO):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        """Write text to the wrapped stream, without its ANSI codes."""
+        return self._stream.write(_SGR_PATTERN.sub("", text))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+def init_colors() -> None:
+    """Prepare the standard output for printing ANSI codes.
+
+    This should be called once before printing tables or special
+    strings. If the standard output is a terminal, colorama is imported
+    and initialized, so that ANSI codes also work on Windows consoles.
+    Otherwise, e.g. when the output is piped or redirected to a file,
+    the standard output is wrapped to strip the ANSI codes, and
+    colorama is not loaded at all.
+    """
+    if isinstance(sys.stdout, _AnsiStrippingStream):
+        return
+
+    if sys.stdout.isatty():
+        import colorama  # type: ignore  # pylint: disable=C0415
+
+        colorama.init()
+
+    else:
+        sys.stdout = _AnsiStrippingStream(sys.stdout)
+
+
 def safe_wrap(text: str, width: int = 70, **kwargs) -> List[str]:
     """Wrap a paragraph of text, returning a list of wrapped lines.
 
@@ -171,14 +320,13 @@ def safe_wrap(text: str, width: int = 70, **kwargs) -> List[str]:
     to space.  See textwrap's TextWrapper class for available keyword
     args to customize wrapping behavior.
 
-    This function is actually a wrapper (no pun intended) around
-    ansiwrap's wrap() function. It ensures than no dangling ANSI code
-    is present at the end of a line, in order to eliminate unwanted
-    color behavior such as color being applied to surrounding columns
-    in a table. When a non-zero ANSI code is found in a string without
-    a closing zero ANSI code, a zero ANSI code is appended to the
-    string and the previously found ANSI code is prepended to the next
-    line.
+    Unlike textwrap's wrap() function, it is aware of ANSI codes: they
+    do not count in the lines' widths. It also ensures than no dangling
+    ANSI code is present at the end of a line, in order to eliminate
+    unwanted color behavior such as color being applied to surrounding
+    columns in a table. When a line ends with a style still in effect,
+    a zero ANSI code is appended to it and the style is opened again at
+    the start of the next line.
 
     Args:
         text:
@@ -188,39 +336,216 @@ def safe_wrap(text: str, width: int = 70, **kwargs) -> List[str]:
         kwargs:
           See help("textwrap.TextWrapper") for a list of keyword
           arguments to customize wrapper behavior.
+
+    Returns:
+        The list of wrapped lines. Results are cached, see
+        wrap_cache_info().
     """
-    zero_ansi_pattern = re.compile(r"(\033|\u001b|\x1b)\[0m")
-    nonzero_ansi_pattern = re.compile(r"((\033|\u001b|\x1b)\[[1-9]+\d*m)")
+    kwargs_key = _wrap_kwargs_key(kwargs)
 
-    lines = ansiwrap.wrap(text, width=width, **kwargs)
+    if kwargs_key is None:
+        return _safe_wrap(text, width, **kwargs)
 
-    for line_index in range(len(lines)):
+    return list(_cached_safe_wrap(text, width, kwargs_key))
 
-        # We only care about the part of the sting after the last zero
-        # ANSI code
-        end_of_line = zero_ansi_pattern.split(lines[line_index])[-1]
 
-        # Are there any non-zero ANSI code ?
-        matches = [m[0] for m in nonzero_ansi_pattern.findall(end_of_line)]
+def _safe_wrap(text: str, width: int = 70, **kwargs) -> List[str]:
+    """Wrap a paragraph of text, without caching. See safe_wrap()."""
+    return [line for line, _ in _layout(text, width, **kwargs)]
 
-        # If yes, we append a zero ANSI code to the string, and prepend
-        # The next one with any previously found ANSI codes. If there
-        # is no "next one", we'd rather suppress some formatting than
-        # completely override neighbours' formatting...
-        if matches:
-            lines[line_index] += "\033[0m"
 
-            try:
-                lines[line_index + 1] = "".join(
-                    matches + [lines[line_index + 1]]
-                )
+@functools.lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _tokenize(text: str) -> Tuple[Tuple[Tuple[str, ...], str], ...]:
+    """Split a styled string into (style, text) runs.
+
+    This is the core of the layout engine: a styled string is scanned
+    once, and then only handled as runs of plain text with their style.
+
+    Args:
+        text:
+          The string to split, with ANSI codes.
+
+    Returns:
+        The runs, in order. The style of a run is the tuple of the
+        ANSI codes in effect, e.g. ("\033[4m", "\033[94m"), or an empty
+        tuple after a zero ANSI code. The concatenation of the runs'
+        texts is the visible text.
+    """
+    runs = []
+    style: Tuple[str, ...] = ()
+    position = 0
+
+    for code in _SGR_PATTERN.finditer(text):
+
+        if code.start() > position:
+            runs += [(style, text[position : code.start()])]
+
+        if code.group(1) in _RESET_PARAMETERS:
+            style = ()
+        else:
+            style += (code.group(0),)
+
+        position = code.end()
+
+    if position < len(text):
+        runs += [(style, text[position:])]
+
+    return tuple(runs)
+
+
+def _render_runs(
+    runs: Tuple[Tuple[Tuple[str, ...], str], ...],
+    starts: List[int],
+    start: int,
+    end: int,
+) -> str:
+    """Render the visible text between two offsets with its styles.
+
+    Styles are opened where the text starts, changed only where they
+    change, and closed with a zero ANSI code where the text ends, so
+    that the rendered string never leaks its style to its neighbours
+    (e.g. the surrounding columns in a table).
+
+    Args:
+        runs:
+          The runs, as returned by _tokenize().
+        starts:
+          The offset of each run in the visible text.
+        start:
+          The offset of the first visible character to render.
+        end:
+          The offset after the last visible character to render.
+
+    Returns:
+        The rendered string.
+    """
+    parts: List[str] = []
+    current: Tuple[str, ...] = ()
+    index = max(bisect.bisect_right(starts, start) - 1, 0)
 
-            except IndexError:
-                pass
+    while index < len(runs) and starts[index] < end:
+
+        style, text = runs[index]
+
+        if style != current:
+            if style[: len(current)] == current:
+                parts += style[len(current) :]
+            else:
+                parts += ("\033[0m",) + style
+
+            current = style
+
+        parts += [text[max(start - starts[index], 0) : end - starts[index]]]
+        index += 1
+
+    if current:
+        parts += ["\033[0m"]
+
+    return "".join(parts)
+
+
+def _layout(text: str, width: int = 70, **kwargs) -> List[Tuple[str, str]]:
+    """Wrap a styled paragraph of text.
+
+    The text is tokenized into styled runs, the visible text is
+    wrapped by textwrap, and each wrapped line is rendered back from
+    the runs it covers. This way the lines' widths are exact, and no
+    style dangles at the end of a line.
+
+    Args:
+        text:
+          The long text to wrap, with ANSI codes.
+        width:
+          The maximum width of each line.
+        kwargs:
+          See help("textwrap.TextWrapper") for a list of keyword
+          arguments to customize wrapper behavior.
+
+    Returns:
+        The list of (rendered line, visible line) couples, the visible
+        line being the rendered line without its ANSI codes.
+    """
+    runs = _tokenize(text)
+
+    # Tabs and whitespaces are handled here rather than by textwrap,
+    # for the visible text to stay aligned with the runs.
+    if kwargs.pop("expand_tabs", True) and "\t" in text:
+        tabsize = kwargs.pop("tabsize", 8)
+        expanded_runs = []
+        column = 0
+
+        # Expanding tabs depends on the column, which depends on the
+        # previous runs.
+        for style, run_text in runs:
+            run_text = (" " * column + run_text).expandtabs(tabsize)[column:]
+            line_start = max(run_text.rfind("\n"), run_text.rfind("\r")) + 1
+
+            if line_start > 0:
+                column = len(run_text) - line_start
+            else:
+                column += len(run_text)
+
+            expanded_runs += [(style, run_text)]
+
+        runs = tuple(expanded_runs)
+
+    kwargs.pop("tabsize", None)
+
+    if kwargs.pop("replace_whitespace", True):
+        runs = tuple(
+            (style, run_text.translate(_WHITESPACE_TO_SPACE))
+            for style, run_text in runs
+        )
+
+    starts = []
+    position = 0
+
+    for _, run_text in runs:
+        starts += [position]
+        position += len(run_text)
+
+    visible = "".join(run_text for _, run_text in runs)
+
+    wrapper = textwrap.TextWrapper(
+        width=width, expand_tabs=False, replace_whitespace=False, **kwargs
+    )
+
+    lines = []
+    position = 0
+
+    for line_index, line in enumerate(wrapper.wrap(visible)):
+
+        if line_index == 0:
+            indent = wrapper.initial_indent
+        else:
+            indent = wrapper.subsequent_indent
+
+        content = line[len(indent) :] if line.startswith(indent) else line
+        content_start = visible.find(content, position)
+
+        # Some options, such as placeholders, produce text which is not
+        # in the original. We can only render such lines without style.
+        if content_start == -1:
+            lines += [(line, line)]
+            continue
+
+        position = content_start + len(content)
+
+        rendered = _render_runs(runs, starts, content_start, position)
+        lines += [(line[: len(line) - len(content)] + rendered, line)]
 
     return lines
 
 
+@functools.lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _visible_width(line: str) -> int:
+    """Return the width of a line once printed, i.e. without ANSI codes."""
+    if "\033" not in line:
+        return len(line)
+
+    return sum(len(run_text) for _, run_text in _tokenize(line))
+
+
 def wrap_and_join(
     text: str, width: int = 70, sep: str = "\n", **kwargs
 ) -> str:
@@ -244,35 +569,213 @@ def wrap_and_join(
         kwargs:
           See help("textwrap.TextWrapper") for a list of keyword
           arguments to customize wrapper behavior.
+
+    Returns:
+        The wrapped and joined text. Results are cached, see
+        wrap_cache_info().
     """
-    ansi_pattern = re.compile(r"(\033|\u001b\x1b)\[\d+m")
+    kwargs_key = _wrap_kwargs_key(kwargs)
 
-    optimal_width = width
+    if kwargs_key is None:
+        return _wrap_and_join(text, width, sep, **kwargs)
 
-    lines = safe_wrap(text, width=width, **kwargs)
+    return _cached_wrap_and_join(text, width, sep, kwargs_key)
 
-    # If any line is longer than `width` after joining (not counting
-    # ANSI codes), it's not good, we need to decrease the width.
-    max_line_length = max(
-        [
-            len(ansi_pattern.sub("", line))
-            for line in sep.join(lines).splitlines()
-        ]
-    )
 
-    # We keep trying until all lines are compliant.
-    while max_line_length > width:
-        optimal_width -= 1
+def _wrap_and_join(
+    text: str, width: int = 70, sep: str = "\n", **kwargs
+) -> str:
+    """Wrap a paragraph of text around a separator, without caching.
+
+    See wrap_and_join().
+    """
+    visible_sep = "".join(run_text for _, run_text in _tokenize(sep))
+
+    optimal_width = width
+
+    while True:
+        lines = _layout(text, width=optimal_width, **kwargs)
 
-        lines = safe_wrap(text, width=optimal_width, **kwargs)
+        # If any line is longer than `width` after joining, it's not
+        # good, we need to decrease the width.
         max_line_length = max(
             [
-                len(ansi_pattern.sub("", line))
-                for line in sep.join(lines).splitlines()
-            ]
+                len(line)
+                for line in visible_sep.join(
+                    [visible_line for _, visible_line in lines]
+                ).splitlines()
+            ],
+            default=0,
+        )
+
+        if max_line_length <= width:
+            return sep.join([line for line, _ in lines])
+
+        # Wrapping is greedy: any width between the longest wrapped
+        # line's and the current one produces these very same lines,
+        # which we know do not fit. So rather than decreasing the width
+        # one by one, we jump right below the longest wrapped line.
+        optimal_width = (
+            min(
+                optimal_width,
+                max([len(visible_line) for _, visible_line in lines]),
+            )
+            - 1
+        )
+
+
+def _wrap_kwargs_key(kwargs: dict) -> Optional[tuple]:
+    """Turn wrapping keyword arguments into a cache key.
+
+    Returns:
+        The sorted tuple of the (name, value) couples, or None if a
+        value is not hashable and the call cannot be cached.
+    """
+    kwargs_key = tuple(sorted(kwargs.items()))
+
+    try:
+        hash(kwargs_key)
+
+    except TypeError:
+        return None
+
+    return kwargs_key
+
+
+@functools.lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _cached_safe_wrap(
+    text: str, width: int, kwargs_key: tuple
+) -> Tuple[str, ...]:
+    """Cached _safe_wrap(), returning a tuple so that it is immutable."""
+    return tuple(_safe_wrap(text, width, **dict(kwargs_key)))
+
+
+@functools.lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _cached_wrap_and_join(
+    text: str, width: int, sep: str, kwargs_key: tuple
+) -> str:
+    """Cached _wrap_and_join()."""
+    return _wrap_and_join(text, width, sep, **dict(kwargs_key))
+
+
+def wrap_cache_info() -> dict:
+    """Return the statistics of the wrapping caches.
+
+    safe_wrap() and wrap_and_join() cache their results in bounded LRU
+    caches of WRAP_CACHE_SIZE entries, keyed on their arguments, as
+    reports wrap the same paragraphs (descriptions, explanations...)
+    at the same widths over and over.
+
+    Returns:
+        A dict like this, the values being the functools.lru_cache()
+        statistics (hits, misses, maxsize, currsize) of each cache:
+        {
+            "safe_wrap": (CacheInfo) safe_wrap_cache_info,
+            "wrap_and_join": (CacheInfo) wrap_and_join_cache_info
+        }
+    """
+    return {
+        "safe_wrap": _cached_safe_wrap.cache_info(),
+        "wrap_and_join": _cached_wrap_and_join.cache_info(),
+    }
+
+
+def clear_wrap_cache() -> None:
+    """Empty the wrapping caches and reset their statistics."""
+    _cached_safe_wrap.cache_clear()
+    _cached_wrap_and_join.cache_clear()
+
+
+def tabulate_rows(
+    rows: List[List[str]], headers: Optional[List[str]] = None
+) -> str:
+    """Format rows of strings as a table.
+
+    The table looks like the "simple" format of the tabulate module:
+    columns are separated by two spaces, and a line of dashes is drawn
+    under the headers, or above and below the table if there are no
+    headers. Cells may span multiple lines and contain ANSI codes,
+    which do not count in the columns' widths. Columns of numbers, such
+    as "42" or "3.14", are right-aligned, the others are left-aligned.
+
+    Args:
+        rows:
+          The table's rows, as lists of cells.
+        headers:
+          The columns' headers, if any.
+
+    Returns:
+        The table, ready for printing.
+    """
+    cells = [
+        [str(cell).strip().splitlines() or [""] for cell in row]
+        for row in rows
+    ]
+
+    n_columns = max([len(row) for row in cells] + [len(headers or [])])
+
+    for row in cells:
+        row += [[""]] * (n_columns - len(row))
+
+    # Like tabulate, leave some room around the headers.
+    if headers is not None:
+        widths = [_visible_width(header) + 2 for header in headers]
+    else:
+        widths = [0] * n_columns
+
+    numeric = [False] * n_columns
+
+    for column in range(n_columns):
+
+        column_lines = [line for row in cells for line in row[column]]
+
+        widths[column] = max(
+            [widths[column]] + [_visible_width(line) for line in column_lines]
+        )
+
+        column_cells = ["\n".join(row[column]) for row in cells]
+        numeric[column] = any(column_cells) and all(
+            _NUMBER_PATTERN.match(cell) for cell in column_cells if cell
         )
 
-    return sep.join(lines)
+    def format_row(row_cells: List[str]) -> str:
+        """Pad and join the cells of a single line."""
+        padded_cells = []
+
+        for column, cell in enumerate(row_cells):
+
+            padding = " " * (widths[column] - _visible_width(cell))
+
+            if numeric[column]:
+                padded_cells += [padding + cell]
+            else:
+                padded_cells += [cell + padding]
+
+        return "  ".join(padded_cells).rstrip()
+
+    dashes = "  ".join(["-" * width for width in widths])
+    table = []
+
+    if headers is not None:
+        table += [format_row(list(headers)), dashes]
+    else:
+        table += [dashes]
+
+    for row in cells:
+        for line_index in range(max(len(cell) for cell in row)):
+            table += [
+                format_row(
+                    [
+                        cell[line_index] if line_index < len(cell) else ""
+                        for cell in row
+                    ]
+                )
+            ]
+
+    if headers is None:
+        table += [dashes]
+
+    return "\n".join(table)
 
 
 def tabulate_dict(dictionary: dict, max_width: int = None) -> str:
@@ -307,7 +810,7 @@ def tabulate_dict(dictionary: dict, max_width: int = None) -> str:
         for k, v in dictionary.items()
     ]
 
-    return tabulate.tabulate(table)
+    return tabulate_rows(table)
 
 
 def _find_optimal_column_width(
@@ -341,8 +844,6 @@ def _find_optimal_column_width(
     max_rating_len = 0
     max_reference_len = 0
 
-    ansi_pattern = re.compile(r"(\033|\u001b|\x1b)\[\d+m")
-
     # In this loop we get the max width of everyone.
     for finding in findings:
 
@@ -359,7 +860,7 @@ def _find_optimal_column_width(
         # Ansi special codes do not count.
         max_rating_len = max(
             max_rating_len,
-            len(ansi_pattern.sub("", finding["rating"])),
+            _visible_width(finding["rating"]),
         )
 
         for ref in finding["references"]:
@@ -470,7 +971,7 @@ def tabulate_findings(findings: list, max_width: Optional[int] = None) -> str:
         findings_table += [[name, value, finding["rating"], explanation]]
 
     table_headers = ["Header", "Value", "Rating", "Explanation"]
-    return tabulate.tabulate(findings_table, headers=table_headers)
+    return tabulate_rows(findings_table, headers=table_headers)
 
 
 def string_to_dict(string: str, delimiter_1: str, delimiter_2: str) -> dict:
@@ -603,120 +1104,1133 @@ def parse_request_cookies(cookies: Union[str, None]) -> Union[dict, None]:
         raise
 
 
-def load_baseline(
-    baseline_path: str, no_colors: Optional[bool] = False
-) -> dict:
-    """Load and validate baseline.json.
+class MatchLimits(NamedTuple):
+    """Limits on the matching of header values, see guard_baseline().
 
-    This function loads the baseline.json, replaces special markings
-    such as [green] to their corresponding ANSI codes, and validates it
-    against baseline_schema.json.
+    Header values come from untrusted servers, and some patterns take a
+    time which grows quickly with the length of the value, such as the
+    nested quantifiers of "^(.*?,)+x$". These limits keep a single
+    hostile value from stalling a whole batch of analyses.
 
-    Args:
-        baseline_path:
-          the absolute or relative path to the baseline file.
-        no_colors:
-          If True, the special tags such as [red] will be stripped from
-          the baseline file, which essentially means that explanations
-          will not be color-coded (but references and ratings will
-          still be, as they are they are colored by headerexposer and
-          not in the baseline).
+    Attributes:
+        max_length:
+          The length, in characters, above which values are not matched
+          at all, or None.
+        match_timeout:
+          The number of seconds after which matching a value against a
+          header rule's patterns is abandoned, or None. The matching is
+          interrupted by a timer in the main thread (on Unix); in other
+          threads, it is abandoned once it returns.
+    """
 
-    Returns:
-        the baseline dict loaded from baseline.json.
+    max_length: Optional[int] = None
+    match_timeout: Optional[float] = None
+
+
+class MatchTimeout(Exception):
+    """Raised by the timer interrupting a match, see MatchLimits.
+
+    analyse_header() catches it and rates the value as invalid: it only
+    reaches the patterns' callers, such as a profiler wrapping them.
     """
-    with open(BASELINE_SCHEMA_PATH) as baseline_schema_file:
-        baseline_schema = json.loads(baseline_schema_file.read())
 
-    with open(baseline_path, "rb") as baseline_file:
-        baseline = json.loads(
-            b_special_to_ansi(baseline_file.read(), no_colors)
-        )
 
-    jsonschema.validate(baseline, baseline_schema)
+class CompiledExplanationPattern(NamedTuple):
+    """An explanation pattern of a header rule, ready for matching.
 
-    return baseline
+    Attributes:
+        pattern_index:
+          The index of the pattern in the rule's patterns.
+        present:
+          The pre-parsed "present" template, as a callable taking the
+          match object and returning the expanded explanation, or None.
+        absent:
+          The "absent" explanation, or None.
+    """
 
+    pattern_index: int
+    present: Optional[Callable[[Match], str]]
+    absent: Optional[str]
+
+
+class CompiledHeaderRule(NamedTuple):
+    """A baseline header with its patterns compiled and defaults resolved.
+
+    This is the compiled counterpart of one item of a baseline's
+    "headers" list, as produced by compile_header_rule(). Every
+    optional property of the baseline schema is resolved to its
+    default, and the explanations that always come together are
+    pre-concatenated, so that analyse_header() only has to match.
+
+    The rule's distinct patterns are stored once in "patterns", the
+    validation pattern first, and referred to by index by the rating
+    and explanation patterns. This way analyse_header() matches each
+    distinct pattern at most once per value.
+
+    Attributes:
+        name:
+          The header's name.
+        description:
+          The header's description, or None.
+        references:
+          The header's references.
+        patterns:
+          The rule's distinct compiled patterns, starting with the
+          validation pattern.
+        default_rating:
+          The rating if no rating pattern matches.
+        invalid_rating:
+          The rating if the validation pattern does not match.
+        absent_rating:
+          The rating if the header is absent.
+        absent_explanations:
+          The explanations to add if the header is absent.
+        invalid_explanations:
+          The explanations to add if the header is invalid.
+        rating_patterns:
+          The (pattern index, rating) couples, in reverse baseline
+          order since the last matching rating pattern wins.
+        explanation_patterns:
+          The compiled explanation patterns, in baseline order.
+        final_explanation:
+          The final explanation, or None.
+        limits:
+          The MatchLimits of the analyses, or None, see guard_baseline().
+    """
 
-def analyse_header(
-    header_value: Any, header_baseline: dict
-) -> Tuple[str, List[str]]:
-    """Analyses a single valid header according to the baseline.
+    name: str
+    description: Optional[str]
+    references: Tuple[str, ...]
+    patterns: Tuple[Pattern, ...]
+    default_rating: str
+    invalid_rating: str
+    absent_rating: str
+    absent_explanations: Tuple[str, ...]
+    invalid_explanations: Tuple[str, ...]
+    rating_patterns: Tuple[Tuple[int, str], ...]
+    explanation_patterns: Tuple[CompiledExplanationPattern, ...]
+    final_explanation: Optional[str]
+    limits: Optional[MatchLimits] = None
+
+
+class CompiledBaseline(NamedTuple):
+    """A validated baseline with all its header rules compiled.
+
+    Attributes:
+        headers:
+          The compiled header rules, in baseline order.
+        source:
+          The baseline dict it was compiled from, as loaded by
+          load_baseline().
+        version:
+          An identifier of the baseline's content, reported in each
+          finding, or None if unknown. load_baseline() sets it to a
+          hash of the baseline file.
+    """
+
+    headers: Tuple[CompiledHeaderRule, ...]
+    source: dict
+    version: Optional[str] = None
+
+
+def _expand_template(parts: Tuple[Union[str, int], ...], match: Match) -> str:
+    """Expand a pre-parsed substitution template with a match object.
 
     Args:
-        header_value:
-          (string) The header's value
-        header_baseline:
-          The header's baseline as loaded by load_baseline()
+        parts:
+          The template parts as returned by _parse_template(): literal
+          strings and group numbers.
+        match:
+          The match object whose groups will be substituted.
 
     Returns:
-        ((str) rating, List[str] explanations) The header's rating and
-        the list of explanations to print.
+        The expanded string. Unmatched groups are replaced with an
+        empty string, as re.sub() does.
     """
-    explanations = []
+    return "".join(
+        [
+            part if isinstance(part, str) else match.group(part) or ""
+            for part in parts
+        ]
+    )
 
-    if header_baseline.get("case_sensitive_patterns", False):
-        re_compile = functools.partial(re.compile)
-    else:
-        re_compile = functools.partial(re.compile, flags=re.IGNORECASE)
 
-    # First we validate the header. If it does not match the validation
-    # pattern, we ~~yell at the user's face~~stop the analysis and
-    # apply the corresponding rating and explanation.
-    # If it does, we can keep analysing it.
-    v_pattern = re_compile(header_baseline["validation_pattern"])
+def _constant_template(template: str, match: Match) -> str:
+    """Expand a template without any escape, i.e. return it as is."""
+    del match
+    return template
 
-    if not v_pattern.match(header_value):
 
-        if header_baseline.get("invalid_explanation") is not None:
-            explanations += [header_baseline["invalid_explanation"]]
+def _expand_match(template: str, match: Match) -> str:
+    """Expand a template with the re module, see _parse_template()."""
+    return match.expand(template)
 
-        if header_baseline.get("absent_or_invalid_explanation") is not None:
-            explanations += [header_baseline["absent_or_invalid_explanation"]]
 
-        rating = header_baseline.get("invalid_rating", "bad")
+def _parse_template(template: str, pattern: Pattern) -> Callable[[Match], str]:
+    r"""Pre-parse a re.sub() substitution template.
 
-    else:
-        rating = header_baseline.get("default_rating", "bad")
+    Group references such as \1 or \g<name> are resolved once, so that
+    expanding the template for a match is only a matter of joining
+    strings. Templates using other escapes (\n, octal escapes...) are
+    left to the re module.
+
+    Args:
+        template:
+          The substitution template, such as a "present" explanation.
+        pattern:
+          The compiled pattern the template will be expanded against.
+
+    Returns:
+        A callable taking a match object of pattern and returning the
+        expanded template, usable as a re.sub() replacement.
+
+    Raises:
+        re.error if the template references an invalid group.
+    """
+    if "\\" not in template:
+        return functools.partial(_constant_template, template)
 
-        for r_pattern in header_baseline.get("rating_patterns", []):
+    parts: List[Union[str, int]] = []
+    position = 0
 
-            pattern = re_compile(r_pattern["pattern"])
+    for escape in _TEMPLATE_ESCAPE_PATTERN.finditer(template):
+        group = escape.group(1) or escape.group(2)
 
-            if pattern.match(header_value):
-                rating = r_pattern["rating"]
+        if group is None:
+            return functools.partial(_expand_match, template)
 
-        for e_pattern in header_baseline.get("explanation_patterns", []):
+        if group.isdigit():
+            index = int(group)
+        elif group in pattern.groupindex:
+            index = pattern.groupindex[group]
+        else:
+            raise re.error(f"unknown group name {group!r} in template")
 
-            pattern = re_compile(e_pattern["pattern"])
+        if index > pattern.groups:
+            raise re.error(f"invalid group reference {index} in template")
 
-            if pattern.match(header_value):
-                if e_pattern.get("present") is not None:
-                    exp = pattern.sub(e_pattern["present"], header_value)
-                    explanations += [exp]
+        parts += [template[position : escape.start()], index]
+        position = escape.end()
 
-            elif e_pattern.get("absent") is not None:
-                explanations += [e_pattern["absent"]]
+    parts += [template[position:]]
 
-    return rating, explanations
+    return functools.partial(
+        _expand_template, tuple(part for part in parts if part != "")
+    )
 
 
-def analyse_headers(
-    headers: dict, baseline: dict, short: bool = False
-) -> list:
-    """Analyse response headers according to baseline.
+def _substitute(
+    pattern: Pattern, repl: Callable[[Match], str], match: Match, string: str
+) -> str:
+    """Compute pattern.sub(repl, string), knowing pattern.match(string).
 
-    This function compares headers' values to the baseline headers to
-    produce a security analysis. Basically, it parses the baseline for
-    regex patterns to identify in the headers' values, and returns the
-    ratings and explanations associated in the baseline.
+    The first substitution made by re.sub() is the match found by
+    pattern.match(), so it is reused. As baseline patterns match the
+    entire value, there usually is nothing left to substitute, which
+    is verified by a single search starting at the end of the match.
 
     Args:
-        headers:
-          The headers to analyse.
-        baseline:
+        pattern:
+          The compiled pattern.
+        repl:
+          The replacement callable, see _parse_template().
+        match:
+          The result of pattern.match(string).
+        string:
+          The string to substitute.
+
+    Returns:
+        The same string as pattern.sub(repl, string).
+    """
+    if match.end() > 0 and pattern.search(string, match.end()) is None:
+        return repl(match) + string[match.end() :]
+
+    return pattern.sub(repl, string)
+
+
+def compile_header_rule(header_baseline: dict) -> CompiledHeaderRule:
+    """Compile a single header of a baseline.
+
+    Args:
+        header_baseline:
+          The header's baseline, as found in the "headers" list of a
+          baseline loaded by load_baseline().
+
+    Returns:
+        The corresponding CompiledHeaderRule.
+
+    Raises:
+        re.error if a pattern or a "present" template is invalid.
+    """
+    if header_baseline.get("case_sensitive_patterns", False):
+        flags = 0
+    else:
+        flags = re.IGNORECASE
+
+    patterns: List[Pattern] = []
+    pattern_indexes: dict = {}
+
+    def pattern_index(source: str) -> int:
+        """Compile a pattern if it was not already, return its index."""
+        if source not in pattern_indexes:
+            pattern_indexes[source] = len(patterns)
+            patterns.append(re.compile(source, flags))
+
+        return pattern_indexes[source]
+
+    pattern_index(header_baseline["validation_pattern"])
+
+    rating_patterns = [
+        (pattern_index(r_pattern["pattern"]), r_pattern["rating"])
+        for r_pattern in header_baseline.get("rating_patterns", [])
+    ]
+
+    explanation_patterns = []
+
+    for e_pattern in header_baseline.get("explanation_patterns", []):
+
+        index = pattern_index(e_pattern["pattern"])
+
+        if e_pattern.get("present") is not None:
+            present = _parse_template(e_pattern["present"], patterns[index])
+        else:
+            present = None
+
+        explanation_patterns += [
+            CompiledExplanationPattern(index, present, e_pattern.get("absent"))
+        ]
+
+    absent_explanations = [
+        header_baseline[key]
+        for key in ["absent_explanation", "absent_or_invalid_explanation"]
+        if header_baseline.get(key) is not None
+    ]
+
+    invalid_explanations = [
+        header_baseline[key]
+        for key in ["invalid_explanation", "absent_or_invalid_explanation"]
+        if header_baseline.get(key) is not None
+    ]
+
+    return CompiledHeaderRule(
+        name=header_baseline["name"],
+        description=header_baseline.get("description"),
+        references=tuple(header_baseline.get("references", [])),
+        patterns=tuple(patterns),
+        default_rating=header_baseline.get("default_rating", "bad"),
+        invalid_rating=header_baseline.get("invalid_rating", "bad"),
+        absent_rating=header_baseline.get("absent_rating", "bad"),
+        absent_explanations=tuple(absent_explanations),
+        invalid_explanations=tuple(invalid_explanations),
+        rating_patterns=tuple(reversed(rating_patterns)),
+        explanation_patterns=tuple(explanation_patterns),
+        final_explanation=header_baseline.get("final_explanation"),
+    )
+
+
+def compile_baseline(
+    baseline: dict, version: Optional[str] = None
+) -> CompiledBaseline:
+    """Compile a baseline for repeated analyses.
+
+    Compiling a baseline once and passing the result to
+    analyse_headers() saves the cost of compiling every pattern of
+    every header on each analysis.
+
+    Args:
+        baseline:
+          The baseline dict, as loaded by load_baseline().
+        version:
+          The baseline's version, see CompiledBaseline.
+
+    Returns:
+        The corresponding CompiledBaseline.
+
+    Raises:
+        re.error if a pattern or a "present" template is invalid.
+    """
+    return CompiledBaseline(
+        headers=tuple(
+            compile_header_rule(header) for header in baseline["headers"]
+        ),
+        source=baseline,
+        version=version,
+    )
+
+
+def guard_baseline(
+    baseline: CompiledBaseline, limits: MatchLimits
+) -> CompiledBaseline:
+    """Limit the matching of header values against a baseline.
+
+    analyse_header() does not match the values longer than
+    limits.max_length, and abandons the matches lasting longer than
+    limits.match_timeout. Such values get the header's invalid rating
+    and explanations, followed by an explanation of the limit reached.
+    The time limit makes the findings depend on the machine's load, so
+    it is meant as a last resort, and the length limit as the usual
+    protection.
+
+    Args:
+        baseline:
+          The compiled baseline.
+        limits:
+          The limits to apply to its analyses.
+
+    Returns:
+        A copy of baseline whose header rules have these limits.
+    """
+    return baseline._replace(
+        headers=tuple(
+            header._replace(limits=limits) for header in baseline.headers
+        )
+    )
+
+
+def baseline_version(raw_baseline: bytes) -> str:
+    """Return the version of a baseline, a short hash of its content.
+
+    Args:
+        raw_baseline:
+          The content of the baseline file.
+
+    Returns:
+        The first 16 hexadecimal digits of the content's sha256.
+    """
+    import hashlib  # pylint: disable=C0415
+
+    return hashlib.sha256(raw_baseline).hexdigest()[:16]
+
+
+def default_cache_dir() -> str:
+    """Return the directory where headerexposer caches its data.
+
+    This is $XDG_CACHE_HOME/headerexposer (~/.cache/headerexposer if
+    XDG_CACHE_HOME is not set), or %LOCALAPPDATA%\\headerexposer on
+    Windows. The directory is not created by this function.
+    """
+    if os.name == "nt" and "LOCALAPPDATA" in os.environ:
+        return os.path.join(os.environ["LOCALAPPDATA"], "headerexposer")
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+
+    return os.path.join(cache_home, "headerexposer")
+
+
+def _baseline_cache_path(
+    cache_dir: str, baseline: bytes, baseline_schema: bytes, no_colors: bool
+) -> str:
+    """Return the path to the cache file of a baseline, see load_baseline().
+
+    The file name is a hash of everything the compiled baseline depends
+    on, so that changing the baseline or its schema invalidates it.
+    """
+    import hashlib  # pylint: disable=C0415
+
+    key = hashlib.sha256()
+
+    for part in [
+        str(_BASELINE_CACHE_VERSION).encode(),
+        b"no_colors" if no_colors else b"colors",
+        hashlib.sha256(baseline).digest(),
+        hashlib.sha256(baseline_schema).digest(),
+    ]:
+        key.update(len(part).to_bytes(8, "big") + part)
+
+    return os.path.join(cache_dir, f"baseline-{key.hexdigest()}.pickle")
+
+
+def _read_baseline_cache(cache_path: str) -> Optional[CompiledBaseline]:
+    """Read a cached compiled baseline, or None if it is unusable."""
+    import pickle  # pylint: disable=C0415
+
+    try:
+        with open(cache_path, "rb") as cache_file:
+            compiled_baseline = pickle.load(cache_file)
+
+    # Missing, truncated or incompatible cache files are simply ignored.
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+    if not isinstance(compiled_baseline, CompiledBaseline):
+        return None
+
+    return compiled_baseline
+
+
+def _write_baseline_cache(
+    cache_path: str, compiled_baseline: CompiledBaseline
+) -> None:
+    """Cache a compiled baseline, ignoring any error.
+
+    The file is written under a temporary name and then renamed, so
+    that concurrent runs never read a partially written file.
+    """
+    import pickle  # pylint: disable=C0415
+    import tempfile  # pylint: disable=C0415
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        cache_file = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(cache_path), suffix=".tmp", delete=False
+        )
+
+    except OSError:
+        return
+
+    try:
+        with cache_file:
+            pickle.dump(compiled_baseline, cache_file, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(cache_file.name, cache_path)
+
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.unlink(cache_file.name)
+
+
+def load_baseline(
+    baseline_path: str,
+    no_colors: Optional[bool] = False,
+    compiled: bool = False,
+    cache_dir: Optional[str] = None,
+) -> Union[dict, CompiledBaseline]:
+    """Load and validate baseline.json.
+
+    This function loads the baseline.json, replaces special markings
+    such as [green] to their corresponding ANSI codes, and validates it
+    against baseline_schema.json.
+
+    If cache_dir is set, the validated and compiled baseline is cached
+    in that directory, and later loads of the same baseline skip the
+    parsing, the validation and the compilation. Cache files are named
+    after a hash of the baseline, the schema and no_colors, so they are
+    invalidated as soon as any of them changes.
+
+    Args:
+        baseline_path:
+          the absolute or relative path to the baseline file.
+        no_colors:
+          If True, the special tags such as [red] will be stripped from
+          the baseline file, which essentially means that explanations
+          will not be color-coded (but references and ratings will
+          still be, as they are they are colored by headerexposer and
+          not in the baseline).
+        compiled:
+          If True, the baseline is returned compiled (see
+          compile_baseline()), ready for repeated analyses.
+        cache_dir:
+          The directory of the baseline cache, such as
+          default_cache_dir(), or None to disable the cache.
+
+    Returns:
+        the baseline dict loaded from baseline.json, or the
+        corresponding CompiledBaseline if compiled is True.
+    """
+    with open(_package_file("baseline_schema.json"), "rb") as schema_file:
+        raw_baseline_schema = schema_file.read()
+
+    with open(baseline_path, "rb") as baseline_file:
+        raw_baseline = baseline_file.read()
+
+    cache_path = None
+
+    if cache_dir is not None:
+        cache_path = _baseline_cache_path(
+            cache_dir, raw_baseline, raw_baseline_schema, bool(no_colors)
+        )
+        compiled_baseline = _read_baseline_cache(cache_path)
+
+        if compiled_baseline is not None:
+            return compiled_baseline if compiled else compiled_baseline.source
+
+    # jsonschema is slow to import, and only needed here.
+    import jsonschema  # type: ignore  # pylint: disable=C0415
+
+    baseline_schema = json.loads(raw_baseline_schema)
+    baseline = json.loads(b_special_to_ansi(raw_baseline, no_colors))
+
+    jsonschema.validate(baseline, baseline_schema)
+
+    if cache_path is not None:
+        compiled_baseline = compile_baseline(
+            baseline, baseline_version(raw_baseline)
+        )
+        _write_baseline_cache(cache_path, compiled_baseline)
+
+        return compiled_baseline if compiled else baseline
+
+    if compiled:
+        return compile_baseline(baseline, baseline_version(raw_baseline))
+
+    return baseline
+
+
+class Headers(dict):
+    """Response headers, looked up case-insensitively.
+
+    This is a plain dict of the headers, as originally named, so that
+    it is serialized as such. Its get(), [] and in operators ignore the
+    names' case, as analyse_headers() expects, like requests' headers.
+    It is much cheaper to build than requests' CaseInsensitiveDict.
+    """
+
+    def __init__(self, headers: Iterable[Tuple[str, str]]):
+        """Build the headers, joining repeated headers' values with ", ".
+
+        Args:
+            headers:
+              The (name, value) pairs of the headers.
+        """
+        super().__init__()
+
+        # The names and values of the headers, by lowercase name.
+        self._names: dict = {}
+        self._values: dict = {}
+
+        for name, value in headers:
+            lowercase_name = name.lower()
+
+            if lowercase_name in self._names:
+                name = self._names[lowercase_name]
+                value = f"{self._values[lowercase_name]}, {value}"
+            else:
+                self._names[lowercase_name] = name
+
+            self._values[lowercase_name] = value
+            dict.__setitem__(self, name, value)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self._values.get(name.lower(), default)
+
+    def __getitem__(self, name: str) -> str:
+        return self._values[name.lower()]
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.lower() in self._values
+
+
+class CacheInfo(NamedTuple):
+    """The statistics of a bounded cache, like functools.lru_cache's.
+
+    Attributes:
+        hits:
+          The number of lookups which found their entry.
+        misses:
+          The number of lookups which did not.
+        maxsize:
+          The maximum number of entries.
+        currsize:
+          The current number of entries.
+    """
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        """The proportion of the lookups which were hits, or 0.0."""
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+
+class _LruCache:
+    """A bounded, thread-safe mapping dropping its least recently used entry.
+
+    functools.lru_cache() cannot be used where the key is computed from
+    arguments which are not hashable themselves, such as header dicts.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Return the entry of key, counting a hit or a miss."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        """Store an entry, evicting the least recently used if full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        """Return the cache's statistics."""
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._entries)
+            )
+
+    def clear(self) -> None:
+        """Drop all the entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# The findings of analyse_headers(), see _findings_cache_key().
+_FINDINGS_CACHE = _LruCache(FINDINGS_CACHE_SIZE)
+
+
+def findings_cache_info() -> CacheInfo:
+    """Return the statistics of analyse_headers()' findings cache.
+
+    Many responses carry byte-identical security headers, e.g. the
+    websites served by the same CDN or ingress. analyse_headers()
+    therefore caches the findings of the FINDINGS_CACHE_SIZE most
+    recently analysed header sets, so that a repeated set is analysed
+    without matching a single pattern. Only the analyses made with a
+    CompiledBaseline are cached.
+
+    Returns:
+        The cache's CacheInfo (hits, misses, maxsize, currsize, and
+        hit_rate).
+    """
+    return _FINDINGS_CACHE.info()
+
+
+def clear_findings_cache() -> None:
+    """Empty the findings cache and reset its statistics."""
+    _FINDINGS_CACHE.clear()
+
+
+# The analyses of analyse_header(), keyed by (id(rule), value). As in
+# the findings cache, each entry holds its rule so that the id cannot
+# be reused by another rule while the entry exists.
+_VALUE_CACHE = _LruCache(VALUE_CACHE_SIZE)
+
+# The analyses of analyse_header() which timed out, keyed as in the
+# value cache, with the monotonic time at which they expire.
+_TIMEOUT_CACHE = _LruCache(TIMEOUT_CACHE_SIZE)
+
+
+def value_cache_info() -> CacheInfo:
+    """Return the statistics of analyse_header()'s value cache.
+
+    Even when whole header sets differ, each header's values repeat
+    heavily ("nosniff", "DENY"...). analyse_header() therefore caches
+    the rating and explanations of the VALUE_CACHE_SIZE most recently
+    analysed (header rule, value) couples, so that a known value is not
+    matched again. The case sensitivity of the patterns is part of the
+    rule. Only the analyses made with a CompiledHeaderRule are cached,
+    and not those of the baselines analyse_headers() and
+    iter_findings() compile on the fly.
+
+    Returns:
+        The cache's CacheInfo (hits, misses, maxsize, currsize, and
+        hit_rate).
+    """
+    return _VALUE_CACHE.info()
+
+
+def clear_value_cache() -> None:
+    """Empty the value cache and reset its statistics."""
+    _VALUE_CACHE.clear()
+    _TIMEOUT_CACHE.clear()
+
+
+def analyse_header(
+    header_value: Any,
+    header_baseline: Union[dict, CompiledHeaderRule],
+    cached: bool = True,
+) -> Tuple[str, List[str]]:
+    """Analyses a single valid header according to the baseline.
+
+    With a CompiledHeaderRule, the analyses of recently seen values are
+    cached and returned without any matching, see value_cache_info(),
+    and the rule's MatchLimits apply, see guard_baseline(). The analyses
+    abandoned after the match timeout are not cached, but remembered for
+    TIMEOUT_CACHE_SECONDS.
+
+    Args:
+        header_value:
+          (string) The header's value
+        header_baseline:
+          The header's baseline as loaded by load_baseline(), or the
+          corresponding CompiledHeaderRule.
+        cached:
+          If False, the value cache is neither used nor filled, e.g.
+          for a rule which is not going to be used again.
+
+    Returns:
+        ((str) rating, List[str] explanations) The header's rating and
+        the list of explanations to print.
+    """
+    return _analyse_header_value(header_value, header_baseline, cached)[:2]
+
+
+def _analyse_header_value(
+    header_value: Any,
+    header_baseline: Union[dict, CompiledHeaderRule],
+    cached: bool,
+) -> Tuple[str, List[str], bool]:
+    """Analyse a single valid header, see analyse_header().
+
+    Returns:
+        (rating, explanations, whether the analysis timed out)
+    """
+    if not isinstance(header_baseline, CompiledHeaderRule):
+        return (
+            *_analyse_header(
+                header_value, compile_header_rule(header_baseline)
+            ),
+            False,
+        )
+
+    if not isinstance(header_value, str):
+        return (*_analyse_header(header_value, header_baseline), False)
+
+    if not cached:
+        return _limited_analyse_header(header_value, header_baseline)
+
+    limits = header_baseline.limits
+
+    # Values too long to be matched are not cached, so that the cache
+    # does not hold on to them.
+    if (
+        limits is not None
+        and limits.max_length is not None
+        and len(header_value) > limits.max_length
+    ):
+        return _limited_analyse_header(header_value, header_baseline)
+
+    key = (id(header_baseline), header_value)
+    cached_analysis = _VALUE_CACHE.get(key)
+
+    if cached_analysis is not None:
+        return cached_analysis[1], list(cached_analysis[2]), False
+
+    import time  # pylint: disable=C0415
+
+    # A timed out analysis may complete once the process is less busy,
+    # so it is only remembered for a while, and apart from the value
+    # cache: meanwhile, a hostile value repeated across a batch only
+    # costs the timeout once.
+    timed_out_analysis = _TIMEOUT_CACHE.get(key)
+
+    if timed_out_analysis is not None and (
+        time.monotonic() < timed_out_analysis[3]
+    ):
+        return timed_out_analysis[1], list(timed_out_analysis[2]), True
+
+    rating, explanations, timed_out = _limited_analyse_header(
+        header_value, header_baseline
+    )
+
+    if timed_out:
+        _TIMEOUT_CACHE.put(
+            key,
+            (
+                header_baseline,
+                rating,
+                tuple(explanations),
+                time.monotonic() + TIMEOUT_CACHE_SECONDS,
+            ),
+        )
+    else:
+        _VALUE_CACHE.put(key, (header_baseline, rating, tuple(explanations)))
+
+    return rating, explanations, timed_out
+
+
+def _limited_analyse_header(
+    header_value: str, header_baseline: CompiledHeaderRule
+) -> Tuple[str, List[str], bool]:
+    """Analyse a single valid header within the rule's MatchLimits.
+
+    This does not use the value cache, see analyse_header().
+
+    Returns:
+        (rating, explanations, whether the analysis timed out)
+    """
+    limits = header_baseline.limits
+
+    if limits is None:
+        return (*_analyse_header(header_value, header_baseline), False)
+
+    if limits.max_length is not None and len(header_value) > limits.max_length:
+        return (
+            *_unmatched_header(
+                header_baseline,
+                "The value was not analysed, as it is longer than"
+                f" {limits.max_length} characters.",
+            ),
+            False,
+        )
+
+    if limits.match_timeout is None:
+        return (*_analyse_header(header_value, header_baseline), False)
+
+    return _analyse_header_within(
+        header_value, header_baseline, limits.match_timeout
+    )
+
+
+def _unmatched_header(
+    header_baseline: CompiledHeaderRule, explanation: str
+) -> Tuple[str, List[str]]:
+    """Rate a value which was not matched, because of the MatchLimits."""
+    return (
+        header_baseline.invalid_rating,
+        list(header_baseline.invalid_explanations) + [explanation],
+    )
+
+
+def _raise_match_timeout(signum: int, frame: Any) -> None:
+    """Interrupt a match, see _analyse_header_within()."""
+    del signum, frame
+    raise MatchTimeout()
+
+
+def _analyse_header_within(
+    header_value: str, header_baseline: CompiledHeaderRule, timeout: float
+) -> Tuple[str, List[str], bool]:
+    """Analyse a single valid header, abandoning it after timeout seconds.
+
+    The re module checks for signals while matching, so in the main
+    thread, the matching is interrupted by a timer. The timer is only
+    used if no other one is pending, which it would override. Elsewhere,
+    signals are not delivered, so the analysis is only abandoned once it
+    returns.
+
+    Returns:
+        (rating, explanations, whether the analysis timed out)
+    """
+    import signal  # pylint: disable=C0415
+    import time  # pylint: disable=C0415
+
+    explanation = (
+        "The value was not analysed, as matching it took longer than"
+        f" {timeout:g} seconds."
+    )
+
+    if (
+        not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+        or signal.getitimer(signal.ITIMER_REAL) != (0.0, 0.0)
+    ):
+        start = time.perf_counter()
+        rating, explanations = _analyse_header(header_value, header_baseline)
+
+        if time.perf_counter() - start > timeout:
+            return (*_unmatched_header(header_baseline, explanation), True)
+
+        return rating, explanations, False
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_match_timeout)
+
+    try:
+        try:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            return (*_analyse_header(header_value, header_baseline), False)
+
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    # The timer may also fire right after the analysis, which is then
+    # abandoned as well.
+    except MatchTimeout:
+        return (*_unmatched_header(header_baseline, explanation), True)
+
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _analyse_header(
+    header_value: Any, header_baseline: CompiledHeaderRule
+) -> Tuple[str, List[str]]:
+    """Analyse a single valid header, without caching, see above."""
+    # First we validate the header. If it does not match the validation
+    # pattern, we ~~yell at the user's face~~stop the analysis and
+    # apply the corresponding rating and explanation.
+    # If it does, we can keep analysing it.
+    patterns = header_baseline.patterns
+    matches: List[Any] = [_UNMATCHED] * len(patterns)
+    matches[0] = patterns[0].match(header_value)
+
+    if matches[0] is None:
+        return (
+            header_baseline.invalid_rating,
+            list(header_baseline.invalid_explanations),
+        )
+
+    explanations = []
+
+    rating = header_baseline.default_rating
+
+    # The rating is the one of the last matching rating pattern, and
+    # the rating patterns are stored in reverse, so the first match
+    # wins and we can stop there.
+    for index, r_rating in header_baseline.rating_patterns:
+
+        if matches[index] is _UNMATCHED:
+            matches[index] = patterns[index].match(header_value)
+
+        if matches[index] is not None:
+            rating = r_rating
+            break
+
+    for e_pattern in header_baseline.explanation_patterns:
+
+        index = e_pattern.pattern_index
+
+        if matches[index] is _UNMATCHED:
+            matches[index] = patterns[index].match(header_value)
+
+        if matches[index] is not None:
+            if e_pattern.present is not None:
+                explanations += [
+                    _substitute(
+                        patterns[index],
+                        e_pattern.present,
+                        matches[index],
+                        header_value,
+                    )
+                ]
+
+        elif e_pattern.absent is not None:
+            explanations += [e_pattern.absent]
+
+    return rating, explanations
+
+
+def iter_findings(
+    headers: dict,
+    baseline: Union[dict, CompiledBaseline],
+    short: bool = False,
+) -> Iterator[dict]:
+    """Analyse response headers according to baseline, lazily.
+
+    This is the generator version of analyse_headers(): the findings
+    are yielded one by one, in baseline order, as they are produced.
+
+    Args:
+        headers:
+          The headers to analyse.
+        baseline:
+          The baseline to compare the headers' values against. It
+          should be loaded from load_baseline(), and preferably
+          compiled if many analyses are to be made.
+        short:
+          If True, the headers' descriptions and references as
+          contained in the baseline will not be added to the
+          explanations.
+
+    Returns:
+        An iterator over the findings, see analyse_headers().
+    """
+    # A baseline compiled here is only used once, so caching its values
+    # would only evict the entries of the other baselines.
+    cached = isinstance(baseline, CompiledBaseline)
+
+    if not cached:
+        baseline = compile_baseline(baseline)
+
+    return _iter_findings(
+        [headers.get(b_header.name) for b_header in baseline.headers],
+        baseline,
+        short,
+        cached,
+    )
+
+
+def _iter_findings(
+    header_values: List[Any],
+    baseline: CompiledBaseline,
+    short: bool,
+    cached: bool = True,
+    timeouts: Optional[List[str]] = None,
+) -> Iterator[dict]:
+    """Yield the findings of the values of the baseline's headers.
+
+    See iter_findings(), header_values being the value of each header
+    of the baseline, in baseline order, or None for the absent headers,
+    and cached telling whether to use the value cache. The names of the
+    headers whose analysis timed out are appended to timeouts.
+    """
+    for b_header, header_value in zip(baseline.headers, header_values):
+
+        header_name = b_header.name
+        explanations = []
+
+        if not short and b_header.description is not None:
+            explanations += [b_header.description]
+
+        if header_value is None:
+            explanations += b_header.absent_explanations
+            rating = b_header.absent_rating
+
+        else:
+            rating, h_explanations, timed_out = _analyse_header_value(
+                header_value, b_header, cached
+            )
+
+            if timed_out and timeouts is not None:
+                timeouts += [header_name]
+
+            explanations += h_explanations
+
+        if b_header.final_explanation is not None:
+            explanations += [b_header.final_explanation]
+
+        yield {
+            "header": header_name,
+            "value": header_value,
+            "rating": _NICE_RATINGS[rating],
+            "explanations": explanations,
+            "references": list(b_header.references) if not short else [],
+            "baseline_version": baseline.version,
+        }
+
+
+def analyse_headers(
+    headers: dict,
+    baseline: Union[dict, CompiledBaseline],
+    short: bool = False,
+) -> list:
+    """Analyse response headers according to baseline.
+
+    This function compares headers' values to the baseline headers to
+    produce a security analysis. Basically, it parses the baseline for
+    regex patterns to identify in the headers' values, and returns the
+    ratings and explanations associated in the baseline.
+
+    With a CompiledBaseline, the findings of recently analysed header
+    sets are cached and returned (as copies) without any matching, see
+    findings_cache_info(), unless an analysis timed out.
+
+    Args:
+        headers:
+          The headers to analyse.
+        baseline:
           The baseline to compare the headers' values against. It
-          should be loaded from load_baseline().
+          should be loaded from load_baseline(), and preferably
+          compiled if many analyses are to be made.
         short:
           If True, the headers' descriptions and references as
           contained in the baseline will not be added to the
@@ -729,53 +2243,347 @@ def analyse_headers(
             "value": (string) header_value,
             "rating": (string) rating,
             "explanations": (List[string]) explanations,
-            "references": (List[string]) references
+            "references": (List[string]) references,
+            "baseline_version": (string) version of the baseline, see
+                                CompiledBaseline, or None
         }
     """
-    nice_ratings = {
-        "good": special_to_ansi("[green][G O O D][normal]"),
-        "medium": special_to_ansi("[yellow][M E D][normal]"),
-        "bad": special_to_ansi("[red][B A D][normal]"),
+    if not isinstance(baseline, CompiledBaseline):
+        return list(iter_findings(headers, baseline, short))
+
+    header_values = [
+        headers.get(b_header.name) for b_header in baseline.headers
+    ]
+    key = _findings_cache_key(header_values, baseline, short)
+
+    if key is None:
+        return list(_iter_findings(header_values, baseline, short))
+
+    cached = _FINDINGS_CACHE.get(key)
+
+    if cached is None:
+        timeouts: List[str] = []
+        findings = list(
+            _iter_findings(header_values, baseline, short, timeouts=timeouts)
+        )
+
+        # As in the value cache, timed out analyses are not cached.
+        if not timeouts:
+            _FINDINGS_CACHE.put(
+                key, (baseline.headers, _copy_findings(findings))
+            )
+
+        return findings
+
+    return _copy_findings(cached[1])
+
+
+def _findings_cache_key(
+    header_values: List[Any], baseline: CompiledBaseline, short: bool
+) -> Optional[tuple]:
+    """Return the findings cache key of an analysis.
+
+    Only the values of the baseline's headers are part of the key, so
+    that the other headers (dates, cookies, request ids...) do not
+    prevent identical security headers from sharing their findings.
+
+    The baseline is identified by its compiled rules: its version alone
+    does not tell the color mode the explanations were loaded with.
+    Each cache entry holds the rules it was computed with, so that
+    their id cannot be reused by another baseline while the entry
+    exists.
+
+    Returns:
+        The key, or None if a value is not hashable and the analysis
+        cannot be cached.
+    """
+    key = (id(baseline.headers), short, tuple(header_values))
+
+    try:
+        hash(key)
+
+    except TypeError:
+        return None
+
+    return key
+
+
+def _copy_findings(findings: List[dict]) -> List[dict]:
+    """Copy findings, so that neither the cache nor its users share them."""
+    return [
+        dict(
+            finding,
+            explanations=list(finding["explanations"]),
+            references=list(finding["references"]),
+        )
+        for finding in findings
+    ]
+
+
+def _json_default(obj: Any) -> Any:
+    """Serialize the objects json does not know, such as header dicts."""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+
+    if isinstance(obj, Iterable):
+        return list(obj)
+
+    raise TypeError(
+        f"Object of type {type(obj).__name__} is not JSON serializable"
+    )
+
+
+def _strip_ansi(text: str) -> str:
+    """Remove the ANSI codes from a string, if there are any."""
+    if "\033" not in text:
+        return text
+
+    return _ANSI_PATTERN.sub("", text)
+
+
+def plain_rating(rating: str) -> str:
+    """Convert a finding's rating to its key.
+
+    Args:
+        rating:
+          The rating as printed in a finding, such as "[G O O D]".
+
+    Returns:
+        The rating's key, "good", "medium" or "bad", or rating itself
+        if it is not a printed rating.
+    """
+    return _PLAIN_RATINGS.get(rating, rating)
+
+
+def plain_finding(finding: dict) -> dict:
+    """Convert a finding to a plain, machine-readable finding.
+
+    The ANSI-colored rating, such as "[G O O D]", is replaced by its
+    key ("good", "medium" or "bad") and ANSI codes are stripped from
+    the explanations. No wrapping is applied.
+
+    Args:
+        finding:
+          A finding as returned by analyse_headers().
+
+    Returns:
+        The plain finding, a dict like this:
+        {
+            "header": (string) header_name,
+            "value": (string) header_value or None,
+            "rating": (string) "good", "medium" or "bad",
+            "explanations": (List[string]) explanations,
+            "references": (List[string]) references,
+            "baseline_version": (string) baseline_version or None
+        }
+    """
+    return {
+        "header": finding["header"],
+        "value": finding["value"],
+        "rating": plain_rating(finding["rating"]),
+        "explanations": [_strip_ansi(e) for e in finding["explanations"]],
+        "references": finding["references"],
+        "baseline_version": finding.get("baseline_version"),
     }
 
-    findings = []
 
-    for b_header in baseline["headers"]:
+def _plain_record(record: dict) -> dict:
+    """Return a copy of a record with plain findings."""
+    record = dict(record)
+    record["findings"] = [plain_finding(f) for f in record["findings"]]
 
-        header_name = b_header["name"]
-        header_value = headers.get(header_name)
-        explanations = []
+    if "redirects" in record:
+        record["redirects"] = [_plain_record(r) for r in record["redirects"]]
 
-        if not short and b_header.get("description") is not None:
-            explanations += [b_header["description"]]
+    return record
 
-        if header_value is None:
 
-            if b_header.get("absent_explanation") is not None:
-                explanations += [b_header["absent_explanation"]]
+def _located_findings(record: dict) -> Iterator[Tuple[Any, dict]]:
+    """Yield the (url, plain finding) couples of a record.
 
-            if b_header.get("absent_or_invalid_explanation") is not None:
-                explanations += [b_header["absent_or_invalid_explanation"]]
+    The findings of the record's redirects, if any, come first, each
+    located at the url which redirected. The record's own findings are
+    located at its "final_url" if it has one, else at its "url".
+    """
+    for redirect in record.get("redirects", ()):
+        for finding in redirect["findings"]:
+            yield redirect.get("url"), plain_finding(finding)
 
-            rating = b_header.get("absent_rating", "bad")
+    url = record.get("final_url", record.get("url"))
 
-        else:
-            rating, h_explanations = analyse_header(header_value, b_header)
-            explanations += h_explanations
+    for finding in record["findings"]:
+        yield url, plain_finding(finding)
+
+
+def write_jsonl(record: dict, output: TextIO, flush: bool = True) -> None:
+    """Write a record as a single JSON line, and flush it.
+
+    This is meant for streaming results, e.g. one record per scanned
+    url holding its findings: each record is written, and reaches the
+    underlying file (compressed or not), as soon as it is ready.
+
+    Args:
+        record:
+          The record to write, holding a "findings" list as returned
+          by analyse_headers(), and possibly "redirects" holding their
+          own. The findings are written as plain findings, see
+          plain_finding(). Mappings such as requests'
+          headers are serialized as JSON objects.
+        output:
+          The text stream to write to, e.g. sys.stdout or a stream
+          opened with gzip.open(path, "wt").
+        flush:
+          If False, the record is left in the stream's buffer, which
+          is much faster when writing many small records at once.
+    """
+    output.write(
+        json.dumps(
+            _plain_record(record), default=_json_default, ensure_ascii=False
+        )
+        + "\n"
+    )
+
+    if flush:
+        output.flush()
+
+
+def write_json(records: Iterable[dict], output: TextIO) -> None:
+    """Write records as a JSON array.
 
-        if b_header.get("final_explanation") is not None:
-            explanations += [b_header["final_explanation"]]
-
-        findings += [
-            {
-                "header": header_name,
-                "value": header_value,
-                "rating": nice_ratings[rating],
-                "explanations": explanations,
-                "references": b_header.get("references", [])
-                if not short
-                else [],
+    The array is written element by element, so that records can be
+    produced lazily.
+
+    Args:
+        records:
+          The records to write, see write_jsonl().
+        output:
+          The text stream to write to.
+    """
+    separator = "[\n"
+
+    for record in records:
+        output.write(separator)
+        output.write(
+            json.dumps(
+                _plain_record(record),
+                default=_json_default,
+                ensure_ascii=False,
+            )
+        )
+        separator = ",\n"
+
+    output.write("[]\n" if separator == "[\n" else "\n]\n")
+    output.flush()
+
+
+def write_csv(records: Iterable[dict], output: TextIO) -> None:
+    """Write the records' findings as CSV, one finding per row.
+
+    The columns are: url, header, value, rating, explanations and
+    references. Explanations are joined around spaces, and references
+    around newlines. An absent header has an empty value.
+
+    Args:
+        records:
+          The records to write, see write_jsonl(). Their "url" is
+          written in the first column, or their "final_url" if they
+          have one. The findings of their "redirects", if any, are
+          written too, with the redirects' urls.
+        output:
+          The text stream to write to. It should be opened with
+          newline="", see the csv module.
+    """
+    writer = csv.writer(output)
+    writer.writerow(
+        ["url", "header", "value", "rating", "explanations", "references"]
+    )
+
+    for record in records:
+        for url, finding in _located_findings(record):
+
+            writer.writerow(
+                [
+                    url,
+                    finding["header"],
+                    finding["value"],
+                    finding["rating"],
+                    " ".join(finding["explanations"]),
+                    "\n".join(finding["references"]),
+                ]
+            )
+
+    output.flush()
+
+
+def write_sarif(records: Iterable[dict], output: TextIO) -> None:
+    """Write the records' findings as a SARIF 2.1.0 log.
+
+    Each finding becomes a result whose rule is the header's name and
+    whose location is the record's url, or the url of the redirect it
+    comes from. "bad" findings are errors,
+    "medium" ones are warnings, and "good" ones are passing results.
+    The results are written one by one, so that records can be
+    produced lazily.
+
+    Args:
+        records:
+          The records to write, see write_jsonl().
+        output:
+          The text stream to write to.
+    """
+    levels = {
+        "good": ("pass", "none"),
+        "medium": ("fail", "warning"),
+        "bad": ("fail", "error"),
+    }
+
+    log_start, log_end = json.dumps(
+        {
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {
+                        "driver": {
+                            "name": __title__,
+                            "informationUri": __url__,
+                        }
+                    },
+                    "results": [None],
+                }
+            ],
+        },
+        indent=2,
+    ).split("null")
+
+    output.write(log_start.rstrip())
+    separator = ""
+
+    for record in records:
+        for url, finding in _located_findings(record):
+
+            kind, level = levels[finding["rating"]]
+
+            result = {
+                "ruleId": finding["header"],
+                "kind": kind,
+                "level": level,
+                "message": {
+                    "text": " ".join(finding["explanations"])
+                    or f"{finding['header']} is rated {finding['rating']}."
+                },
+                "locations": [
+                    {"physicalLocation": {"artifactLocation": {"uri": url}}}
+                ],
+                "properties": {
+                    "value": finding["value"],
+                    "baselineVersion": finding["baseline_version"],
+                },
             }
-        ]
 
-    return findings
+            output.write(separator + "\n")
+            output.write(json.dumps(result, ensure_ascii=False))
+            separator = ","
+
+    output.write("\n" + log_end.lstrip() + "\n")
+    output.flush()
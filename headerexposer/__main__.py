@@ -3,11 +3,13 @@
 """CLI to the HeaderExposer module."""
 
 import argparse
+import contextlib
+import gzip
+import json
+import os
 import shutil
-from importlib import resources
-
-import requests
-import urllib3  # type: ignore
+import sys
+import time
 
 import headerexposer as he  # type: ignore
 
@@ -23,12 +25,35 @@ BANNER = "".join(
     ]
 )
 
+# The machine-readable output formats' writers. jsonl is handled
+# separately, as its records are written one by one.
+WRITERS = {
+    "json": he.write_json,
+    "csv": he.write_csv,
+    "sarif": he.write_sarif,
+}
 
-def analyse(args, baseline):
-    """Analyse a website's headers."""
+
+class ArgumentParser(argparse.ArgumentParser):
+    """An argument parser which prepares the output for its banner."""
+
+    def print_help(self, file=None):
+        he.init_colors()
+        super().print_help(file)
+
+
+def disable_insecure_request_warnings():
+    """Silence urllib3's warnings about unverified HTTPS requests."""
+    import urllib3  # type: ignore  # pylint: disable=C0415
+
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def build_request_arguments(args, url=None):
+    """Build the requests.request() arguments from the CLI arguments."""
     request_arguments = {
         "method": args.method,
-        "url": args.url,
+        "url": url,
         "params": he.parse_request_parameters(args.params),
         "data": None,
         "headers": he.parse_request_headers(args.headers),
@@ -54,37 +79,524 @@ def analyse(args, baseline):
     if args.username is not None and args.password is not None:
         request_arguments["auth"] = (args.username, args.password)
 
+    return request_arguments
+
+
+def open_output(args):
+    """Open the stream selected by --output and --gzip for writing.
+
+    Returns a context manager, so that the standard output is never
+    closed.
+    """
+    if args.output is None or args.output == "-":
+        if args.gzip:
+            return gzip.open(
+                sys.stdout.buffer, "wt", encoding="utf-8", newline=""
+            )
+
+        return contextlib.nullcontext(sys.stdout)
+
+    if args.gzip:
+        return gzip.open(args.output, "wt", encoding="utf-8", newline="")
+
+    return open(args.output, "w", encoding="utf-8", newline="")
+
+
+def print_redirects(redirects, max_width):
+    """Print the analyses of the redirects which led to a response."""
+    for number, redirect in enumerate(redirects, 1):
+        he.print_special(
+            f"\n[blue]Redirect {number} ({redirect['status_code']}"
+            f" {redirect['reason']}): {redirect['url']}[normal]"
+        )
+        print(he.tabulate_findings(redirect["findings"], max_width))
+
+
+def print_timings(timings, max_width):
+    """Print the time spent in each phase of an analysis."""
+    he.print_special("\n[blue]Timings:[normal]")
+    print(
+        he.tabulate_dict(
+            {
+                phase: f"{seconds * 1000:.2f} ms"
+                for phase, seconds in timings.items()
+            },
+            max_width,
+        )
+    )
+
+
+def write_results(args, results, output):
+    """Write scan results in the selected format, as they arrive."""
+    if args.format in WRITERS:
+        WRITERS[args.format](results, output)
+        return
+
+    for result in results:
+        if args.format == "jsonl":
+            he.write_jsonl(result, output)
+
+        elif result["error"] is not None:
+            he.print_special(f"\n[blue]{result['url']}:[normal]")
+            he.print_special(f"[red]{result['error']}[normal]")
+
+        else:
+            print_redirects(result.get("redirects", ()), args.max_width)
+            he.print_special(f"\n[blue]{result['url']}:[normal]")
+            print(he.tabulate_findings(result["findings"], args.max_width))
+
+            if "timings" in result:
+                print_timings(result["timings"], args.max_width)
+
+
+def analyse(args, baseline):
+    """Analyse a website's headers."""
+    # Imported here so that the other commands do not pay for requests.
+    import requests  # pylint: disable=C0415
+
+    # pylint: disable=C0415
+    from headerexposer.fetch import analyse_redirects, fetch
+    from headerexposer.timings import (
+        TimedHTTPAdapter,
+        Timings,
+        measure,
+        recording,
+    )
+
+    request_arguments = build_request_arguments(args, args.url)
+
+    # Without --timings, nothing is recorded and measure() is a no-op.
+    timings = None
+
+    if args.timings:
+        timings = Timings(baseline=args.baseline_seconds)
+
+    def fetch_response():
+        """Send the request, returning the response and its length."""
+        with requests.Session() as session:
+            if timings is not None:
+                session.mount("http://", TimedHTTPAdapter())
+                session.mount("https://", TimedHTTPAdapter())
+
+            return fetch(
+                session, request_arguments, args.headers_only, args.head
+            )
+
+    if not args.verify:
+        disable_insecure_request_warnings()
+
+    if args.format != "table":
+        with recording(timings):
+            response, length = fetch_response()
+
+            with measure("analysis"):
+                record = {
+                    "url": args.url,
+                    "status_code": response.status_code,
+                    "reason": response.reason,
+                    "length": length,
+                    "headers": response.headers,
+                    "findings": he.analyse_headers(
+                        response.headers, baseline, args.short
+                    ),
+                }
+
+                if args.redirect_chain:
+                    record["final_url"] = response.url
+                    record["redirects"] = analyse_redirects(
+                        response, baseline, args.short
+                    )
+
+        if timings is not None:
+            record["timings"] = timings
+
+        with open_output(args) as output:
+            if args.format == "jsonl":
+                he.write_jsonl(record, output)
+            else:
+                WRITERS[args.format]([record], output)
+
+        return
+
     if not args.short:
         he.print_special("[blue]Request parameters:[normal]")
         print(he.tabulate_dict(request_arguments, args.max_width))
 
+    with recording(timings):
+        response, length = fetch_response()
+
+        with measure("analysis"):
+            findings = he.analyse_headers(
+                response.headers, baseline, args.short
+            )
+
+            if args.redirect_chain:
+                redirects = analyse_redirects(response, baseline, args.short)
+
+        with measure("render"):
+            if args.redirect_chain:
+                print_redirects(redirects, args.max_width)
+
+            if not args.short:
+                he.print_special("\n[blue]Response:[normal]")
+
+                print(
+                    he.tabulate_dict(
+                        {
+                            "Length": "Unknown" if length is None else length,
+                            "Status Code": response.status_code,
+                            "Reason": response.reason,
+                        },
+                        args.max_width,
+                    )
+                )
+
+                he.print_special("\n[blue]Response headers:[normal]")
+                print(he.tabulate_dict(response.headers, args.max_width))
+
+            he.print_special("\n[blue]Headers analysis:[normal]")
+            print(he.tabulate_findings(findings, args.max_width))
+
+    if timings is not None:
+        print_timings(timings, args.max_width)
+
+
+def scan(args, baseline):
+    """Analyse the headers of many websites concurrently."""
+    # Imported here so that the other commands do not pay for asyncio.
+    from headerexposer.scan import iter_scan, read_urls
+    from headerexposer.state import ScanState
+    from headerexposer.timings import Metrics, Timings
+
+    request_arguments = build_request_arguments(args)
+    del request_arguments["url"]
+
     if not args.verify:
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        disable_insecure_request_warnings()
+
+    metrics = Metrics()
+    metrics.observe(Timings(baseline=args.baseline_seconds))
+
+    def observed(results):
+        """Add the results' timings to the metrics, as they arrive."""
+        for result in results:
+            # The urls not scanned before the deadline have none.
+            metrics.observe(result.get("timings", Timings()), result)
+
+            if not args.timings:
+                result.pop("timings", None)
+
+            yield result
+
+    def scan_urls_file(urls_file, output, state):
+        """Scan the urls of a file, writing the results as they arrive."""
+        results = iter_scan(
+            read_urls(urls_file),
+            baseline,
+            short=args.short,
+            concurrency=args.concurrency,
+            request_arguments=request_arguments,
+            headers_only=args.headers_only,
+            head_first=args.head,
+            redirect_chain=args.redirect_chain,
+            per_host=args.per_host,
+            retries=args.retries,
+            deadline=args.deadline,
+            state=state,
+            timings=args.timings or args.metrics_file is not None,
+        )
 
-    response = requests.request(**request_arguments)
+        if args.metrics_file is not None:
+            results = observed(results)
 
-    if not args.short:
-        he.print_special("\n[blue]Response:[normal]")
-
-        print(
-            he.tabulate_dict(
-                {
-                    "Length": len(response.content),
-                    "Status Code": response.status_code,
-                    "Reason": response.reason,
-                },
-                args.max_width,
+        write_results(args, results, output)
+
+    with contextlib.ExitStack() as stack:
+        output = stack.enter_context(open_output(args))
+        state = None
+
+        if args.state is not None:
+            state = stack.enter_context(ScanState(args.state))
+
+        if args.urls_file == "-":
+            scan_urls_file(sys.stdin, output, state)
+
+        else:
+            with open(args.urls_file) as urls_file:
+                scan_urls_file(urls_file, output, state)
+
+        if state is not None:
+            print(
+                ", ".join(
+                    f"{n} {change}" for change, n in state.counts.items()
+                ),
+                file=sys.stderr,
             )
+
+    if args.metrics_file is not None:
+        # Replaced at once, for collectors reading it at any time.
+        with open(args.metrics_file + ".tmp", "w") as metrics_file:
+            metrics_file.write(metrics.exposition())
+
+        os.replace(args.metrics_file + ".tmp", args.metrics_file)
+
+
+def analyse_archive(args, baseline):
+    """Analyse the responses recorded in a HAR or WARC archive."""
+    # Imported here so that the other commands do not pay for it.
+    from headerexposer.archive import iter_archive
+
+    archive_format = (
+        None if args.archive_format == "auto" else args.archive_format
+    )
+
+    results = iter_archive(
+        args.archive, baseline, short=args.short, archive_format=archive_format
+    )
+
+    with open_output(args) as output:
+        write_results(args, results, output)
+
+
+def analyse_header_maps(args, baseline):
+    """Analyse header maps read as JSON lines, writing JSON lines."""
+    # Imported here so that the other commands do not pay for them.
+    from headerexposer.archive import open_archive
+    from headerexposer.batch import analyse_header_maps as analyse_maps
+
+    with open_archive(args.input) as input_file, open_output(args) as output:
+        analyse_maps(
+            input_file,
+            output,
+            baseline,
+            short=args.short,
+            line_buffered=args.line_buffered,
+            jobs=args.jobs,
         )
 
-    if not args.short:
-        he.print_special("\n[blue]Response headers:[normal]")
-        print(he.tabulate_dict(response.headers, args.max_width))
 
-    findings = he.analyse_headers(response.headers, baseline, args.short)
+def summarize_posture(args, baseline):
+    """Aggregate JSON lines of findings into a fleet posture."""
+    # Imported here so that the other commands do not pay for them.
+    from headerexposer.archive import open_archive
+    from headerexposer.posture import PostureAggregator, tabulate_posture
+
+    # The findings were made beforehand, with their own baseline.
+    del baseline
+
+    aggregator = PostureAggregator(top=args.top)
+
+    with open_archive(args.input) as input_file:
+        aggregator.add_lines(input_file)
+
+    summary = aggregator.summary()
+
+    with open_output(args) as output:
+        if args.format == "json":
+            json.dump(summary, output, ensure_ascii=False, indent=2)
+            output.write("\n")
+        else:
+            output.write(tabulate_posture(summary, args.max_width) + "\n")
+
+
+def profile_baseline(args, baseline):
+    """Time each pattern of the baseline over header maps."""
+    # Imported here so that the other commands do not pay for them.
+    from headerexposer.archive import open_archive
+    from headerexposer.profiling import PatternProfiler, tabulate_profile
+
+    profiler = PatternProfiler(baseline)
+
+    with open_archive(args.input) as input_file:
+        profiler.add_lines(input_file)
+
+    report = profiler.report(top=args.top)
+
+    with open_output(args) as output:
+        if args.format == "json":
+            json.dump(report, output, ensure_ascii=False, indent=2)
+            output.write("\n")
+        else:
+            output.write(tabulate_profile(report, args.max_width) + "\n")
+
+
+def serve(args, baseline):
+    """Serve headers analyses over HTTP."""
+    # Imported here so that the other commands do not pay for the server.
+    from headerexposer.hotreload import BaselineHolder
+    from headerexposer.serve import make_server
+
+    # The holder loads its own copy, from the cache, to watch its file.
+    del baseline
+
+    request_arguments = build_request_arguments(args)
+    del request_arguments["url"]
+
+    if not args.verify:
+        disable_insecure_request_warnings()
+
+    holder = BaselineHolder(
+        args.baseline_path,
+        no_colors=True,
+        cache_dir=args.cache_dir,
+        interval=args.reload_interval,
+        limits=args.match_limits,
+    )
+
+    server = make_server(
+        args.host,
+        args.port,
+        holder,
+        short=args.short,
+        request_arguments=request_arguments,
+        pool_size=args.concurrency,
+        headers_only=args.headers_only,
+        head_first=args.head,
+        redirect_chain=args.redirect_chain,
+    )
+
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port}/", file=sys.stderr)
+
+    with holder, server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def positive_int(value):
+    """Parse a strictly positive integer argument."""
+    number = int(value)
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+
+    return number
+
+
+def add_request_options(parser):
+    """Add the request options to a subcommand's parser."""
+    request_options = parser.add_argument_group("request options")
+
+    request_options.add_argument(
+        "-m",
+        "--method",
+        help='HTTP method to use for the request. Default: "GET".',
+        choices=["GET", "OPTIONS", "HEAD", "POST", "PUT", "PATCH", "DELETE"],
+        default="GET",
+    )
+
+    request_options.add_argument(
+        "--params",
+        help="Add multiple, ampersand-separated parameters to the request.",
+    )
+
+    group = request_options.add_mutually_exclusive_group()
+
+    group.add_argument(
+        "-d",
+        "--data",
+        help="Data to append to the request."
+        " Mutually exclusive with --file.",
+    )
+
+    group.add_argument(
+        "-f",
+        "--file",
+        help="Path to a file to append to the request."
+        " Mutually exclusive with --data.",
+    )
+
+    request_options.add_argument(
+        "-H",
+        "--headers",
+        help="Add multiple, newline-separated HTTP headers to the request.",
+    )
+
+    request_options.add_argument(
+        "-C",
+        "--cookies",
+        help="Add multiple, semicolon-separated cookies to the request.",
+    )
+
+    request_options.add_argument(
+        "-U",
+        "--username",
+        help="username to use in Basic/Digest/Custom HTTP Authentication.",
+    )
+
+    request_options.add_argument(
+        "-P",
+        "--password",
+        help="password to use in Basic/Digest/Custom HTTP Authentication.",
+    )
+
+    request_options.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        help="How many seconds to wait for the server to send data"
+        " before giving up, as float.",
+    )
+
+    request_options.add_argument(
+        "-r",
+        "--disallow-redirects",
+        action="store_true",
+        help="Disable GET/OPTIONS/POST/PUT/PATCH/DELETE/HEAD redirection."
+        " Defaults to enabled redirection.",
+    )
+
+    request_options.add_argument(
+        "--redirect-chain",
+        action="store_true",
+        help="Also analyse the headers of every redirect followed, such"
+        " as http:// to https://, not only the final response's.",
+    )
+
+    request_options.add_argument(
+        "--headers-only",
+        action="store_true",
+        help="Do not download the responses' bodies: close each response"
+        " as soon as its headers are received. The length is then read"
+        " from Content-Length.",
+    )
 
-    he.print_special("\n[blue]Headers analysis:[normal]")
-    print(he.tabulate_findings(findings, args.max_width))
+    request_options.add_argument(
+        "--head",
+        action="store_true",
+        help="With GET, send a HEAD request first, and only fall back to"
+        " GET, without its body, if the HEAD response's status is an"
+        " error.",
+    )
+
+    request_options.add_argument(
+        "-p", "--proxy", help="Proxy to use for the request."
+    )
+
+    request_options.add_argument(
+        "-k",
+        "--verify",
+        action="store_true",
+        help="Verify SSL certificates. Defaults to an insecure behavior.",
+    )
+
+    request_options.add_argument(
+        "-c",
+        "--cert",
+        help="Optional path to the SSL client .pem certificate"
+        " for client authentication.",
+    )
+
+    request_options.add_argument(
+        "-a",
+        "--user-agent",
+        help="User Agent to use."
+        " Defaults to a recent Google Chrome user agent.",
+        default="Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/535.1"
+        " (KHTML, like Gecko) Chrome/13.0.782.112 Safari/535.1",
+    )
 
 
 def baseline_demo(args, baseline):
@@ -181,7 +693,12 @@ def baseline_demo(args, baseline):
             " --no-explanation-colors argument:[normal]"
         )
     )
-    colorless_baseline = he.load_baseline(args.baseline_path, no_colors=True)
+    colorless_baseline = he.load_baseline(
+        args.baseline_path,
+        no_colors=True,
+        compiled=True,
+        cache_dir=args.cache_dir,
+    )
     findings = he.analyse_headers({}, colorless_baseline, short=True)
     print(he.tabulate_findings(findings))
 
@@ -197,8 +714,8 @@ def baseline_demo(args, baseline):
 
         b_header = None
 
-        for header in baseline["headers"]:
-            if header["name"] == name:
+        for header in baseline.headers:
+            if header.name == name:
                 b_header = header
                 break
 
@@ -228,7 +745,10 @@ def show_baseline(args, baseline):
 
 def main():
     """Only called when the module is called directly as a script."""
-    main_parser = argparse.ArgumentParser(
+    default_baseline_path = he._package_file("baseline_short.json")
+    terminal_width = shutil.get_terminal_size().columns
+
+    main_parser = ArgumentParser(
         prog="headerexposer",
         description=f"{BANNER}\nAnalyse the security of your website's"
         " headers!",
@@ -258,135 +778,400 @@ def main():
         "analyse", help="Analyse a given url's headers."
     )
 
+    bulk_scan = subparsers.add_parser(
+        "scan",
+        help="Analyse the headers of many urls concurrently.",
+    )
+
+    archive_analysis = subparsers.add_parser(
+        "analyse-archive",
+        help="Analyse the responses recorded in a HAR or WARC archive,"
+        " without fetching anything.",
+    )
+
+    header_maps_analysis = subparsers.add_parser(
+        "analyse-headers",
+        help="Analyse header maps read as JSON lines, such as"
+        ' {"id": "example.com", "headers": {"X-Frame-Options": "DENY"}},'
+        " and write one line of findings per record.",
+    )
+
+    posture = subparsers.add_parser(
+        "posture",
+        help="Summarize JSON lines of findings, as written by the other"
+        " commands, into per-header rating counts, most common values"
+        " and distinct values, in constant memory.",
+    )
+
+    profile = subparsers.add_parser(
+        "profile-baseline",
+        help="Analyse header maps read as JSON lines, as analyse-headers"
+        " does, and report the time spent matching each pattern of the"
+        " baseline.",
+    )
+
     demo = subparsers.add_parser(
         "demo",
         help="Show a demonstration of what would be printed for sample"
         " headers with the selected baseline.json.",
     )
 
+    http_service = subparsers.add_parser(
+        "serve",
+        help="Serve analyses over HTTP, with the baseline and the"
+        " connections kept warm.",
+    )
+
     show = subparsers.add_parser(
         "show", help="Show the selected baseline without doing any analysis."
     )
 
     analysis.set_defaults(func=analyse)
+    bulk_scan.set_defaults(func=scan)
+    archive_analysis.set_defaults(func=analyse_archive)
+    # The findings are written as JSON lines, hence without colors.
+    header_maps_analysis.set_defaults(func=analyse_header_maps, format="jsonl")
+    posture.set_defaults(func=summarize_posture)
+    profile.set_defaults(func=profile_baseline)
     demo.set_defaults(func=baseline_demo)
     show.set_defaults(func=show_baseline)
+    # The findings are served as JSON, hence without colors.
+    http_service.set_defaults(func=serve, format="json")
 
     # Okay this may seem ugly but I want this argument available
     # *everywhere*.
-    for parser in [main_parser, analysis, demo, show]:
-        with resources.path("headerexposer", "baseline_short.json") as baseline_path:
-            parser.add_argument(
-                "-b",
-                "--baseline-path",
-                help="Path to the baseline.json file for the header analysis"
-                f" (default: {baseline_path}).",
-                default=baseline_path,
-            )
+    for parser in [
+        main_parser,
+        analysis,
+        bulk_scan,
+        archive_analysis,
+        header_maps_analysis,
+        posture,
+        profile,
+        demo,
+        http_service,
+        show,
+    ]:
+        parser.add_argument(
+            "-b",
+            "--baseline-path",
+            help="Path to the baseline.json file for the header analysis"
+            f" (default: {default_baseline_path}).",
+            default=default_baseline_path,
+        )
 
-    request_options = analysis.add_argument_group("request options")
+        parser.add_argument(
+            "--no-baseline-cache",
+            action="store_true",
+            help="Always parse and validate the baseline, instead of"
+            " loading it from the cache"
+            f" ({he.default_cache_dir()}).",
+        )
 
-    request_options.add_argument(
-        "-m",
-        "--method",
-        help='HTTP method to use for the request. Default: "GET".',
-        choices=["GET", "OPTIONS", "HEAD", "POST", "PUT", "PATCH", "DELETE"],
-        default="GET",
+    add_request_options(analysis)
+
+    analysis.add_argument("url", help="The url to test.")
+
+    add_request_options(bulk_scan)
+
+    bulk_scan.add_argument(
+        "-n",
+        "--concurrency",
+        type=int,
+        help="The maximum number of requests in flight. Default: 20.",
+        default=20,
     )
 
-    request_options.add_argument(
-        "--params",
-        help="Add multiple, ampersand-separated parameters to the request.",
+    bulk_scan.add_argument(
+        "--per-host",
+        type=int,
+        help="The maximum number of requests in flight to the same host."
+        " Within it, each host's concurrency adapts to its latency and"
+        " errors. Default: 6.",
+        default=6,
     )
 
-    group = request_options.add_mutually_exclusive_group()
+    bulk_scan.add_argument(
+        "--retries",
+        type=int,
+        help="How many times to retry a url after a connection error, a"
+        " timeout or a 429/502/503/504 status, with exponential backoff."
+        " Default: 2.",
+        default=2,
+    )
 
-    group.add_argument(
-        "-d",
-        "--data",
-        help="Data to append to the request."
-        " Mutually exclusive with --file.",
+    bulk_scan.add_argument(
+        "--state",
+        help="Path to a SQLite database keeping the urls' state between"
+        " scans. The requests are then conditional, unchanged headers"
+        " are not analysed again, and only the urls whose findings are"
+        " new or changed (or which failed) are reported.",
     )
 
-    group.add_argument(
-        "-f",
-        "--file",
-        help="Path to a file to append to the request."
-        " Mutually exclusive with --data.",
+    bulk_scan.add_argument(
+        "--metrics-file",
+        help="Path to write metrics to at the end of the scan, in the"
+        " Prometheus text format (e.g. for node_exporter's textfile"
+        " collector): the time spent in each phase, the outcomes and"
+        " the caches' counters.",
     )
 
-    request_options.add_argument(
-        "-H",
-        "--headers",
-        help="Add multiple, newline-separated HTTP headers to the request.",
+    bulk_scan.add_argument(
+        "--deadline",
+        type=float,
+        help="How many seconds the scan may last. Afterwards, the urls"
+        " not scanned yet are reported with an error. Default: none.",
     )
 
-    request_options.add_argument(
-        "-C",
-        "--cookies",
-        help="Add multiple, semicolon-separated cookies to the request.",
+    bulk_scan.add_argument(
+        "urls_file",
+        nargs="?",
+        help="Path to a file containing the urls to test, one per line."
+        ' Defaults to "-", the standard input.',
+        default="-",
     )
 
-    request_options.add_argument(
-        "-U",
-        "--username",
-        help="username to use in Basic/Digest/Custom HTTP Authentication.",
+    add_request_options(http_service)
+
+    http_service.add_argument(
+        "--host",
+        help='The address to listen on. Default: "127.0.0.1".',
+        default="127.0.0.1",
     )
 
-    request_options.add_argument(
-        "-P",
-        "--password",
-        help="password to use in Basic/Digest/Custom HTTP Authentication.",
+    http_service.add_argument(
+        "--port",
+        type=int,
+        help="The port to listen on. Default: 8080.",
+        default=8080,
     )
 
-    request_options.add_argument(
-        "-t",
-        "--timeout",
+    http_service.add_argument(
+        "-n",
+        "--concurrency",
+        type=int,
+        help="The maximum number of connections kept alive per host."
+        " Default: 20.",
+        default=20,
+    )
+
+    http_service.add_argument(
+        "--reload-interval",
         type=float,
-        help="How many seconds to wait for the server to send data"
-        " before giving up, as float.",
+        help="How many seconds to wait between two checks of the"
+        " baseline file, which is reloaded when it changes. Default: 2.",
+        default=2.0,
     )
 
-    request_options.add_argument(
-        "-r",
-        "--disallow-redirects",
+    archive_analysis.add_argument(
+        "--archive-format",
+        choices=["auto", "har", "warc"],
+        help="The archive's format. Gzipped archives are decompressed"
+        ' on the fly. Default: "auto", detected from its content.',
+        default="auto",
+    )
+
+    archive_analysis.add_argument(
+        "archive",
+        nargs="?",
+        help="Path to the HAR or WARC archive."
+        ' Defaults to "-", the standard input.',
+        default="-",
+    )
+
+    header_maps_analysis.add_argument(
+        "-o",
+        "--output",
+        help='Path to the file to write the findings to. Defaults to "-",'
+        " the standard output.",
+        default="-",
+    )
+
+    header_maps_analysis.add_argument(
+        "--gzip",
         action="store_true",
-        help="Disable GET/OPTIONS/POST/PUT/PATCH/DELETE/HEAD redirection."
-        " Defaults to enabled redirection.",
+        help="Compress the output with gzip.",
     )
 
-    request_options.add_argument(
-        "-p", "--proxy", help="Proxy to use for the request."
+    header_maps_analysis.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        help="The number of processes analysing the header maps in"
+        " parallel. Default: 1.",
+        default=1,
     )
 
-    request_options.add_argument(
-        "-k",
-        "--verify",
+    header_maps_analysis.add_argument(
+        "--line-buffered",
         action="store_true",
-        help="Verify SSL certificates. Defaults to an insecure behavior.",
+        help="Flush the output after each record, instead of when the"
+        " output buffer is full.",
     )
 
-    request_options.add_argument(
-        "-c",
-        "--cert",
-        help="Optional path to the SSL client .pem certificate"
-        " for client authentication.",
+    posture.add_argument(
+        "--top",
+        type=int,
+        help="The number of most common values reported per header."
+        " Default: 10.",
+        default=10,
     )
 
-    request_options.add_argument(
-        "-a",
-        "--user-agent",
-        help="User Agent to use."
-        " Defaults to a recent Google Chrome user agent.",
-        default="Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/535.1"
-        " (KHTML, like Gecko) Chrome/13.0.782.112 Safari/535.1",
+    posture.add_argument(
+        "--format",
+        choices=["table", "json"],
+        help='The output format. Default: "table".',
+        default="table",
     )
 
-    analysis.add_argument("url", help="The url to test.")
+    posture.add_argument(
+        "-o",
+        "--output",
+        help='Path to the file to write the posture to. Defaults to "-",'
+        " the standard output.",
+        default="-",
+    )
+
+    posture.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress the output with gzip.",
+    )
+
+    posture.add_argument(
+        "input",
+        nargs="?",
+        help="Path to the JSON lines of findings, possibly gzipped."
+        ' Defaults to "-", the standard input.',
+        default="-",
+    )
+
+    header_maps_analysis.add_argument(
+        "input",
+        nargs="?",
+        help="Path to the JSON lines file, possibly gzipped."
+        ' Defaults to "-", the standard input.',
+        default="-",
+    )
+
+    profile.add_argument(
+        "--top",
+        type=int,
+        help="The number of patterns reported, the most costly first."
+        " Default: all.",
+    )
+
+    profile.add_argument(
+        "--format",
+        choices=["table", "json"],
+        help='The output format. Default: "table".',
+        default="table",
+    )
+
+    profile.add_argument(
+        "-o",
+        "--output",
+        help='Path to the file to write the report to. Defaults to "-",'
+        " the standard output.",
+        default="-",
+    )
+
+    profile.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress the output with gzip.",
+    )
+
+    profile.add_argument(
+        "input",
+        nargs="?",
+        help="Path to the JSON lines file, possibly gzipped."
+        ' Defaults to "-", the standard input.',
+        default="-",
+    )
+
+    # Profiling hostile values needs a timeout, or the profile of a
+    # catastrophic pattern would never end.
+    for parser, default_timeout in [
+        (analysis, None),
+        (bulk_scan, None),
+        (archive_analysis, None),
+        (header_maps_analysis, None),
+        (http_service, None),
+        (profile, 1.0),
+    ]:
+        limit_options = parser.add_argument_group("limit options")
+
+        limit_options.add_argument(
+            "--max-value-length",
+            type=int,
+            help="Do not match header values longer than this number of"
+            " characters against the baseline: they are rated invalid."
+            " Default: none.",
+        )
+
+        limit_options.add_argument(
+            "--match-timeout",
+            type=float,
+            help="Abandon the matching of a header value against the"
+            " baseline after this number of seconds: it is rated"
+            " invalid. Default:"
+            f" {'none' if default_timeout is None else default_timeout}.",
+            default=default_timeout,
+        )
+
+    for parser in [analysis, bulk_scan]:
+        parser.add_argument(
+            "--timings",
+            action="store_true",
+            help="Report the time spent in each phase of each url's"
+            " analysis: baseline loading (for analyse), DNS resolution,"
+            " connection, TLS handshake, time to first byte, download,"
+            " analysis and render (for analyse).",
+        )
+
+    for parser in [analysis, bulk_scan, archive_analysis]:
+        format_options = parser.add_argument_group("format options")
+
+        format_options.add_argument(
+            "--format",
+            choices=["table", "json", "jsonl", "csv", "sarif"],
+            help='The output format. "table" is meant for humans, the'
+            " others for machines: they are neither wrapped nor colored."
+            ' "jsonl" writes one JSON object per url, holding its'
+            ' findings, as soon as they are ready. Default: "table".',
+            default="table",
+        )
+
+        format_options.add_argument(
+            "-o",
+            "--output",
+            help="Path to the file to write the machine-readable output"
+            " to."
+            ' Defaults to "-", the standard output.',
+            default="-",
+        )
+
+        format_options.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the machine-readable output with gzip.",
+        )
 
     # Okay this may seem ugly but I want these argument available
     # *everywhere*. And at the end, not like --baseline-path.
-    for parser in [main_parser, analysis, demo, show]:
+    for parser in [
+        main_parser,
+        analysis,
+        bulk_scan,
+        archive_analysis,
+        header_maps_analysis,
+        posture,
+        profile,
+        demo,
+        http_service,
+        show,
+    ]:
         output_options = parser.add_argument_group("output options")
 
         output_options.add_argument(
@@ -408,8 +1193,8 @@ def main():
             "--max-width",
             type=int,
             help="The maximum width of the output. Defaults to the screen"
-            f" width ({shutil.get_terminal_size().columns} columns).",
-            default=shutil.get_terminal_size().columns,
+            f" width ({terminal_width} columns).",
+            default=terminal_width,
         )
 
     args = main_parser.parse_args()
@@ -423,15 +1208,43 @@ def main():
         args.short = not args.detailed
 
         if args.detailed:
-            with resources.path("headerexposer", "baseline_short.json") as baseline_path:
-                args.baseline_path = baseline_path
+            args.baseline_path = default_baseline_path
+
+        # Machine-readable formats have no use for colors.
+        no_colors = (
+            args.no_explanation_colors
+            or getattr(args, "format", "table") != "table"
+        )
+
+        args.cache_dir = (
+            None if args.no_baseline_cache else he.default_cache_dir()
+        )
+
+        start = time.perf_counter()
 
         baseline = he.load_baseline(
-            args.baseline_path, args.no_explanation_colors
+            args.baseline_path,
+            no_colors,
+            compiled=True,
+            cache_dir=args.cache_dir,
         )
 
-        if not args.short:
-            print(BANNER)
+        # The "baseline" phase of --timings.
+        args.baseline_seconds = time.perf_counter() - start
+
+        args.match_limits = he.MatchLimits(
+            getattr(args, "max_value_length", None),
+            getattr(args, "match_timeout", None),
+        )
+
+        if args.match_limits != he.MatchLimits():
+            baseline = he.guard_baseline(baseline, args.match_limits)
+
+        if getattr(args, "format", "table") == "table":
+            he.init_colors()
+
+            if not args.short:
+                print(BANNER)
 
         args.func(args, baseline)
 
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+
+"""Analyse the responses recorded in HAR and WARC archives.
+
+The headerexposer.archive module reads HTTP archives incrementally,
+without ever loading them in memory, and analyses the headers of each
+recorded response. Responses already captured by crawlers or browser
+test runs need not be fetched again. Gzip-compressed archives, such as
+.har.gz or .warc.gz files, are decompressed on the fly.
+
+Basic module usage:
+
+>>> import headerexposer as he
+>>> from headerexposer.archive import iter_archive
+
+>>> baseline = he.load_baseline("baseline.json", compiled=True)
+
+>>> for result in iter_archive("crawl.warc.gz", baseline, short=True):
+...     print(result["url"], result["status_code"])
+...     print(he.tabulate_findings(result["findings"]))
+"""
+
+__all__ = [
+    "open_archive",
+    "detect_format",
+    "iter_har_responses",
+    "iter_warc_responses",
+    "iter_archive",
+]
+
+import gzip
+import io
+import json
+import re
+import sys
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple
+
+import headerexposer as he
+
+# The number of characters or bytes read from archives at once.
+CHUNK_SIZE = 1024 * 1024
+
+# The size of the archives' read buffers. Headers are split from the
+# buffered data, which is copied for that: it must not be too large.
+BUFFER_SIZE = 64 * 1024
+
+# JSON's insignificant whitespace.
+_WHITESPACE_PATTERN = re.compile(r"[ \t\n\r]*")
+
+# The empty line ending a block of headers.
+_HEADERS_END_PATTERN = re.compile(rb"\r?\n\r?\n")
+
+# The WARC records holding an HTTP response's headers.
+_WARC_RESPONSE_TYPES = (b"response", b"revisit")
+
+
+class _GzipReader(io.BufferedReader):
+    """A buffered, decompressed stream, closing the stream it reads.
+
+    GzipFile(fileobj=...) leaves its file object open, which would leak
+    the archive's file descriptor.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        super().__init__(gzip.GzipFile(fileobj=stream), BUFFER_SIZE)
+        self._stream = stream
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._stream.close()
+
+
+def open_archive(path: str) -> BinaryIO:
+    """Open an archive for reading, decompressing it if it is gzipped.
+
+    Args:
+        path:
+          The path to the archive, or "-" for the standard input.
+
+    Returns:
+        The binary stream of the (decompressed) archive. It supports
+        peek(), which detect_format() relies on, and closing it closes
+        the archive.
+    """
+    if path == "-":
+        stream = sys.stdin.buffer
+    else:
+        stream = open(path, "rb", buffering=BUFFER_SIZE)
+
+    if stream.peek(2)[:2] == b"\x1f\x8b":
+        return _GzipReader(stream)
+
+    return stream
+
+
+def detect_format(stream: BinaryIO) -> str:
+    """Tell whether an archive is a HAR or a WARC file.
+
+    Args:
+        stream:
+          The archive, as returned by open_archive(). Nothing is
+          consumed from it.
+
+    Returns:
+        "har" or "warc".
+
+    Raises:
+        ValueError if the format is not recognized.
+    """
+    start = stream.peek(64).lstrip(b"\xef\xbb\xbf \t\r\n")
+
+    if start.startswith(b"WARC/"):
+        return "warc"
+
+    if start.startswith(b"{"):
+        return "har"
+
+    raise ValueError("Unknown archive format, expected HAR or WARC.")
+
+
+def _new_result(
+    url: Optional[str],
+    status_code: Optional[int],
+    reason: Optional[str],
+    length: Optional[int],
+    headers: he.Headers,
+) -> dict:
+    """Return a result for a recorded response, see scan_url()."""
+    return {
+        "url": url,
+        "status_code": status_code,
+        "reason": reason,
+        "length": length,
+        "headers": headers,
+        "findings": [],
+        "error": None if status_code else "No response was recorded.",
+    }
+
+
+def _invalid_result(url: Optional[str], error: str) -> dict:
+    """Return the result of a record which could not be read."""
+    result = _new_result(url, None, None, None, he.Headers(()))
+    result["error"] = error
+
+    return result
+
+
+class _JsonReader:
+    """Read the values of a JSON document one by one, from a text stream.
+
+    Only the structure being iterated on is kept in memory: each value
+    is decoded by the json module once it is entirely buffered.
+    """
+
+    def __init__(self, stream: io.TextIOBase):
+        self._stream = stream
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._end_of_stream = False
+
+    def _fill(self) -> bool:
+        """Read more of the stream, returning False at its end.
+
+        The amount read grows with the unconsumed buffer, so that
+        decoding a huge value is not retried once per chunk.
+        """
+        size = max(CHUNK_SIZE, len(self._buffer) - self._position)
+        chunk = self._stream.read(size)
+
+        if chunk == "":
+            self._end_of_stream = True
+            return False
+
+        self._buffer = self._buffer[self._position :] + chunk
+        self._position = 0
+
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or ""."""
+        while True:
+            self._position = _WHITESPACE_PATTERN.match(
+                self._buffer, self._position
+            ).end()
+
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+
+            if not self._fill():
+                return ""
+
+    def expect(self, character: str) -> None:
+        """Consume the next character, which must be character."""
+        if self.peek() != character:
+            raise ValueError(
+                f"Invalid JSON: expected {character!r}"
+                f" instead of {self.peek()!r}."
+            )
+
+        self._position += 1
+
+    def value(self) -> Any:
+        """Decode and consume the next value."""
+        self.peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(
+                    self._buffer, self._position
+                )
+
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+
+            # A number at the end of the buffer may be truncated.
+            if end < len(self._buffer) or self._end_of_stream:
+                break
+
+            if not self._fill():
+                break
+
+        self._position = end
+
+        return value
+
+    def _items(self, opening: str, closing: str) -> Iterator[None]:
+        """Iterate over an object's or an array's items, see below."""
+        self.expect(opening)
+
+        if self.peek() == closing:
+            self._position += 1
+            return
+
+        while True:
+            yield None
+
+            if self.peek() == closing:
+                self._position += 1
+                return
+
+            self.expect(",")
+
+    def keys(self) -> Iterator[str]:
+        """Iterate over the next object's keys.
+
+        The caller must consume each key's value, e.g. with value(),
+        before getting the next key.
+        """
+        for _ in self._items("{", "}"):
+            key = self.value()
+            self.expect(":")
+
+            yield key
+
+    def values(self) -> Iterator[Any]:
+        """Iterate over the next array's values, decoded one by one."""
+        for _ in self._items("[", "]"):
+            yield self.value()
+
+
+def _har_result(entry: Any) -> dict:
+    """Return the result of a HAR entry, see iter_har_responses().
+
+    Raises:
+        ValueError if the entry is invalid.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("Expected an object.")
+
+    request = entry.get("request") or {}
+    response = entry.get("response") or {}
+
+    if not isinstance(request, dict) or not isinstance(response, dict):
+        raise ValueError('"request" and "response" must be objects.')
+
+    header_pairs = []
+
+    for header in response.get("headers") or []:
+        if not (
+            isinstance(header, dict)
+            and isinstance(header.get("name"), str)
+            and isinstance(header.get("value"), str)
+        ):
+            raise ValueError(
+                "Each response header must have a string name and value."
+            )
+
+        # HTTP/2 pseudo-headers, such as :status, are left out.
+        if not header["name"].startswith(":"):
+            header_pairs += [(header["name"], header["value"])]
+
+    status_code = response.get("status")
+
+    if status_code is not None and not isinstance(status_code, int):
+        raise ValueError('"status" must be an integer.')
+
+    content = response.get("content") or {}
+    length = content.get("size") if isinstance(content, dict) else None
+
+    if not isinstance(length, int) or length < 0:
+        length = response.get("bodySize")
+
+    return _new_result(
+        request.get("url"),
+        status_code,
+        response.get("statusText"),
+        length if isinstance(length, int) and length >= 0 else None,
+        he.Headers(header_pairs),
+    )
+
+
+def iter_har_responses(stream: BinaryIO) -> Iterator[dict]:
+    """Read the recorded responses of a HAR archive, lazily.
+
+    Only log.entries is iterated on: the other members of the archive
+    are decoded and dropped one at a time.
+
+    Args:
+        stream:
+          The HAR archive, as returned by open_archive().
+
+    Returns:
+        An iterator over the responses, as scan results without
+        findings (see scan_url()). Entries without a response, such as
+        blocked requests, and invalid entries have an error.
+
+    Raises:
+        ValueError if the archive is not valid JSON.
+    """
+    reader = _JsonReader(io.TextIOWrapper(stream, encoding="utf-8-sig"))
+
+    for key in reader.keys():
+        if key != "log":
+            reader.value()
+            continue
+
+        for log_key in reader.keys():
+            if log_key != "entries":
+                reader.value()
+                continue
+
+            for number, entry in enumerate(reader.values(), 1):
+                try:
+                    yield _har_result(entry)
+
+                except ValueError as exception:
+                    request = (
+                        entry.get("request")
+                        if isinstance(entry, dict)
+                        else None
+                    )
+                    url = (
+                        request.get("url")
+                        if isinstance(request, dict)
+                        else None
+                    )
+
+                    yield _invalid_result(url, f"Entry {number}: {exception}")
+
+
+def _read_header_lines(
+    stream: BinaryIO, limit: int
+) -> Tuple[List[bytes], int]:
+    """Read header lines up to an empty line, and no more than limit bytes.
+
+    Returns:
+        (List[bytes] lines, int number of bytes read). Continuation
+        lines (obsolete line folding) are joined to the previous line.
+    """
+    # Usually, the whole block is already buffered and is split at once.
+    # Empty and folded blocks are left to the line by line reading.
+    buffered = stream.peek(limit)
+    end = _HEADERS_END_PATTERN.search(buffered, 0, limit)
+
+    if end is not None and buffered[:1] not in (b"\r", b"\n"):
+        block = buffered[: end.start()]
+
+        if b"\n " not in block and b"\n\t" not in block:
+            stream.read(end.end())
+
+            return [
+                line.rstrip(b"\r") for line in block.split(b"\n")
+            ], end.end()
+
+    lines: List[bytes] = []
+    read = 0
+
+    while read < limit:
+        line = stream.readline(limit - read)
+        read += len(line)
+
+        if line.strip() == b"":
+            break
+
+        if line[:1] in (b" ", b"\t") and lines:
+            lines[-1] += b" " + line.strip()
+        else:
+            lines += [line.rstrip(b"\r\n")]
+
+    return lines, read
+
+
+def _skip(stream: BinaryIO, size: int) -> None:
+    """Consume size bytes from stream, without keeping them."""
+    while size > 0:
+        skipped = len(stream.read(min(size, CHUNK_SIZE)))
+
+        if skipped == 0:
+            raise ValueError("Truncated WARC record.")
+
+        size -= skipped
+
+
+def iter_warc_responses(stream: BinaryIO) -> Iterator[dict]:
+    """Read the recorded responses of a WARC archive, lazily.
+
+    The "response" and "revisit" records holding an HTTP message are
+    read up to the end of the HTTP headers, and the rest of each record
+    (such as the response's body) is skipped.
+
+    Args:
+        stream:
+          The WARC archive, as returned by open_archive().
+
+    Returns:
+        An iterator over the responses, as scan results without
+        findings (see scan_url()). Responses with an invalid status line
+        have an error.
+
+    Raises:
+        ValueError if the records cannot be delimited, e.g. if their
+        length is invalid.
+    """
+    while True:
+        version = stream.readline()
+
+        if version == b"":
+            return
+
+        # Records are separated by empty lines.
+        if version.strip() == b"":
+            continue
+
+        if not version.startswith(b"WARC/"):
+            raise ValueError(f"Invalid WARC record start: {version[:32]!r}")
+
+        warc_lines, _ = _read_header_lines(stream, CHUNK_SIZE)
+        warc_headers = {}
+        for line in warc_lines:
+            name, _, value = line.partition(b":")
+            warc_headers[name.strip().lower()] = value.strip()
+
+        block_length = int(warc_headers.get(b"content-length", b"0"))
+        record_type = warc_headers.get(b"warc-type")
+        content_type = warc_headers.get(b"content-type", b"")
+
+        if (
+            record_type not in _WARC_RESPONSE_TYPES
+            or not content_type.startswith(b"application/http")
+        ):
+            _skip(stream, block_length)
+            continue
+
+        http_lines, read = _read_header_lines(stream, block_length)
+        _skip(stream, block_length - read)
+
+        if not http_lines:
+            continue
+
+        url = (
+            warc_headers.get(b"warc-target-uri", b"").decode("latin-1") or None
+        )
+
+        # The status line, such as "HTTP/1.1 200 OK".
+        status_line = http_lines[0].decode("latin-1").split(" ", 2)
+
+        if len(status_line) < 2 or not status_line[1].isdigit():
+            yield _invalid_result(
+                url, f"Invalid HTTP status line: {http_lines[0][:32]!r}"
+            )
+            continue
+
+        status_code = int(status_line[1])
+        reason = status_line[2] if len(status_line) > 2 else None
+
+        headers = he.Headers(
+            (name.strip(), value.strip())
+            for name, _, value in (
+                line.decode("latin-1").partition(":")
+                for line in http_lines[1:]
+            )
+        )
+
+        yield _new_result(
+            url,
+            status_code,
+            reason,
+            block_length - read if record_type == b"response" else None,
+            headers,
+        )
+
+
+def iter_archive(
+    path: str,
+    baseline: Any,
+    short: bool = False,
+    archive_format: Optional[str] = None,
+) -> Iterator[dict]:
+    """Analyse the headers of the responses recorded in an archive.
+
+    Args:
+        path:
+          The path to the HAR or WARC archive, possibly gzipped, or "-"
+          for the standard input.
+        baseline:
+          The baseline to compare the headers' values against. It
+          should be compiled, see load_baseline().
+        short:
+          See analyse_headers().
+        archive_format:
+          "har" or "warc", or None to detect it.
+
+    Returns:
+        An iterator over the scan results of the recorded responses,
+        in archive order, see scan_url().
+    """
+    with open_archive(path) as stream:
+        if archive_format is None:
+            archive_format = detect_format(stream)
+
+        if archive_format == "har":
+            responses = iter_har_responses(stream)
+        else:
+            responses = iter_warc_responses(stream)
+
+        for result in responses:
+            if result["error"] is None:
+                result["findings"] = he.analyse_headers(
+                    result["headers"], baseline, short
+                )
+
+            yield result
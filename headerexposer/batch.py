@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+"""Analyse header maps read as JSON lines, as a Unix filter.
+
+The headerexposer.batch module reads records holding header maps, one
+JSON object per line, such as:
+
+{"id": "www.example.com", "headers": {"X-Frame-Options": "DENY"}}
+
+and writes each record back on its own line, with its findings instead
+of its headers. The baseline is loaded once, and both the input and the
+output are buffered, so that millions of records can be piped through
+it. With jobs > 1, the records are analysed by a pool of processes,
+chunk by chunk, and written in input order.
+
+Basic module usage:
+
+>>> import sys
+>>> import headerexposer as he
+>>> from headerexposer.batch import analyse_header_maps
+
+>>> baseline = he.load_baseline("baseline.json", compiled=True)
+
+>>> analyse_header_maps(sys.stdin.buffer, sys.stdout, baseline, short=True)
+
+Process pools must be started from a guarded main module:
+
+>>> if __name__ == "__main__":
+...     analyse_header_maps(sys.stdin.buffer, sys.stdout, baseline, jobs=4)
+"""
+
+__all__ = ["read_header_maps", "analyse_header_maps"]
+
+import collections
+import concurrent.futures
+import io
+import itertools
+import json
+from typing import (
+    Any,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+import headerexposer as he
+
+# The number of lines sent to a worker process at once, see
+# analyse_header_maps(). Large enough for the inter-process overhead to
+# be negligible, small enough for the output to keep flowing.
+CHUNK_SIZE = 1000
+
+# The number of chunks submitted per worker process ahead of the one
+# being written, so that the workers never wait for the writer while
+# the memory stays bounded.
+CHUNKS_AHEAD = 2
+
+# The baseline and short flag of a worker process, see _init_worker().
+_worker_state: Optional[Tuple[Any, bool]] = None
+
+
+def _header_pairs(headers: Any) -> Iterator[Tuple[str, str]]:
+    """Validate a header map, yielding its (name, value) pairs.
+
+    Values may be strings, or lists of strings for repeated headers.
+
+    Raises:
+        ValueError if the header map is invalid.
+    """
+    if not isinstance(headers, dict):
+        raise ValueError('"headers" must be an object.')
+
+    for name, value in headers.items():
+        if isinstance(value, str):
+            yield name, value
+
+        elif isinstance(value, list) and all(
+            isinstance(item, str) for item in value
+        ):
+            for item in value:
+                yield name, item
+
+        else:
+            raise ValueError(
+                f"The value of the {name!r} header must be a string or a"
+                " list of strings."
+            )
+
+
+def read_header_maps(lines: Iterable[bytes], start: int = 1) -> Iterator[dict]:
+    """Parse records holding header maps, one JSON object per line.
+
+    Empty lines are ignored. Invalid lines do not interrupt the
+    reading: they are reported as records with an error.
+
+    Args:
+        lines:
+          The JSON lines, e.g. a file opened in binary mode.
+        start:
+          The number of the first line, reported in the errors.
+
+    Returns:
+        An iterator over the records: the parsed objects, with their
+        "headers" as a Headers instance, and an "error" which is None.
+        For invalid lines, the record is like this:
+        {
+            "line": (int) line number,
+            "headers": (Headers) empty headers,
+            "error": (string) error
+        }
+    """
+    for number, line in enumerate(lines, start):
+        if line.isspace() or line == b"":
+            continue
+
+        try:
+            record = json.loads(line)
+
+            if not isinstance(record, dict):
+                raise ValueError("Expected a JSON object.")
+
+            record["headers"] = he.Headers(
+                _header_pairs(record.get("headers"))
+            )
+            record["error"] = None
+
+        except ValueError as exception:
+            record = {
+                "line": number,
+                "headers": he.Headers(()),
+                "error": f"Line {number}: {exception}",
+            }
+
+        yield record
+
+
+def _analyse_record(record: dict, baseline: Any, short: bool) -> dict:
+    """Replace the headers of a record read by read_header_maps()."""
+    headers = record.pop("headers")
+
+    record["findings"] = (
+        he.analyse_headers(headers, baseline, short)
+        if record["error"] is None
+        else []
+    )
+
+    return record
+
+
+def _init_worker(baseline: Any, short: bool) -> None:
+    """Keep the baseline in a worker process, for all of its chunks.
+
+    With the fork start method, the baseline is inherited as is. With
+    the others, it is pickled once per worker, not once per chunk.
+    """
+    global _worker_state  # pylint: disable=global-statement
+    _worker_state = (baseline, short)
+
+
+def _analyse_chunk(chunk: Tuple[int, List[bytes]]) -> Tuple[int, str]:
+    """Analyse a chunk of lines in a worker process.
+
+    The records are encoded by the worker as well, so that the parent
+    process only has to read the lines and write the results.
+
+    Args:
+        chunk:
+          (int number of the first line, List[bytes] lines)
+
+    Returns:
+        (int number of records, str their JSON lines)
+    """
+    start, lines = chunk
+    baseline, short = _worker_state
+    output = io.StringIO()
+    count = 0
+
+    for record in read_header_maps(lines, start):
+        he.write_jsonl(
+            _analyse_record(record, baseline, short), output, flush=False
+        )
+        count += 1
+
+    return count, output.getvalue()
+
+
+def _iter_chunks(
+    input_file: BinaryIO, size: int
+) -> Iterator[Tuple[int, List[bytes]]]:
+    """Split lines into chunks, see _analyse_chunk()."""
+    start = 1
+
+    while True:
+        lines = list(itertools.islice(input_file, size))
+
+        if not lines:
+            return
+
+        yield start, lines
+        start += len(lines)
+
+
+def _analyse_in_processes(
+    input_file: BinaryIO,
+    output: TextIO,
+    baseline: Any,
+    short: bool,
+    line_buffered: bool,
+    jobs: int,
+) -> int:
+    """Analyse header maps with a pool of processes, see below."""
+    count = 0
+
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=_init_worker, initargs=(baseline, short)
+    ) as executor:
+        pending: collections.deque = collections.deque()
+
+        def write_oldest() -> int:
+            """Write the oldest pending chunk, once it is analysed."""
+            records, lines = pending.popleft().result()
+            output.write(lines)
+
+            if line_buffered:
+                output.flush()
+
+            return records
+
+        for chunk in _iter_chunks(input_file, CHUNK_SIZE):
+            pending.append(executor.submit(_analyse_chunk, chunk))
+
+            if len(pending) > CHUNKS_AHEAD * jobs:
+                count += write_oldest()
+
+        while pending:
+            count += write_oldest()
+
+    return count
+
+
+def analyse_header_maps(
+    input_file: BinaryIO,
+    output: TextIO,
+    baseline: Any,
+    short: bool = False,
+    line_buffered: bool = False,
+    jobs: int = 1,
+) -> int:
+    """Analyse the header maps of JSON lines, writing JSON lines.
+
+    Each output line is the input record, in the same order, with its
+    "headers" replaced by its "findings" (as plain findings, see
+    plain_finding()), and an "error" which is None unless the input
+    line was invalid. Other members, such as an "id", are kept as is.
+
+    Args:
+        input_file:
+          The binary stream of JSON lines to read, see
+          read_header_maps().
+        output:
+          The text stream to write to.
+        baseline:
+          The baseline to compare the headers' values against. It
+          should be compiled, see load_baseline().
+        short:
+          See analyse_headers().
+        line_buffered:
+          If True, each record is flushed as soon as it is written, at
+          the expense of throughput. Otherwise, the output is only
+          flushed when its buffer is full, and at the end. With
+          jobs > 1, records are flushed chunk by chunk.
+        jobs:
+          The number of worker processes analysing the records, at
+          least 1. With 1, the records are analysed by the calling
+          process. Otherwise, the input is split in chunks of
+          CHUNK_SIZE lines, analysed in parallel and written in order.
+
+    Returns:
+        The number of records written.
+
+    Raises:
+        ValueError if jobs is less than 1.
+    """
+    if jobs < 1:
+        raise ValueError("The number of jobs must be at least 1.")
+
+    if jobs != 1:
+        count = _analyse_in_processes(
+            input_file,
+            output,
+            baseline,
+            short,
+            line_buffered,
+            jobs,
+        )
+        output.flush()
+
+        return count
+
+    count = 0
+
+    for record in read_header_maps(input_file):
+        he.write_jsonl(
+            _analyse_record(record, baseline, short),
+            output,
+            flush=line_buffered,
+        )
+        count += 1
+
+    output.flush()
+
+    return count
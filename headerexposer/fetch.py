@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""Fetch responses for their headers, optionally without their bodies.
+
+The headerexposer.fetch module sends the requests of the analyse and
+scan commands and of the HTTP service. As only the headers are
+analysed, it can avoid downloading the responses' bodies:
+
+- headers_only streams the response and closes it as soon as the
+  headers are received, so that a multi-MB page or file download costs
+  no more than its headers;
+- head_first tries a HEAD request first, which servers answer without
+  a body, and falls back to the original method if the HEAD request
+  fails with an error status (many servers reject or mishandle HEAD),
+  without downloading the body either.
+
+In both cases, the response's length is read from its Content-Length
+header instead of being measured. Otherwise, reading the body is timed
+as the "download" phase, see headerexposer.timings.
+
+Security headers are often wrong on the intermediate hops of a redirect
+chain, e.g. on the http:// to https:// or apex to www redirects.
+analyse_redirects() analyses each of them: they are the responses which
+requests followed, and kept in the final response's history, so this
+costs no additional request.
+
+Basic module usage:
+
+>>> import requests
+>>> from headerexposer.fetch import fetch
+
+>>> with requests.Session() as session:
+...     response, length = fetch(
+...         session, {"method": "GET", "url": "https://example.com"},
+...         headers_only=True,
+...     )
+"""
+
+__all__ = ["fetch", "analyse_redirects"]
+
+from typing import Any, List, Optional, Tuple
+
+import requests
+
+import headerexposer as he
+from headerexposer.timings import measure
+
+# The HEAD responses with a status from this one are not trusted to
+# carry the same headers as the original method's: the url is fetched
+# again with the original method.
+HEAD_FALLBACK_STATUS = 400
+
+
+def _content_length(response: requests.Response) -> Optional[int]:
+    """Return the length announced by a response, or None."""
+    try:
+        length = int(response.headers.get("Content-Length", ""))
+
+    except ValueError:
+        return None
+
+    return length if length >= 0 else None
+
+
+def fetch(
+    session: requests.Session,
+    request_arguments: dict,
+    headers_only: bool = False,
+    head_first: bool = False,
+) -> Tuple[requests.Response, Optional[int]]:
+    """Send a request, and return its response and the body's length.
+
+    Args:
+        session:
+          The requests session to use.
+        request_arguments:
+          The keyword arguments to session.request(), including "url"
+          and "method".
+        headers_only:
+          If True, the response's body is not downloaded: the response
+          is streamed, and closed as soon as its headers are received.
+          Its connection is then dropped rather than reused.
+        head_first:
+          If True and the method is GET, a HEAD request is sent first.
+          Its response is returned, unless its status is an error, in
+          which case the GET request is sent, as with headers_only.
+
+    Returns:
+        (requests.Response response, int length or None). The length is
+        the one of the decoded body if it was downloaded. Otherwise, it
+        is the Content-Length of the response (the encoded body's), or
+        None if the response has none, e.g. when it is chunked.
+
+    Raises:
+        requests.RequestException if the request fails.
+    """
+    if head_first and request_arguments.get("method", "GET") == "GET":
+        # Its empty body is read at once, and its connection reused.
+        response = session.request(**dict(request_arguments, method="HEAD"))
+
+        if response.status_code < HEAD_FALLBACK_STATUS:
+            return response, _content_length(response)
+
+        headers_only = True
+
+    if not headers_only:
+        # As requests does without stream, but timing the body apart.
+        response = session.request(stream=True, **request_arguments)
+
+        with measure("download"):
+            return response, len(response.content)
+
+    response = session.request(stream=True, **request_arguments)
+    response.close()
+
+    return response, _content_length(response)
+
+
+def analyse_redirects(
+    response: requests.Response, baseline: Any, short: bool = False
+) -> List[dict]:
+    """Analyse the headers of the redirects which led to a response.
+
+    The redirects were followed by requests over the session's pooled
+    connections, and their bodies read so that their connections are
+    reused: nothing is fetched again.
+
+    Args:
+        response:
+          The final response, as returned by fetch().
+        baseline:
+          The baseline to compare the headers' values against, see
+          analyse_headers().
+        short:
+          See analyse_headers().
+
+    Returns:
+        The redirects, in the order they were followed, each one a dict
+        like this:
+        {
+            "url": (string) url which redirected,
+            "status_code": (int) status_code,
+            "reason": (string) reason,
+            "headers": (dict) response headers,
+            "findings": (list) findings as returned by analyse_headers()
+        }
+    """
+    return [
+        {
+            "url": hop.url,
+            "status_code": hop.status_code,
+            "reason": hop.reason,
+            "headers": hop.headers,
+            "findings": he.analyse_headers(hop.headers, baseline, short),
+        }
+        for hop in response.history
+    ]
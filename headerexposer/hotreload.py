@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""Reload a baseline when its file changes, for long-running processes.
+
+The headerexposer.hotreload module provides BaselineHolder, which keeps
+a compiled baseline in memory and watches its file. When the file
+changes, the new baseline is validated and compiled in a background
+thread, then swapped in at once: analyses keep running on the previous
+baseline in the meantime, and an analysis never mixes both.
+
+Basic module usage:
+
+>>> import headerexposer as he
+>>> from headerexposer.hotreload import BaselineHolder
+
+>>> with BaselineHolder("baseline.json", interval=5) as holder:
+...     findings = holder.analyse_headers(resp.headers, short=True)
+...     print(findings[0]["baseline_version"])
+"""
+
+__all__ = ["BaselineHolder"]
+
+import os
+import threading
+from typing import Iterator, Optional, Tuple
+
+import headerexposer as he
+
+
+def _file_state(path: str) -> Tuple[int, int, int]:
+    """Return what changes when a file is modified or replaced."""
+    stat = os.stat(path)
+
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class BaselineHolder:
+    """A compiled baseline which is reloaded when its file changes.
+
+    The baseline is loaded once when the holder is created, and errors
+    are raised then. Afterwards, check() reloads it if its file changed,
+    which start() does periodically in a background thread.
+
+    Changes are detected in two steps: the file's modification time,
+    size and inode are compared first, so that unchanged files are not
+    even read. Then the content's hash (the baseline's version) is
+    compared, so that touched but identical files are not recompiled.
+
+    A baseline which fails to load (invalid JSON, schema or pattern) is
+    not swapped in: the previous one is kept, and the error is stored in
+    the error attribute until a valid baseline is loaded.
+
+    Attributes:
+        baseline_path:
+          The path to the watched baseline file.
+        error:
+          The exception raised by the last reload, or None if it
+          succeeded.
+    """
+
+    def __init__(
+        self,
+        baseline_path: str,
+        no_colors: bool = False,
+        cache_dir: Optional[str] = None,
+        interval: float = 2.0,
+        limits: Optional[he.MatchLimits] = None,
+    ):
+        """Load the baseline.
+
+        Args:
+            baseline_path:
+              The path to the baseline file to load and watch.
+            no_colors:
+              See load_baseline().
+            cache_dir:
+              See load_baseline().
+            interval:
+              The number of seconds between two checks of the file,
+              once start() is called.
+            limits:
+              The MatchLimits of the analyses, or None, see
+              guard_baseline().
+        """
+        self.baseline_path = baseline_path
+        self.error: Optional[Exception] = None
+
+        self._no_colors = no_colors
+        self._cache_dir = cache_dir
+        self._interval = interval
+        self._limits = limits
+
+        self._file_state = _file_state(baseline_path)
+        self._baseline = self._load()
+
+        # Serializes the reloads, not the analyses.
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load(self) -> he.CompiledBaseline:
+        """Load, validate and compile the baseline file."""
+        baseline = he.load_baseline(
+            self.baseline_path,
+            self._no_colors,
+            compiled=True,
+            cache_dir=self._cache_dir,
+        )
+
+        if self._limits is not None:
+            baseline = he.guard_baseline(baseline, self._limits)
+
+        return baseline
+
+    @property
+    def baseline(self) -> he.CompiledBaseline:
+        """The current compiled baseline.
+
+        Callers doing several analyses which must be consistent with
+        each other should read this once and reuse the result.
+        """
+        return self._baseline
+
+    @property
+    def version(self) -> Optional[str]:
+        """The current baseline's version, see CompiledBaseline."""
+        return self._baseline.version
+
+    def check(self) -> bool:
+        """Reload the baseline if its file changed.
+
+        Returns:
+            True if a new baseline was swapped in, False otherwise.
+        """
+        with self._reload_lock:
+            try:
+                file_state = _file_state(self.baseline_path)
+
+                if file_state == self._file_state:
+                    return False
+
+                # Recorded before reading, so that a change made while
+                # the file is read is caught by the next check.
+                self._file_state = file_state
+
+                with open(self.baseline_path, "rb") as baseline_file:
+                    version = he.baseline_version(baseline_file.read())
+
+                if version == self._baseline.version:
+                    self.error = None
+                    return False
+
+                baseline = self._load()
+
+            except Exception as exception:  # pylint: disable=broad-except
+                self.error = exception
+                return False
+
+            # Assigning a reference is atomic: each analysis sees
+            # either the previous baseline or the new one, entirely.
+            self._baseline = baseline
+            self.error = None
+
+            return True
+
+    def _watch(self) -> None:
+        """Check the baseline file until stop() is called."""
+        while not self._stop.wait(self._interval):
+            self.check()
+
+    def start(self) -> "BaselineHolder":
+        """Start checking the baseline file in a background thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._watch, name="baseline-watcher", daemon=True
+            )
+            self._thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        """Stop the background thread started by start()."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "BaselineHolder":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def iter_findings(
+        self, headers: dict, short: bool = False
+    ) -> Iterator[dict]:
+        """Analyse headers with the current baseline, lazily.
+
+        See headerexposer.iter_findings(). All the findings come from
+        the baseline which was current when this was called, and have
+        its version as "baseline_version".
+        """
+        return he.iter_findings(headers, self._baseline, short)
+
+    def analyse_headers(self, headers: dict, short: bool = False) -> list:
+        """Analyse headers with the current baseline.
+
+        See headerexposer.analyse_headers() and iter_findings().
+        """
+        return he.analyse_headers(headers, self._baseline, short)
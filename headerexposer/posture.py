@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+
+"""Aggregate the findings of many targets into a fleet posture.
+
+The headerexposer.posture module summarizes, for each header of the
+baseline, how a fleet of targets fares: how many targets got each
+rating, how many lack the header, its most common values and its number
+of distinct values. The findings are consumed as they are produced, and
+the memory used does not grow with the number of targets:
+
+- the ratings and absences are counted exactly;
+- the most common values are tracked by a SpaceSaving sketch, which
+  keeps a fixed number of candidates and bounds each count's error;
+- the distinct values are counted by a HyperLogLog sketch, whose
+  relative error is about 1.04 / sqrt(2 ** precision), i.e. 1.6% with
+  the default precision.
+
+Basic module usage:
+
+>>> import headerexposer as he
+>>> from headerexposer.archive import iter_archive
+>>> from headerexposer.posture import PostureAggregator, tabulate_posture
+
+>>> baseline = he.load_baseline("baseline.json", compiled=True)
+
+>>> aggregator = PostureAggregator(top=5)
+>>> for result in iter_archive("crawl.warc.gz", baseline, short=True):
+...     aggregator.add_record(result)
+>>> print(tabulate_posture(aggregator.summary()))
+"""
+
+__all__ = [
+    "SpaceSaving",
+    "HyperLogLog",
+    "PostureAggregator",
+    "tabulate_posture",
+]
+
+import hashlib
+import heapq
+import json
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import headerexposer as he
+
+# The number of candidates kept per most common value reported, see
+# PostureAggregator. The more candidates, the smaller the counts' error
+# on long-tailed value distributions.
+CANDIDATES_PER_VALUE = 10
+
+# The HyperLogLog precision: 2 ** precision one-byte registers are kept
+# per header.
+DEFAULT_PRECISION = 12
+
+# The plain ratings, in the order they are reported.
+RATINGS = ("good", "medium", "bad")
+
+
+class SpaceSaving:
+    """Track the most frequent items of a stream, in bounded memory.
+
+    This is the Space-Saving algorithm (Metwally et al., 2005): at most
+    capacity items are counted. An item which is not counted replaces
+    the one with the smallest count, and inherits that count as its
+    possible overestimation. Any item more frequent than
+    total / capacity is guaranteed to be counted.
+
+    Attributes:
+        capacity:
+          The maximum number of items counted.
+        total:
+          The number of items added.
+    """
+
+    def __init__(self, capacity: int):
+        """Create an empty sketch.
+
+        Args:
+            capacity:
+              The maximum number of items counted, at least 1.
+        """
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1.")
+
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[Any, int] = {}
+        self._errors: Dict[Any, int] = {}
+
+        # (count, order, item) of each counted item, the count being
+        # possibly outdated: it is only refreshed on eviction.
+        self._heap: List[Tuple[int, int, Any]] = []
+        self._order = 0
+
+    def add(self, item: Any) -> None:
+        """Count one occurrence of a hashable item."""
+        self.total += 1
+        counts = self._counts
+
+        if item in counts:
+            counts[item] += 1
+            return
+
+        if len(counts) < self.capacity:
+            counts[item] = 1
+            self._errors[item] = 0
+            self._push(item, 1)
+            return
+
+        # Find the least counted item, refreshing the outdated entries.
+        while True:
+            count, _, evicted = heapq.heappop(self._heap)
+
+            if counts[evicted] == count:
+                break
+
+            self._push(evicted, counts[evicted])
+
+        del counts[evicted]
+        del self._errors[evicted]
+
+        counts[item] = count + 1
+        self._errors[item] = count
+        self._push(item, count + 1)
+
+    def _push(self, item: Any, count: int) -> None:
+        """Add an item's entry to the heap."""
+        # The order breaks ties, so that items are never compared.
+        self._order += 1
+        heapq.heappush(self._heap, (count, self._order, item))
+
+    def most_common(
+        self, n: Optional[int] = None
+    ) -> List[Tuple[Any, int, int]]:
+        """Return the most frequent items.
+
+        Args:
+            n:
+              The number of items to return, or None for all the
+              counted ones.
+
+        Returns:
+            (item, count, error) tuples, by decreasing count. The true
+            number of occurrences of item is between count - error and
+            count.
+        """
+        items = sorted(
+            self._counts.items(), key=lambda item: item[1], reverse=True
+        )
+
+        return [(item, count, self._errors[item]) for item, count in items[:n]]
+
+
+class HyperLogLog:
+    """Estimate the number of distinct strings of a stream.
+
+    This is the HyperLogLog algorithm (Flajolet et al., 2007), with
+    linear counting for small cardinalities. Strings are hashed with
+    BLAKE2b rather than hash(), so that the estimates do not depend on
+    the interpreter's hash randomization.
+
+    Attributes:
+        precision:
+          The number of bits of the hash selecting a register.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        """Create an empty sketch.
+
+        Args:
+            precision:
+              Between 4 and 16: 2 ** precision registers are kept, and
+              the relative error is about 1.04 / sqrt(2 ** precision).
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError("The precision must be between 4 and 16.")
+
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+        self._rank_bits = 64 - precision
+        self._rank_mask = (1 << self._rank_bits) - 1
+
+    def add(self, value: str) -> None:
+        """Add a string to the counted ones."""
+        hashed = int.from_bytes(
+            hashlib.blake2b(
+                value.encode("utf-8", "surrogatepass"), digest_size=8
+            ).digest(),
+            "big",
+        )
+
+        index = hashed >> self._rank_bits
+        rank = self._rank_bits - (hashed & self._rank_mask).bit_length() + 1
+
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self) -> int:
+        """Return the estimated number of distinct strings added."""
+        registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+
+        estimate = (
+            alpha
+            * registers
+            * registers
+            / math.fsum(2.0**-rank for rank in self._registers)
+        )
+
+        zeros = self._registers.count(0)
+
+        if estimate <= 2.5 * registers and zeros:
+            estimate = registers * math.log(registers / zeros)
+
+        return round(estimate)
+
+
+class _HeaderPosture:
+    """The counters and sketches of one header, see PostureAggregator."""
+
+    __slots__ = ("ratings", "absent", "values", "distinct")
+
+    def __init__(self, capacity: int, precision: int):
+        self.ratings = dict.fromkeys(RATINGS, 0)
+        self.absent = 0
+        self.values = SpaceSaving(capacity)
+        self.distinct = HyperLogLog(precision)
+
+
+class PostureAggregator:
+    """Aggregate findings, target by target, into a fleet posture.
+
+    Attributes:
+        top:
+          The number of most common values reported per header.
+        targets:
+          The number of targets whose findings were added.
+        errors:
+          The number of records added with an error, see add_record().
+    """
+
+    def __init__(
+        self,
+        top: int = 10,
+        capacity: Optional[int] = None,
+        precision: int = DEFAULT_PRECISION,
+    ):
+        """Create an empty aggregator.
+
+        Args:
+            top:
+              The number of most common values reported per header.
+            capacity:
+              The number of candidate values tracked per header, see
+              SpaceSaving. Defaults to CANDIDATES_PER_VALUE * top.
+            precision:
+              The precision of the distinct values' count, see
+              HyperLogLog.
+        """
+        self.top = top
+        self.targets = 0
+        self.errors = 0
+
+        self._capacity = capacity or max(1, CANDIDATES_PER_VALUE * top)
+        self._precision = precision
+        self._headers: Dict[str, _HeaderPosture] = {}
+
+    def add(self, findings: Iterable[dict]) -> None:
+        """Add the findings of one target.
+
+        Args:
+            findings:
+              The target's findings, as returned by analyse_headers(),
+              or plain findings, see plain_finding().
+        """
+        self.targets += 1
+
+        for finding in findings:
+            name = finding["header"]
+            header = self._headers.get(name)
+
+            if header is None:
+                header = self._headers[name] = _HeaderPosture(
+                    self._capacity, self._precision
+                )
+
+            value = finding["value"]
+
+            if value is None:
+                header.absent += 1
+                continue
+
+            rating = he.plain_rating(finding["rating"])
+            header.ratings[rating] = header.ratings.get(rating, 0) + 1
+            header.values.add(value)
+            header.distinct.add(value)
+
+    def add_record(self, record: dict) -> None:
+        """Add a scan result or a record holding findings.
+
+        Records with an error, which have no findings, are only counted
+        in errors. The findings of redirects are not added: each target
+        counts once.
+
+        Args:
+            record:
+              A record holding "findings", and possibly an "error", such
+              as a scan result (see scan_url()) or a line written by
+              write_jsonl().
+        """
+        if record.get("error") is not None:
+            self.errors += 1
+            return
+
+        self.add(record["findings"])
+
+    def add_lines(self, lines: Iterable[bytes]) -> None:
+        """Add the records of JSON lines, see add_record().
+
+        Empty lines are ignored, and invalid ones counted in errors.
+
+        Args:
+            lines:
+              The JSON lines, e.g. the output of the scan,
+              analyse-archive or analyse-headers commands in the jsonl
+              format, opened in binary mode.
+        """
+        for line in lines:
+            if line.isspace() or line == b"":
+                continue
+
+            try:
+                record = json.loads(line)
+
+                if not isinstance(record, dict) or not isinstance(
+                    record.get("findings"), list
+                ):
+                    raise ValueError("Expected a record holding findings.")
+
+            except ValueError:
+                self.errors += 1
+                continue
+
+            self.add_record(record)
+
+    def summary(self) -> dict:
+        """Return the fleet posture.
+
+        Returns:
+            A dict like this:
+            {
+                "targets": (int) number of targets,
+                "errors": (int) number of records with an error,
+                "headers": [
+                    {
+                        "header": (string) header_name,
+                        "ratings": (dict) number of targets per rating
+                                   of the header's value, "good",
+                                   "medium" and "bad",
+                        "absent": (int) number of targets lacking it,
+                        "distinct_values": (int) estimated number of
+                                           distinct values,
+                        "top_values": [
+                            {
+                                "value": (string) header_value,
+                                "count": (int) upper bound of its
+                                         number of targets,
+                                "error": (int) maximum overestimation
+                                         of the count
+                            },
+                            ...
+                        ]
+                    },
+                    ...
+                ]
+            }
+            The headers are in the order they were first found, i.e. in
+            baseline order.
+        """
+        return {
+            "targets": self.targets,
+            "errors": self.errors,
+            "headers": [
+                {
+                    "header": name,
+                    "ratings": dict(header.ratings),
+                    "absent": header.absent,
+                    "distinct_values": header.distinct.count(),
+                    "top_values": [
+                        {"value": value, "count": count, "error": error}
+                        for value, count, error in header.values.most_common(
+                            self.top
+                        )
+                    ],
+                }
+                for name, header in self._headers.items()
+            ],
+        }
+
+
+def tabulate_posture(summary: dict, max_width: Optional[int] = None) -> str:
+    """Format a fleet posture as a table, one row per header.
+
+    Args:
+        summary:
+          The fleet posture, as returned by PostureAggregator.summary().
+        max_width:
+          If specified, the top values are wrapped in order to not
+          produce a table much wider than max_width characters.
+
+    Returns:
+        The table, ready for printing. An approximate count, which may
+        be overestimated, is prefixed with "~".
+    """
+    rows = []
+
+    for header in summary["headers"]:
+        rows += [
+            [
+                header["header"],
+                *[str(header["ratings"].get(r, 0)) for r in RATINGS],
+                str(header["absent"]),
+                str(header["distinct_values"]),
+                "\n".join(
+                    f"{'~' if top['error'] else ''}{top['count']}"
+                    f" {top['value']}"
+                    for top in header["top_values"]
+                ),
+            ]
+        ]
+
+    columns = ["Header", "Good", "Medium", "Bad", "Absent", "Distinct"]
+
+    if max_width is not None:
+        # Leave the other columns their natural width.
+        width = max_width - sum(
+            2 + max([len(column)] + [len(row[i]) for row in rows])
+            for i, column in enumerate(columns)
+        )
+
+        for row in rows:
+            row[-1] = "\n".join(
+                he.wrap_and_join(line, width=max(width, 20), sep="\\\n")
+                for line in row[-1].splitlines()
+            )
+
+    table = he.tabulate_rows(rows, columns + ["Top values"])
+
+    return (
+        f"{summary['targets']} targets, {summary['errors']} errors\n\n" + table
+    )
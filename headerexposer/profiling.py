@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+"""Profile the cost of a baseline's patterns over a corpus of headers.
+
+The headerexposer.profiling module tells which patterns of a baseline
+the analyses spend their time in. PatternProfiler analyses header maps
+without any cache, timing every match, search and substitution of every
+pattern, and reports for each pattern its cumulative and worst times.
+
+Baseline patterns are matched against values sent by untrusted servers:
+a pattern whose worst time grows quickly with the value's length (see
+the "max_length" of the report) can be exploited to stall analyses, and
+should be rewritten or guarded, see guard_baseline(). With a guarded
+baseline, the matches interrupted by its match timeout are counted, so
+that even the catastrophic patterns can be profiled on hostile values.
+
+Basic module usage:
+
+>>> import headerexposer as he
+>>> from headerexposer.profiling import PatternProfiler, tabulate_profile
+
+>>> baseline = he.load_baseline("baseline.json", compiled=True)
+>>> baseline = he.guard_baseline(baseline, he.MatchLimits(match_timeout=1))
+
+>>> profiler = PatternProfiler(baseline)
+>>> with open("header-maps.jsonl", "rb") as header_maps:
+...     profiler.add_lines(header_maps)
+>>> print(tabulate_profile(profiler.report(top=10)))
+"""
+
+__all__ = ["PatternProfiler", "tabulate_profile"]
+
+import time
+from typing import Any, Callable, Iterable, List, Optional, Pattern
+
+import headerexposer as he
+from headerexposer.batch import read_header_maps
+
+
+class _PatternCost:
+    """The cost of a pattern's matching, see PatternProfiler."""
+
+    __slots__ = ("calls", "seconds", "max_seconds", "max_length", "timeouts")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.max_length = 0
+        self.timeouts = 0
+
+
+class _ProfiledPattern:
+    """A compiled pattern timing its calls, as used by analyse_header()."""
+
+    __slots__ = ("_pattern", "_cost")
+
+    def __init__(self, pattern: Pattern, cost: _PatternCost):
+        self._pattern = pattern
+        self._cost = cost
+
+    def _timed(self, method: Callable, string: str, *args) -> Any:
+        """Call one of the pattern's methods, timing it."""
+        cost = self._cost
+        start = time.perf_counter()
+
+        try:
+            return method(string, *args)
+
+        except he.MatchTimeout:
+            cost.timeouts += 1
+            raise
+
+        finally:
+            seconds = time.perf_counter() - start
+            cost.calls += 1
+            cost.seconds += seconds
+
+            if seconds > cost.max_seconds:
+                cost.max_seconds = seconds
+                cost.max_length = len(string)
+
+    def match(self, string: str, *args) -> Any:
+        return self._timed(self._pattern.match, string, *args)
+
+    def search(self, string: str, *args) -> Any:
+        return self._timed(self._pattern.search, string, *args)
+
+    def sub(self, repl: Any, string: str, *args) -> str:
+        return self._timed(
+            lambda *sub_args: self._pattern.sub(repl, *sub_args),
+            string,
+            *args,
+        )
+
+
+class PatternProfiler:
+    """Time each pattern of a baseline while analysing header maps.
+
+    The analyses bypass the value and findings caches, so that every
+    value is matched: the report tells what the patterns cost, not what
+    the caches saved. The rules' MatchLimits apply, see
+    guard_baseline().
+
+    Attributes:
+        values:
+          The number of header values analysed.
+        too_long:
+          The number of those which were not matched, as they were
+          longer than the baseline's max_length.
+        errors:
+          The number of invalid records, see add_lines().
+    """
+
+    def __init__(self, baseline: he.CompiledBaseline):
+        """Create a profiler, with all the costs at zero.
+
+        Args:
+            baseline:
+              The compiled baseline to profile, possibly guarded.
+        """
+        self.values = 0
+        self.too_long = 0
+        self.errors = 0
+
+        self._rules: List[he.CompiledHeaderRule] = []
+        # (header name, pattern, cost) of each pattern, in baseline
+        # order.
+        self._costs: List[tuple] = []
+
+        for rule in baseline.headers:
+            costs = [_PatternCost() for _ in rule.patterns]
+
+            self._rules += [
+                rule._replace(
+                    patterns=tuple(
+                        _ProfiledPattern(pattern, cost)
+                        for pattern, cost in zip(rule.patterns, costs)
+                    )
+                )
+            ]
+
+            self._costs += [
+                (rule.name, pattern.pattern, cost)
+                for pattern, cost in zip(rule.patterns, costs)
+            ]
+
+    def add(self, headers: dict) -> None:
+        """Analyse the headers of one target, timing the patterns.
+
+        Args:
+            headers:
+              The headers to analyse, such as he.Headers.
+        """
+        for rule in self._rules:
+            value = headers.get(rule.name)
+
+            if not isinstance(value, str):
+                continue
+
+            self.values += 1
+            limits = rule.limits
+
+            if (
+                limits is not None
+                and limits.max_length is not None
+                and len(value) > limits.max_length
+            ):
+                self.too_long += 1
+                continue
+
+            he.analyse_header(value, rule, cached=False)
+
+    def add_lines(self, lines: Iterable[bytes]) -> None:
+        """Analyse the header maps of JSON lines, see add().
+
+        Args:
+            lines:
+              The JSON lines, in the format read by analyse-headers, see
+              read_header_maps(). Invalid lines are counted in errors.
+        """
+        for record in read_header_maps(lines):
+            if record["error"] is not None:
+                self.errors += 1
+                continue
+
+            self.add(record["headers"])
+
+    def report(self, top: Optional[int] = None) -> dict:
+        """Return the costs of the patterns.
+
+        Args:
+            top:
+              The number of patterns to report, or None for all of them.
+
+        Returns:
+            A dict like this:
+            {
+                "values": (int) number of header values analysed,
+                "too_long": (int) number of those which were not
+                            matched, see MatchLimits,
+                "errors": (int) number of invalid records,
+                "patterns": [
+                    {
+                        "header": (string) header_name,
+                        "pattern": (string) pattern,
+                        "calls": (int) number of matches, searches and
+                                 substitutions,
+                        "seconds": (float) their cumulative time,
+                        "max_seconds": (float) the longest one's time,
+                        "max_length": (int) the length of the value it
+                                      was made on,
+                        "timeouts": (int) number of them interrupted by
+                                    the match timeout
+                    },
+                    ...
+                ]
+            }
+            The patterns are sorted by decreasing cumulative time.
+        """
+        patterns = [
+            {
+                "header": header,
+                "pattern": pattern,
+                "calls": cost.calls,
+                "seconds": cost.seconds,
+                "max_seconds": cost.max_seconds,
+                "max_length": cost.max_length,
+                "timeouts": cost.timeouts,
+            }
+            for header, pattern, cost in self._costs
+        ]
+
+        patterns.sort(key=lambda pattern: pattern["seconds"], reverse=True)
+
+        return {
+            "values": self.values,
+            "too_long": self.too_long,
+            "errors": self.errors,
+            "patterns": patterns[:top],
+        }
+
+
+def tabulate_profile(report: dict, max_width: Optional[int] = None) -> str:
+    """Format the costs of the patterns as a table, one row per pattern.
+
+    Args:
+        report:
+          The costs, as returned by PatternProfiler.report().
+        max_width:
+          If specified, the patterns are wrapped in order to not produce
+          a table much wider than max_width characters.
+
+    Returns:
+        The table, ready for printing.
+    """
+    rows = [
+        [
+            pattern["header"],
+            pattern["pattern"],
+            str(pattern["calls"]),
+            f"{pattern['seconds'] * 1000:.2f}",
+            f"{pattern['max_seconds'] * 1000:.2f}",
+            str(pattern["max_length"]),
+            str(pattern["timeouts"]),
+        ]
+        for pattern in report["patterns"]
+    ]
+
+    columns = [
+        "Header",
+        "Pattern",
+        "Calls",
+        "Total (ms)",
+        "Max (ms)",
+        "Max length",
+        "Timeouts",
+    ]
+
+    if max_width is not None:
+        # Leave the other columns their natural width.
+        width = max_width - sum(
+            2 + max([len(column)] + [len(row[i]) for row in rows])
+            for i, column in enumerate(columns)
+            if i != 1
+        )
+
+        for row in rows:
+            row[1] = he.wrap_and_join(row[1], width=max(width, 20))
+
+    table = he.tabulate_rows(rows, columns)
+
+    return (
+        f"{report['values']} values, {report['too_long']} too long to be"
+        f" matched, {report['errors']} errors\n\n" + table
+    )
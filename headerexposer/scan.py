@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+
+"""Scan many urls' headers concurrently.
+
+The headerexposer.scan module fetches a list of urls with bounded
+concurrency over asyncio, and analyses each response's headers as soon
+as it arrives.
+
+Basic module usage:
+
+>>> import asyncio
+>>> import headerexposer as he
+>>> from headerexposer.scan import scan
+
+>>> baseline = he.load_baseline("baseline.json", compiled=True)
+
+>>> async def main(urls):
+...     async for result in scan(urls, baseline, short=True):
+...         print(result["url"], result["error"])
+...         print(he.tabulate_findings(result["findings"]))
+
+>>> asyncio.run(main(["https://google.com", "https://example.com"]))
+"""
+
+__all__ = ["scan", "iter_scan", "scan_url", "read_urls"]
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import heapq
+import math
+import random
+import time
+import urllib.parse
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+import requests
+
+import headerexposer as he
+from headerexposer.fetch import analyse_redirects, fetch
+from headerexposer.state import ScanState, TargetState
+from headerexposer.timings import (
+    TimedHTTPAdapter,
+    Timings,
+    measure,
+    recording,
+)
+
+# The responses' statuses telling that a host is overloaded or rate
+# limiting: the url is retried later, and the host slowed down.
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# The delay before the first retry of a url, in seconds. It doubles at
+# each retry, up to BACKOFF_MAX, which also caps Retry-After.
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# The number of requests a host may have in flight at first, before its
+# limit adapts.
+INITIAL_HOST_CONCURRENCY = 2
+
+# A host is taken as saturated when its smoothed latency exceeds its
+# lowest latency times LATENCY_TOLERANCE, plus LATENCY_SLACK seconds
+# (against the noise of very fast hosts). Its limit is then multiplied
+# by SATURATION_DECREASE.
+LATENCY_SMOOTHING = 0.2
+LATENCY_TOLERANCE = 2.0
+LATENCY_SLACK = 0.05
+SATURATION_DECREASE = 0.75
+
+# The maximum number of urls read ahead of the requests, so that the
+# hosts which are not saturated always have urls to be scanned.
+LOOKAHEAD = 10000
+
+
+def read_urls(urls_file: TextIO) -> Iterator[str]:
+    """Read urls from a file, one per line.
+
+    Empty lines and lines starting with a # are ignored.
+
+    Args:
+        urls_file:
+          The opened file to read the urls from.
+
+    Returns:
+        An iterator over the urls, read lazily.
+    """
+    for line in urls_file:
+        url = line.strip()
+
+        if url != "" and not url.startswith("#"):
+            yield url
+
+
+def _new_result(url: str) -> dict:
+    """Return an empty scan result for a url."""
+    return {
+        "url": url,
+        "status_code": None,
+        "reason": None,
+        "length": None,
+        "headers": {},
+        "findings": [],
+        "error": None,
+    }
+
+
+def scan_url(
+    session: requests.Session,
+    url: str,
+    baseline: Any,
+    short: bool = False,
+    request_arguments: Optional[dict] = None,
+    headers_only: bool = False,
+    head_first: bool = False,
+    redirect_chain: bool = False,
+) -> dict:
+    """Fetch a single url and analyse its headers.
+
+    Network errors are not raised but reported in the result, so that
+    a single unreachable url does not interrupt a bulk scan.
+
+    Args:
+        session:
+          The requests session to use.
+        url:
+          The url to fetch.
+        baseline:
+          The baseline to compare the headers' values against, see
+          analyse_headers().
+        short:
+          See analyse_headers().
+        request_arguments:
+          Additional keyword arguments to session.request(), such as
+          "method" (defaults to GET), "timeout" or "verify".
+        headers_only:
+          If True, the response's body is not downloaded, see fetch().
+        head_first:
+          If True, a HEAD request is tried first, see fetch().
+        redirect_chain:
+          If True, the headers of the redirects which led to the final
+          response are analysed as well, see analyse_redirects().
+
+    Returns:
+        The scan result, a dict like this:
+        {
+            "url": (string) url,
+            "status_code": (int) status_code or None,
+            "reason": (string) reason or None,
+            "length": (int) length of the response's body or None,
+                      see fetch(),
+            "headers": (dict) response headers,
+            "findings": (list) findings as returned by analyse_headers(),
+            "error": (string) error or None
+        }
+        With redirect_chain, it also holds the "redirects" returned by
+        analyse_redirects(), and the "final_url" of the response.
+    """
+    return _scan_url(
+        session,
+        url,
+        baseline,
+        short,
+        request_arguments,
+        headers_only,
+        head_first,
+        redirect_chain,
+    )[0]
+
+
+def _scan_url(
+    session: requests.Session,
+    url: str,
+    baseline: Any,
+    short: bool,
+    request_arguments: Optional[dict],
+    headers_only: bool,
+    head_first: bool,
+    redirect_chain: bool,
+    previous: Optional[TargetState] = None,
+) -> Tuple[dict, Optional[requests.RequestException]]:
+    """Scan a url, see scan_url().
+
+    Args:
+        previous:
+          The url's state after its previous scan, see scan(). The
+          request is then conditional, and the headers are not analysed
+          if they would get the same findings: the result's "change"
+          is set to "unchanged" instead.
+
+    Returns:
+        (dict result, the exception reported in its error or None)
+    """
+    request_arguments = dict(request_arguments or {})
+    request_arguments.setdefault("method", "GET")
+    request_arguments["url"] = url
+
+    if previous is not None:
+        request_arguments["headers"] = dict(
+            request_arguments.get("headers") or {},
+            **previous.conditional_headers(),
+        )
+
+    result = _new_result(url)
+
+    try:
+        response, length = fetch(
+            session, request_arguments, headers_only, head_first
+        )
+
+    except requests.RequestException as exception:
+        result["error"] = f"{type(exception).__name__}: {exception}"
+        return result, exception
+
+    result["status_code"] = response.status_code
+    result["reason"] = response.reason
+    result["length"] = length
+    result["headers"] = response.headers
+
+    if previous is not None and response.status_code == 304:
+        headers = previous.not_modified_headers(response.headers)
+    else:
+        headers = response.headers
+
+    with measure("analysis"):
+        if previous is not None and previous.is_unchanged(
+            headers, baseline, short, redirect_chain
+        ):
+            result["change"] = "unchanged"
+        else:
+            result["findings"] = he.analyse_headers(headers, baseline, short)
+
+        if redirect_chain:
+            result["final_url"] = response.url
+            result["redirects"] = analyse_redirects(response, baseline, short)
+
+    return result, None
+
+
+def _timed_scan_url(
+    *args: Any,
+) -> Tuple[dict, Optional[requests.RequestException]]:
+    """Scan a url as _scan_url() does, recording its "timings"."""
+    with recording(Timings()) as timings:
+        result, exception = _scan_url(*args)
+
+    result["timings"] = timings
+
+    return result, exception
+
+
+def _host_key(url: str) -> str:
+    """Return the host (and port) a url is sent to, as scheduled."""
+    try:
+        return urllib.parse.urlsplit(url).netloc.lower()
+
+    except ValueError:
+        return ""
+
+
+def _retry_after(result: dict) -> Optional[float]:
+    """Return the delay requested by a Retry-After header, in seconds."""
+    try:
+        return max(0.0, float(result["headers"].get("Retry-After", "")))
+
+    except ValueError:
+        return None
+
+
+class _Host:
+    """The scheduling state of a host, see scan().
+
+    The host's concurrency limit adapts like TCP's congestion window:
+    it grows by about one request per round trip while the host answers
+    quickly, and shrinks when its latency rises well above the lowest
+    observed one (its requests are queuing), or when it fails or asks to
+    slow down (then it is also left alone until ready_at).
+    """
+
+    __slots__ = (
+        "key",
+        "max_concurrency",
+        "limit",
+        "in_flight",
+        "queue",
+        "min_latency",
+        "latency",
+        "ready_at",
+        "runnable",
+        "sleeping",
+    )
+
+    def __init__(self, key: str, max_concurrency: int):
+        self.key = key
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(INITIAL_HOST_CONCURRENCY, max_concurrency))
+        self.in_flight = 0
+        # The (url, attempt) couples waiting to be sent.
+        self.queue: collections.deque = collections.deque()
+        self.min_latency = math.inf
+        self.latency: Optional[float] = None
+        # The monotonic time before which nothing is sent to the host.
+        self.ready_at = 0.0
+        # Whether the host is in the scheduler's runnable queue, or in
+        # its sleeping heap.
+        self.runnable = False
+        self.sleeping = False
+
+    def can_send(self, now: float) -> bool:
+        """Tell whether a request can be sent to the host now."""
+        return (
+            bool(self.queue)
+            and self.in_flight < int(self.limit)
+            and self.ready_at <= now
+        )
+
+    def is_idle(self, now: float) -> bool:
+        """Tell whether the host's state can be forgotten."""
+        return not (
+            self.queue or self.in_flight or self.sleeping or self.runnable
+        ) and (self.ready_at <= now)
+
+    def succeeded(self, latency: float) -> None:
+        """Adapt the limit to a request which succeeded."""
+        self.min_latency = min(self.min_latency, latency)
+
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+        if self.latency > (
+            LATENCY_TOLERANCE * self.min_latency + LATENCY_SLACK
+        ):
+            self.limit = max(1.0, self.limit * SATURATION_DECREASE)
+        else:
+            self.limit = min(
+                float(self.max_concurrency), self.limit + 1 / self.limit
+            )
+
+    def failed(self, now: float, delay: float) -> None:
+        """Back off from a host which failed or asked to slow down."""
+        self.limit = max(1.0, self.limit / 2)
+        self.ready_at = max(self.ready_at, now + delay)
+
+
+async def scan(
+    urls: Iterable[str],
+    baseline: Any,
+    short: bool = False,
+    concurrency: int = 20,
+    request_arguments: Optional[dict] = None,
+    session: Optional[requests.Session] = None,
+    headers_only: bool = False,
+    head_first: bool = False,
+    redirect_chain: bool = False,
+    per_host: int = 6,
+    retries: int = 2,
+    deadline: Optional[float] = None,
+    state: Optional[ScanState] = None,
+    timings: bool = False,
+) -> AsyncIterator[dict]:
+    """Scan urls concurrently and yield their results as they arrive.
+
+    At most `concurrency` requests are in flight at any time, and at
+    most `per_host` to the same host. The blocking requests are run in
+    a pool of threads sharing a single session, hence a single
+    connection pool.
+
+    Each host's limit starts at INITIAL_HOST_CONCURRENCY and adapts to
+    the host (see _Host): it grows while the host answers quickly, and
+    shrinks when its latency rises or when it fails. Urls which fail
+    with a connection error, a timeout or a status in RETRY_STATUSES
+    (e.g. 429 Too Many Requests) are retried after an exponential
+    backoff (or the response's Retry-After), during which their host
+    is left alone. The hosts are served in turn, so that the urls of a
+    slow host do not hold back the others.
+
+    The urls are consumed lazily, up to LOOKAHEAD urls ahead of the
+    requests, and results are yielded in completion order, so that
+    arbitrarily long url lists can be scanned in constant memory.
+
+    Args:
+        urls:
+          The urls to scan. Any iterable, e.g. read_urls(file).
+        baseline:
+          The baseline to compare the headers' values against. It
+          should be compiled, see load_baseline().
+        short:
+          See analyse_headers().
+        concurrency:
+          The maximum number of requests in flight.
+        request_arguments:
+          Additional keyword arguments to session.request(), see
+          scan_url().
+        session:
+          The requests session to use. If None, a session with a
+          connection pool sized for `concurrency` is created, and closed
+          once the scan ends.
+        headers_only:
+          See scan_url().
+        head_first:
+          See scan_url().
+        redirect_chain:
+          See scan_url().
+        per_host:
+          The maximum number of requests in flight to the same host
+          (and port).
+        retries:
+          The maximum number of retries of a url.
+        deadline:
+          The number of seconds after which no request is sent nor
+          retried, or None. The requests in flight are awaited, and the
+          urls not scanned yet are yielded with an error.
+        state:
+          The ScanState of the previous scans, for an incremental scan,
+          or None. The requests are then conditional, the headers are
+          only analysed if they changed, and the results are only
+          yielded if they are new, changed or errors. They are updated
+          in the state, and have a "change", see ScanState.update().
+        timings:
+          If True, the results have the "timings" of their last attempt,
+          see headerexposer.timings. The network phases are only timed
+          if the session's adapters are TimedHTTPAdapter, as the one
+          created when session is None.
+
+    Returns:
+        An asynchronous iterator over the scan results, see scan_url().
+    """
+    owned_session = session is None
+
+    if session is None:
+        session = requests.Session()
+        adapter_class = (
+            TimedHTTPAdapter if timings else requests.adapters.HTTPAdapter
+        )
+        adapter = adapter_class(
+            pool_connections=concurrency, pool_maxsize=concurrency
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    concurrency = max(concurrency, 1)
+    per_host = max(per_host, 1)
+
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    end = None if deadline is None else time.monotonic() + deadline
+
+    url_iterator = iter(urls)
+    exhausted = False
+    hosts: Dict[str, _Host] = {}
+    # The hosts which can be sent a request, served in turn.
+    runnable: collections.deque = collections.deque()
+    # The (ready_at, sequence number, host) of the backing off hosts.
+    sleeping: List[Tuple[float, int, _Host]] = []
+    sequence = 0
+    queued = 0
+    # The requests in flight, and their (host, url, attempt, start time,
+    # previous state).
+    requests_in_flight: Dict[asyncio.Future, tuple] = {}
+
+    def reschedule(host: _Host, now: float) -> None:
+        """Put a host where it belongs: runnable, sleeping or nowhere."""
+        nonlocal sequence
+
+        if host.runnable or host.sleeping or not host.queue:
+            return
+
+        if host.ready_at > now:
+            host.sleeping = True
+            sequence += 1
+            heapq.heappush(sleeping, (host.ready_at, sequence, host))
+
+        elif host.can_send(now):
+            host.runnable = True
+            runnable.append(host)
+
+    def send(host: _Host, now: float) -> None:
+        """Send the next url of a host."""
+        nonlocal queued
+
+        url, attempt = host.queue.popleft()
+        queued -= 1
+        host.in_flight += 1
+        previous = None if state is None else state.get(url)
+
+        future = loop.run_in_executor(
+            executor,
+            functools.partial(
+                _timed_scan_url if timings else _scan_url,
+                session,
+                url,
+                baseline,
+                short,
+                request_arguments,
+                headers_only,
+                head_first,
+                redirect_chain,
+                previous,
+            ),
+        )
+        requests_in_flight[future] = (host, url, attempt, now, previous)
+
+    def retry_delay(
+        result: dict, exception: Optional[Exception], attempt: int
+    ) -> Optional[float]:
+        """Return the delay before retrying a url, or None."""
+        if exception is not None:
+            if not isinstance(
+                exception, (requests.ConnectionError, requests.Timeout)
+            ) or isinstance(exception, requests.exceptions.SSLError):
+                return None
+
+        elif result["status_code"] not in RETRY_STATUSES:
+            return None
+
+        delay = _retry_after(result) if exception is None else None
+
+        if delay is None:
+            # The jitter keeps the retries of a host from synchronizing.
+            delay = BACKOFF_BASE * 2**attempt * random.uniform(0.5, 1.5)
+
+        return min(delay, BACKOFF_MAX)
+
+    def expired_result(url: str) -> dict:
+        """Return the result of a url which was not scanned in time."""
+        result = _new_result(url)
+        result["error"] = "Deadline exceeded, the url was not scanned."
+
+        return result
+
+    try:
+        while True:
+            now = time.monotonic()
+
+            if end is not None and now >= end:
+                break
+
+            while sleeping and sleeping[0][0] <= now:
+                host = heapq.heappop(sleeping)[2]
+                host.sleeping = False
+                reschedule(host, now)
+
+            while not exhausted and queued < LOOKAHEAD:
+                try:
+                    url = next(url_iterator)
+
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                key = _host_key(url)
+                host = hosts.get(key)
+
+                if host is None:
+                    host = hosts[key] = _Host(key, per_host)
+
+                host.queue.append((url, 0))
+                queued += 1
+                reschedule(host, now)
+
+            while runnable and len(requests_in_flight) < concurrency:
+                host = runnable.popleft()
+                host.runnable = False
+
+                # The host may have failed, or its limit shrunk, while it
+                # was waiting for its turn: it then sleeps until ready_at,
+                # or waits for its requests in flight.
+                if host.can_send(now):
+                    send(host, now)
+
+                reschedule(host, now)
+
+            if not requests_in_flight and not sleeping and queued == 0:
+                break
+
+            # Wake up for the next backing off host, or at the deadline.
+            timeouts = [sleeping[0][0]] if sleeping else []
+            if end is not None:
+                timeouts.append(end)
+            timeout = max(min(timeouts) - now, 0) if timeouts else None
+
+            if not requests_in_flight:
+                await asyncio.sleep(timeout)
+                continue
+
+            done, _ = await asyncio.wait(
+                requests_in_flight,
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            now = time.monotonic()
+
+            for future in done:
+                host, url, attempt, started, previous = requests_in_flight.pop(
+                    future
+                )
+                host.in_flight -= 1
+                result, exception = future.result()
+
+                delay = None
+                if attempt < retries:
+                    delay = retry_delay(result, exception, attempt)
+
+                if delay is not None and (end is None or now + delay < end):
+                    host.failed(now, delay)
+                    host.queue.appendleft((url, attempt + 1))
+                    queued += 1
+
+                else:
+                    if exception is None and (
+                        result["status_code"] not in RETRY_STATUSES
+                    ):
+                        host.succeeded(now - started)
+                    else:
+                        host.failed(now, 0)
+
+                    if state is None or state.update(
+                        result, previous, baseline, short, redirect_chain
+                    ):
+                        yield result
+
+                reschedule(host, now)
+
+                if host.is_idle(now):
+                    del hosts[host.key]
+
+        # The deadline passed: wait for the requests in flight, then
+        # report the urls which were not scanned.
+        while requests_in_flight:
+            done, _ = await asyncio.wait(
+                requests_in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for future in done:
+                previous = requests_in_flight.pop(future)[4]
+                result = future.result()[0]
+
+                if state is None or state.update(
+                    result, previous, baseline, short, redirect_chain
+                ):
+                    yield result
+
+        for host in hosts.values():
+            for url, _ in host.queue:
+                yield expired_result(url)
+
+        for url in url_iterator:
+            yield expired_result(url)
+
+    finally:
+        executor.shutdown(wait=False)
+
+        if owned_session:
+            session.close()
+
+
+def iter_scan(urls: Iterable[str], baseline: Any, **kwargs) -> Iterator[dict]:
+    """Scan urls concurrently, as a regular iterator.
+
+    This is the synchronous version of scan(), for callers which are
+    not coroutines: it runs scan() in its own event loop, which only
+    progresses while the next result is awaited. Requests already in
+    flight keep running in the meantime.
+
+    Args:
+        urls:
+          The urls to scan.
+        baseline:
+          The baseline to compare the headers' values against.
+        kwargs:
+          See scan().
+
+    Returns:
+        An iterator over the scan results, see scan_url().
+    """
+    loop = asyncio.new_event_loop()
+    results = scan(urls, baseline, **kwargs)
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+"""Serve headers analyses over HTTP.
+
+The headerexposer.serve module runs a resident HTTP service, which
+keeps the compiled baseline and a pool of outgoing connections warm,
+so that each analysis only costs the analysis itself. Requests are
+handled concurrently, one thread each.
+
+Endpoints:
+
+POST /analyse/url
+    Fetch a url and analyse its headers. The JSON body is like
+    {"url": "https://example.com", "short": true}, where "short" is
+    optional. The response is a scan result with plain findings, see
+    headerexposer.scan.scan_url() and plain_finding(), including the
+    analysed "redirects" if the server follows redirect chains. Its
+    status is 502 if the url could not be fetched.
+
+POST /analyse/headers
+    Analyse a header map. The JSON body is like
+    {"headers": {"X-Frame-Options": "DENY"}, "short": true}, and the
+    response is like {"findings": [...]}.
+
+GET /health
+    Return the baseline's version, and the error preventing it from
+    being reloaded, if any.
+
+GET /metrics
+    Return the time spent in each phase of the analyses (DNS, connect,
+    TLS, time to first byte, download, analysis and render), the
+    analyses' outcomes and the caches' counters, in the Prometheus text
+    exposition format, see headerexposer.timings.
+
+Basic module usage:
+
+>>> from headerexposer.hotreload import BaselineHolder
+>>> from headerexposer.serve import make_server
+
+>>> with BaselineHolder("baseline.json", no_colors=True) as holder:
+...     make_server("127.0.0.1", 8080, holder).serve_forever()
+"""
+
+__all__ = ["AnalysisServer", "AnalysisRequestHandler", "make_server"]
+
+import http.cookiejar
+import http.server
+import io
+import json
+import urllib.parse
+from typing import Optional
+
+import requests
+
+import headerexposer as he
+from headerexposer.hotreload import BaselineHolder
+from headerexposer.scan import scan_url
+from headerexposer.timings import Metrics, TimedHTTPAdapter, Timings, recording
+
+# The maximum size of a request's body, in bytes.
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class AnalysisServer(http.server.ThreadingHTTPServer):
+    """The HTTP server, holding the state shared by the handlers.
+
+    Attributes:
+        holder:
+          The BaselineHolder providing the baseline.
+        session:
+          The requests session used to fetch urls.
+        short:
+          The default for the requests' "short" parameter.
+        request_arguments:
+          Additional keyword arguments to session.request(), see
+          scan_url().
+        headers_only:
+          Whether the urls' bodies are left undownloaded, see fetch().
+        head_first:
+          Whether a HEAD request is tried first, see fetch().
+        redirect_chain:
+          Whether the redirects are analysed as well, see scan_url().
+        metrics:
+          The Metrics of the analyses served.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        server_address: tuple,
+        holder: BaselineHolder,
+        session: requests.Session,
+        short: bool = False,
+        request_arguments: Optional[dict] = None,
+        headers_only: bool = False,
+        head_first: bool = False,
+        redirect_chain: bool = False,
+    ):
+        self.holder = holder
+        self.session = session
+        self.short = short
+        self.request_arguments = request_arguments or {}
+        self.headers_only = headers_only
+        self.head_first = head_first
+        self.redirect_chain = redirect_chain
+        self.metrics = Metrics()
+
+        super().__init__(server_address, AnalysisRequestHandler)
+
+
+class AnalysisRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handle the requests to the analysis endpoints."""
+
+    # Keep the clients' connections alive between requests, and do not
+    # let Nagle's algorithm delay the body, sent after the headers.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server_version = he.__title__
+
+    server: AnalysisServer
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve GET /health and /metrics."""
+        path = urllib.parse.urlsplit(self.path).path
+
+        if path == "/metrics":
+            self.send_body(
+                200,
+                self.server.metrics.exposition().encode(),
+                "text/plain; version=0.0.4; charset=utf-8",
+            )
+            return
+
+        if path != "/health":
+            self.send_json(404, {"error": "Not found."})
+            return
+
+        error = self.server.holder.error
+
+        self.send_json(
+            200,
+            {
+                "baseline_version": self.server.holder.version,
+                "baseline_error": None if error is None else str(error),
+            },
+        )
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Serve POST /analyse/url and /analyse/headers."""
+        path = urllib.parse.urlsplit(self.path).path
+
+        if path not in ("/analyse/url", "/analyse/headers"):
+            self.send_json(404, {"error": "Not found."})
+            return
+
+        try:
+            body = self.read_json()
+            short = body.get("short", self.server.short)
+
+            if not isinstance(short, bool):
+                raise ValueError('"short" must be a boolean.')
+
+            if path == "/analyse/url":
+                self.analyse_url(body, short)
+            else:
+                self.analyse_headers(body, short)
+
+        except ValueError as exception:
+            self.send_json(400, {"error": str(exception)})
+
+    def analyse_url(self, body: dict, short: bool) -> None:
+        """Fetch body["url"] and send its scan result."""
+        url = body.get("url")
+
+        if not isinstance(url, str) or url == "":
+            raise ValueError('"url" must be a non-empty string.')
+
+        with recording(Timings()) as timings:
+            result = scan_url(
+                self.server.session,
+                url,
+                self.server.holder.baseline,
+                short,
+                self.server.request_arguments,
+                self.server.headers_only,
+                self.server.head_first,
+                self.server.redirect_chain,
+            )
+
+        self.send_record(
+            200 if result["error"] is None else 502, result, timings
+        )
+        self.server.metrics.observe(timings, result)
+
+    def analyse_headers(self, body: dict, short: bool) -> None:
+        """Analyse body["headers"] and send the findings."""
+        headers = body.get("headers")
+
+        if not isinstance(headers, dict) or not all(
+            isinstance(value, str) for value in headers.values()
+        ):
+            raise ValueError(
+                '"headers" must be an object of string header values.'
+            )
+
+        timings = Timings()
+
+        with timings.measure("analysis"):
+            findings = self.server.holder.analyse_headers(
+                he.Headers(headers.items()), short
+            )
+
+        self.send_record(200, {"findings": findings}, timings)
+        self.server.metrics.observe(timings)
+
+    def read_json(self) -> dict:
+        """Read and parse the request's JSON object body.
+
+        Raises:
+            ValueError if the body is missing, too large or invalid.
+        """
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise ValueError("Content-Length is required.") from None
+
+        if not 0 <= length <= MAX_BODY_SIZE:
+            # The body is not read, so the connection cannot be reused.
+            self.close_connection = True
+            raise ValueError(
+                f"The body must be at most {MAX_BODY_SIZE} bytes."
+            )
+
+        body = json.loads(self.rfile.read(length) or b"null")
+
+        if not isinstance(body, dict):
+            raise ValueError("The body must be a JSON object.")
+
+        return body
+
+    def send_record(self, status: int, record: dict, timings: Timings) -> None:
+        """Send a record, with plain findings, as JSON.
+
+        Its encoding is timed as the "render" phase of timings.
+        """
+        buffer = io.StringIO()
+
+        with timings.measure("render"):
+            he.write_jsonl(record, buffer)
+
+        self.send_body(status, buffer.getvalue().encode())
+
+    def send_json(self, status: int, obj: dict) -> None:
+        """Send an object as JSON."""
+        self.send_body(status, (json.dumps(obj) + "\n").encode())
+
+    def send_body(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str = "application/json",
+    ) -> None:
+        """Send a response, JSON by default."""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(
+    host: str,
+    port: int,
+    holder: BaselineHolder,
+    short: bool = False,
+    request_arguments: Optional[dict] = None,
+    pool_size: int = 20,
+    headers_only: bool = False,
+    head_first: bool = False,
+    redirect_chain: bool = False,
+) -> AnalysisServer:
+    """Create the analysis server, ready to serve_forever().
+
+    Args:
+        host:
+          The address to listen on.
+        port:
+          The port to listen on, or 0 for any free port.
+        holder:
+          The BaselineHolder providing the baseline. It should be loaded
+          with no_colors, as the findings are sent without colors
+          anyway.
+        short:
+          The default for the requests' "short" parameter, see
+          analyse_headers().
+        request_arguments:
+          Additional keyword arguments to session.request() when
+          fetching urls, see scan_url().
+        pool_size:
+          The maximum number of connections kept alive per host.
+        headers_only:
+          If True, the urls' bodies are not downloaded, see fetch().
+        head_first:
+          If True, a HEAD request is tried first, see fetch().
+        redirect_chain:
+          If True, the redirects are analysed as well, see scan_url().
+
+    Returns:
+        The AnalysisServer, already listening.
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # Cookies set by an analysed website must not be sent back in the
+    # next analyses, which would no longer be independent.
+    session.cookies.set_policy(
+        http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+    )
+
+    return AnalysisServer(
+        (host, port),
+        holder,
+        session,
+        short,
+        request_arguments,
+        headers_only,
+        head_first,
+        redirect_chain,
+    )
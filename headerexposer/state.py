@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+"""Keep the state of scanned urls, for incremental rescans.
+
+The headerexposer.state module stores, for each scanned url, its last
+security headers (the values of the baseline's headers), its ETag and
+Last-Modified validators, and a hash of its findings, in a local SQLite
+database. When the same urls are scanned again, e.g. daily:
+
+- the requests are conditional (If-None-Match, If-Modified-Since), so
+  that unchanged resources may be answered with a bodiless 304. The
+  security headers a 304 response does not repeat are taken from the
+  state: a header removed along with a 304 goes unnoticed until the
+  resource itself changes;
+- the headers are not analysed again if neither the security headers,
+  the baseline nor the analysis options (short or detailed, redirect
+  chain) changed;
+- only the urls whose findings changed are reported.
+
+Basic module usage:
+
+>>> import headerexposer as he
+>>> from headerexposer.scan import iter_scan
+>>> from headerexposer.state import ScanState
+
+>>> baseline = he.load_baseline("baseline.json", compiled=True)
+
+>>> with ScanState("state.sqlite3") as state:
+...     for result in iter_scan(urls, baseline, state=state):
+...         print(result["url"], result["change"])
+...     print(state.counts)
+"""
+
+__all__ = ["TargetState", "ScanState", "security_headers"]
+
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+import headerexposer as he
+
+# The number of updates after which they are committed, see
+# ScanState.update().
+COMMIT_INTERVAL = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    headers TEXT NOT NULL,
+    baseline_version TEXT,
+    findings_hash TEXT NOT NULL,
+    scanned_at REAL NOT NULL,
+    options TEXT
+)
+"""
+
+
+class TargetState(NamedTuple):
+    """The state of a url after its last scan.
+
+    Attributes:
+        url:
+          The scanned url.
+        etag:
+          The response's ETag, or None.
+        last_modified:
+          The response's Last-Modified, or None.
+        headers:
+          The response's security headers, as a canonical JSON string,
+          see security_headers().
+        baseline_version:
+          The version of the baseline the findings were made with.
+        findings_hash:
+          The hash of the findings, see _findings_hash().
+        options:
+          The analysis options the findings were made with, see
+          _analysis_options(), or None if they are unknown.
+    """
+
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    headers: str
+    baseline_version: Optional[str]
+    findings_hash: str
+    options: Optional[str] = None
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Return the headers making a request conditional on a change."""
+        headers = {}
+
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+    def not_modified_headers(self, headers: Any) -> he.Headers:
+        """Return the security headers of a 304 Not Modified response.
+
+        Such a response need not repeat the security headers, which are
+        then taken from the stored ones. Those it does repeat (as nginx
+        does, for instance) replace the stored ones.
+
+        Args:
+            headers:
+              The 304 response's headers.
+
+        Returns:
+            The security headers, for analyse_headers().
+        """
+        values = (
+            (name, headers.get(name, value))
+            for name, value in json.loads(self.headers).items()
+        )
+
+        return he.Headers(
+            (name, value) for name, value in values if value is not None
+        )
+
+    def is_unchanged(
+        self,
+        headers: Any,
+        baseline: Any,
+        short: bool = False,
+        redirect_chain: bool = False,
+    ) -> bool:
+        """Tell whether headers would get the same findings as stored.
+
+        This is the case if the security headers, the baseline and the
+        analysis options are the same as when the findings were made.
+        A baseline without a version is never taken as unchanged, nor
+        are the results of a redirect chain, whose redirects' headers
+        are not stored.
+
+        Args:
+            headers:
+              The response's headers.
+            baseline:
+              The baseline the findings would be made with.
+            short:
+              See analyse_headers().
+            redirect_chain:
+              See scan_url().
+        """
+        version = getattr(baseline, "version", None)
+
+        return (
+            not redirect_chain
+            and version is not None
+            and version == self.baseline_version
+            and _analysis_options(short, redirect_chain) == self.options
+            and security_headers(headers, baseline) == self.headers
+        )
+
+
+def security_headers(headers: Any, baseline: Any) -> str:
+    """Return the values of the baseline's headers, as canonical JSON.
+
+    Only these headers can change the findings: the others, such as
+    dates or cookies, are left out.
+
+    Args:
+        headers:
+          The response's headers.
+        baseline:
+          The baseline, compiled or not.
+
+    Returns:
+        A JSON object of each baseline header's value (null if absent),
+        in baseline order.
+    """
+    if isinstance(baseline, he.CompiledBaseline):
+        names = [rule.name for rule in baseline.headers]
+    else:
+        names = [header["name"] for header in baseline["headers"]]
+
+    return json.dumps(
+        {name: headers.get(name) for name in names}, ensure_ascii=False
+    )
+
+
+def _analysis_options(short: bool, redirect_chain: bool) -> str:
+    """Return the analysis options findings are made with, as stored."""
+    return json.dumps({"short": short, "redirect_chain": redirect_chain})
+
+
+def _findings_hash(findings: list, redirects: Optional[list] = None) -> str:
+    """Return a hash of plain findings, ignoring the baseline version.
+
+    A new baseline version which does not change the findings does not
+    make them reported again. The findings of the redirects, if any,
+    are part of the hash, see analyse_redirects().
+    """
+
+    def plain_content(findings: list) -> list:
+        return [
+            [
+                finding["header"],
+                finding["value"],
+                finding["rating"],
+                finding["explanations"],
+            ]
+            for finding in map(he.plain_finding, findings)
+        ]
+
+    content = plain_content(findings)
+
+    if redirects is not None:
+        content = [
+            content,
+            [
+                [redirect["url"], plain_content(redirect["findings"])]
+                for redirect in redirects
+            ],
+        ]
+
+    return hashlib.sha256(
+        json.dumps(content, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+class ScanState:
+    """The state of scanned urls, in a SQLite database.
+
+    The database must only be used from one thread at a time: scan()
+    reads and updates it from its event loop, never from the threads
+    fetching the urls. Updates are committed every COMMIT_INTERVAL
+    updates and when the state is closed.
+
+    Attributes:
+        path:
+          The path to the database file.
+        counts:
+          The number of results of each kind of change seen by
+          update(): "new", "changed", "unchanged" and "error".
+    """
+
+    def __init__(self, path: str):
+        """Open (or create) the state database.
+
+        Args:
+            path:
+              The path to the SQLite database file.
+        """
+        self.path = path
+        self.counts = {"new": 0, "changed": 0, "unchanged": 0, "error": 0}
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        self._uncommitted = 0
+
+        # The databases created before the options were stored get the
+        # column, and their urls are analysed again once.
+        columns = [
+            row[1]
+            for row in self._connection.execute("PRAGMA table_info(targets)")
+        ]
+        if "options" not in columns:
+            self._connection.execute(
+                "ALTER TABLE targets ADD COLUMN options TEXT"
+            )
+
+    def get(self, url: str) -> Optional[TargetState]:
+        """Return the state of a url, or None if it was never scanned."""
+        row = self._connection.execute(
+            "SELECT url, etag, last_modified, headers, baseline_version,"
+            " findings_hash, options FROM targets WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+        return None if row is None else TargetState(*row)
+
+    def update(
+        self,
+        result: dict,
+        previous: Optional[TargetState],
+        baseline: Any,
+        short: bool = False,
+        redirect_chain: bool = False,
+    ) -> bool:
+        """Record a scan result, and tell whether it should be reported.
+
+        Args:
+            result:
+              A scan result, see scan_url(), made with previous as its
+              state. Its "change" is set to "new", "changed" or
+              "unchanged", or None if it has an error, in which case the
+              stored state is kept. A "change" already set to
+              "unchanged" tells that its headers were not analysed.
+            previous:
+              The url's state before the scan, or None.
+            baseline:
+              The baseline the result was made with.
+            short:
+              Whether the result was made in short mode, see
+              analyse_headers().
+            redirect_chain:
+              Whether the result has the redirects' findings, see
+              scan_url().
+
+        Returns:
+            True if the result is new, changed or an error, False if
+            its findings are the same as in the previous scan.
+        """
+        if result["error"] is not None:
+            result["change"] = None
+            self.counts["error"] += 1
+            return True
+
+        headers = result["headers"]
+        not_modified = previous is not None and result["status_code"] == 304
+
+        if result.get("change") == "unchanged":
+            findings_hash = previous.findings_hash
+        else:
+            findings_hash = _findings_hash(
+                result["findings"], result.get("redirects")
+            )
+
+        if previous is None:
+            change = "new"
+        elif findings_hash == previous.findings_hash:
+            change = "unchanged"
+        else:
+            change = "changed"
+
+        # A 304 response may not repeat the security headers, nor the
+        # validators.
+        if not_modified:
+            security = security_headers(
+                previous.not_modified_headers(headers), baseline
+            )
+            etag = headers.get("ETag") or previous.etag
+            last_modified = (
+                headers.get("Last-Modified") or previous.last_modified
+            )
+        else:
+            security = security_headers(headers, baseline)
+            etag = headers.get("ETag")
+            last_modified = headers.get("Last-Modified")
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO targets (url, etag, last_modified,"
+            " headers, baseline_version, findings_hash, scanned_at, options)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                result["url"],
+                etag,
+                last_modified,
+                security,
+                getattr(baseline, "version", None),
+                findings_hash,
+                time.time(),
+                _analysis_options(short, redirect_chain),
+            ),
+        )
+
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+        result["change"] = change
+        self.counts[change] += 1
+
+        return change != "unchanged"
+
+    def commit(self) -> None:
+        """Commit the pending updates."""
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        """Commit the pending updates and close the database."""
+        self.commit()
+        self._connection.close()
+
+    def __enter__(self) -> "ScanState":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
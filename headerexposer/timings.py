@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+
+"""Time the phases of analyses, and expose them as metrics.
+
+The headerexposer.timings module tells where the time of an analysis
+goes. While a Timings is being recorded (see recording()), the phases
+run by the current thread add their durations to it:
+
+- "baseline": loading the baseline (by the CLI only);
+- "dns", "connect" and "tls": resolving the host, establishing the TCP
+  connection and the TLS handshake, timed by the connections of a
+  TimedHTTPAdapter. They are absent when a pooled connection is reused;
+- "ttfb": from sending the request to receiving the response's headers,
+  also timed by a TimedHTTPAdapter;
+- "download": reading the response's body, see fetch();
+- "analysis": analysing the headers, including the redirects';
+- "render": formatting the findings for the output.
+
+A phase run several times for a target, e.g. once per redirect, adds
+up. Metrics aggregates the Timings of many targets, with the caches'
+counters, in the Prometheus text exposition format.
+
+Basic module usage:
+
+>>> import requests
+>>> from headerexposer.scan import scan_url
+>>> from headerexposer.timings import (
+...     Metrics, TimedHTTPAdapter, Timings, recording
+... )
+
+>>> session = requests.Session()
+>>> session.mount("http://", TimedHTTPAdapter())
+>>> session.mount("https://", TimedHTTPAdapter())
+>>> metrics = Metrics()
+
+>>> timings = Timings()
+>>> with recording(timings):
+...     result = scan_url(session, "https://example.com", baseline)
+>>> metrics.observe(timings, result)
+>>> print(timings, metrics.exposition(), sep="\\n")
+"""
+
+__all__ = [
+    "PHASES",
+    "Timings",
+    "recording",
+    "current",
+    "measure",
+    "TimedHTTPAdapter",
+    "Metrics",
+]
+
+import contextlib
+import socket
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+import urllib3  # type: ignore
+from urllib3.util.connection import allowed_gai_family  # type: ignore
+
+import headerexposer as he
+
+# The phases, in the order they happen.
+PHASES = (
+    "baseline",
+    "dns",
+    "connect",
+    "tls",
+    "ttfb",
+    "download",
+    "analysis",
+    "render",
+)
+
+# The upper bounds of the phases' histogram buckets, in seconds.
+BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# The Timings being recorded by each thread, see recording().
+_local = threading.local()
+
+
+class Timings(dict):
+    """The seconds spent in each phase of a target's analysis.
+
+    This is a dict of {phase: seconds}, in the order the phases were
+    first run, hence ready to be written as JSON or tabulated.
+    """
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Add the duration of a phase."""
+        self[phase] = self.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Time the enclosed block as a phase."""
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def recording(timings: Optional[Timings]) -> Iterator[Optional[Timings]]:
+    """Record the phases run by the current thread in timings.
+
+    Args:
+        timings:
+          The Timings to add the phases to, or None to record nothing,
+          e.g. when the timings were not asked for.
+    """
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+
+    try:
+        yield timings
+
+    finally:
+        _local.timings = previous
+
+
+def current() -> Optional[Timings]:
+    """Return the Timings recorded by the current thread, or None."""
+    return getattr(_local, "timings", None)
+
+
+@contextlib.contextmanager
+def measure(phase: str) -> Iterator[None]:
+    """Time the enclosed block as a phase, if timings are recorded."""
+    timings = current()
+
+    if timings is None:
+        yield
+        return
+
+    with timings.measure(phase):
+        yield
+
+
+def _name_resolution_error(
+    host: str,
+    connection: urllib3.connection.HTTPConnection,
+    exception: socket.gaierror,
+) -> Exception:
+    """Return the error urllib3 raises when a host cannot be resolved.
+
+    urllib3 1.x has no NameResolutionError, and raises its base class
+    NewConnectionError instead.
+    """
+    if hasattr(urllib3.exceptions, "NameResolutionError"):
+        return urllib3.exceptions.NameResolutionError(
+            host, connection, exception
+        )
+
+    return urllib3.exceptions.NewConnectionError(
+        connection, f"Failed to establish a new connection: {exception}"
+    )
+
+
+class _TimedConnectionMixin:
+    """Time the DNS resolution, the connection and the request.
+
+    The host is resolved before urllib3 connects to it, so that both
+    are timed apart: urllib3 is then given each resolved address in
+    turn, the host being restored once connected, for TLS's SNI and
+    certificate verification.
+    """
+
+    host: str
+    port: int
+    _request_sent_at: Optional[float] = None
+
+    def _new_conn(self) -> socket.socket:
+        timings = current()
+
+        if timings is None:
+            return super()._new_conn()  # type: ignore[misc]
+
+        # urllib3 connects to _dns_host, which the host property sets,
+        # and which keeps the trailing dot of a fully qualified name.
+        host = getattr(self, "_dns_host", self.host)
+
+        with timings.measure("dns"):
+            try:
+                addresses = socket.getaddrinfo(
+                    host,
+                    self.port,
+                    allowed_gai_family(),
+                    socket.SOCK_STREAM,
+                )
+
+            except socket.gaierror as exception:
+                raise _name_resolution_error(
+                    host, self, exception
+                ) from exception
+
+        error = None
+
+        try:
+            with timings.measure("connect"):
+                for address in dict.fromkeys(a[4][0] for a in addresses):
+                    self.host = address
+
+                    try:
+                        return super()._new_conn()  # type: ignore[misc]
+
+                    except urllib3.exceptions.HTTPError as exception:
+                        error = exception
+
+                raise error
+
+        finally:
+            self.host = host
+
+    def request(self, *args, **kwargs):
+        self._request_sent_at = time.perf_counter()
+
+        return super().request(*args, **kwargs)  # type: ignore[misc]
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)  # type: ignore[misc]
+        timings = current()
+
+        if timings is not None and self._request_sent_at is not None:
+            timings.add("ttfb", time.perf_counter() - self._request_sent_at)
+
+        self._request_sent_at = None
+
+        return response
+
+
+class _TimedHTTPConnection(
+    _TimedConnectionMixin, urllib3.connection.HTTPConnection
+):
+    """An HTTP connection timing its phases."""
+
+
+class _TimedHTTPSConnection(
+    _TimedConnectionMixin, urllib3.connection.HTTPSConnection
+):
+    """An HTTPS connection timing its phases, and its TLS handshake."""
+
+    def connect(self) -> None:
+        timings = current()
+
+        if timings is None:
+            super().connect()
+            return
+
+        # The handshake is what connect() adds to _new_conn(), which
+        # records its own phases (and, through a proxy, the tunnel).
+        before = timings.get("dns", 0.0) + timings.get("connect", 0.0)
+        start = time.perf_counter()
+
+        super().connect()
+
+        after = timings.get("dns", 0.0) + timings.get("connect", 0.0)
+        timings.add("tls", time.perf_counter() - start - (after - before))
+
+
+class _TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+_TIMED_POOL_CLASSES = {
+    "http": _TimedHTTPConnectionPool,
+    "https": _TimedHTTPSConnectionPool,
+}
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """A requests adapter whose connections time their phases.
+
+    Outside of recording(), the connections behave as usual, for the
+    cost of a thread-local lookup.
+    """
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+
+        return manager
+
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(name: str, value: float, **labels: str) -> str:
+    """Format a Prometheus sample."""
+    formatted_labels = ",".join(
+        f'{label}="{_escape_label(label_value)}"'
+        for label, label_value in labels.items()
+    )
+
+    return f"headerexposer_{name}{{{formatted_labels}}} {value!r}"
+
+
+class Metrics:
+    """Aggregate the Timings of many targets, as Prometheus metrics.
+
+    The metrics are updated by observe(), which is thread-safe, and
+    exposed by exposition(), e.g. on a /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {phase: [count per bucket..., count, sum]}
+        self._phases: Dict[str, List[float]] = {}
+        self._targets = {"ok": 0, "error": 0}
+        self._responses: Dict[str, int] = {}
+
+    def observe(self, timings: Timings, result: Optional[dict] = None) -> None:
+        """Add the timings of a target, and the outcome of its result.
+
+        Args:
+            timings:
+              The target's timings.
+            result:
+              The target's scan result (see scan_url()), counted by
+              outcome and status class, or None.
+        """
+        with self._lock:
+            for phase, seconds in timings.items():
+                histogram = self._phases.get(phase)
+
+                if histogram is None:
+                    histogram = self._phases[phase] = [0] * (len(BUCKETS) + 2)
+
+                for index, bound in enumerate(BUCKETS):
+                    if seconds <= bound:
+                        histogram[index] += 1
+
+                histogram[-2] += 1
+                histogram[-1] += seconds
+
+            if result is None:
+                return
+
+            if result.get("error") is not None:
+                self._targets["error"] += 1
+                return
+
+            self._targets["ok"] += 1
+            status_class = f"{result['status_code'] // 100}xx"
+            self._responses[status_class] = (
+                self._responses.get(status_class, 0) + 1
+            )
+
+    def exposition(self) -> str:
+        """Return the metrics in the Prometheus text exposition format.
+
+        The caches' counters are those of the whole process, see
+        findings_cache_info(), value_cache_info() and wrap_cache_info().
+        """
+        lines = [
+            "# HELP headerexposer_phase_seconds The time spent in each"
+            " phase of the targets' analyses.",
+            "# TYPE headerexposer_phase_seconds histogram",
+        ]
+
+        with self._lock:
+            phases = sorted(
+                self._phases.items(),
+                key=lambda item: (
+                    PHASES.index(item[0]) if item[0] in PHASES else len(PHASES)
+                ),
+            )
+
+            for phase, histogram in phases:
+                lines += [
+                    _sample("phase_seconds_bucket", count, phase=phase, le=le)
+                    for le, count in zip(
+                        [repr(bound) for bound in BUCKETS] + ["+Inf"],
+                        histogram[:-1],
+                    )
+                ] + [
+                    _sample("phase_seconds_sum", histogram[-1], phase=phase),
+                    _sample("phase_seconds_count", histogram[-2], phase=phase),
+                ]
+
+            lines += [
+                "# HELP headerexposer_targets_total The targets analysed,"
+                " by outcome.",
+                "# TYPE headerexposer_targets_total counter",
+            ] + [
+                _sample("targets_total", count, outcome=outcome)
+                for outcome, count in self._targets.items()
+            ]
+
+            lines += [
+                "# HELP headerexposer_responses_total The responses"
+                " analysed, by status class.",
+                "# TYPE headerexposer_responses_total counter",
+            ] + [
+                _sample("responses_total", count, status_class=status_class)
+                for status_class, count in sorted(self._responses.items())
+            ]
+
+        wrap_caches = he.wrap_cache_info()
+        caches = {
+            "findings": he.findings_cache_info(),
+            "value": he.value_cache_info(),
+            "safe_wrap": wrap_caches["safe_wrap"],
+            "wrap_and_join": wrap_caches["wrap_and_join"],
+        }
+
+        for name, kind, help_text, field in [
+            ("hits_total", "counter", "The hits of each cache.", "hits"),
+            ("misses_total", "counter", "The misses of each cache.", "misses"),
+            ("entries", "gauge", "The entries of each cache.", "currsize"),
+        ]:
+            lines += [
+                f"# HELP headerexposer_cache_{name} {help_text}",
+                f"# TYPE headerexposer_cache_{name} {kind}",
+            ] + [
+                _sample(f"cache_{name}", getattr(info, field), cache=cache)
+                for cache, info in caches.items()
+            ]
+
+        return "\n".join(lines) + "\n"
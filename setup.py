@@ -33,11 +33,9 @@ setuptools.setup(
     " practices",
     python_requires=">=3.7",
     install_requires=[
-        "ansiwrap",
         "colorama",
         "jsonschema",
         "requests",
-        "tabulate",
         "urllib3",
     ],
     entry_points={
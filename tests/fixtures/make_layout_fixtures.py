@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Generate layout.json, the rendering fixtures of test_layout.py.
+
+The fixtures pin the tables and wrapped texts rendered by headerexposer
+before its layout engine replaced ansiwrap and tabulate (1bc65d1), so
+that the engine is checked against those libraries' output. They were
+generated with ansiwrap 0.8.4 and tabulate 0.10.0:
+
+    git archive 1bc65d1 headerexposer | tar -x -C /tmp/old
+    python3 tests/fixtures/make_layout_fixtures.py /tmp/old
+
+ansiwrap wraps with textwrap3, whose long words are not split at their
+hyphens as the standard textwrap does since Python 3.10. The engine
+follows the standard textwrap on purpose, so textwrap3 is given the
+standard rules here.
+"""
+
+import json
+import os
+import sys
+import textwrap
+
+import ansiwrap.core  # type: ignore
+
+HEADER_SETS = [
+    {},
+    {
+        "Strict-Transport-Security": "max-age=31536000; includeSubDomains;"
+        " preload",
+        "X-Frame-Options": "DENY",
+        "X-Content-Type-Options": "nosniff",
+        "Referrer-Policy": "strict-origin-when-cross-origin",
+        "Cache-Control": "no-store",
+    },
+    {
+        "Strict-Transport-Security": "max-age=0",
+        "X-Frame-Options": "ALLOW-FROM"
+        " https://example.com/a/very/long/path/that/needs/wrapping",
+        "Referrer-Policy": "unsafe-url, origin",
+        "X-XSS-Protection": "1; mode=block",
+        "Feature-Policy": "camera 'none'; microphone 'self'"
+        " https://media.example.com; geolocation *",
+        "X-Permitted-Cross-Domain-Policies": "all",
+    },
+]
+
+TABLE_WIDTHS = [None, 60, 120]
+
+WRAP_WIDTHS = [25, 40, 70]
+
+WRAP_SEPARATORS = ["\n", "\\\n"]
+
+
+def main():
+    """Write layout.json next to this script."""
+    old_tree = sys.argv[1]
+    sys.path.insert(0, old_tree)
+
+    wrapper = ansiwrap.core.a_textwrap.TextWrapper
+    wrapper.wordsep_re = textwrap.TextWrapper.wordsep_re
+    wrapper._handle_long_word = textwrap.TextWrapper._handle_long_word
+
+    import headerexposer as he  # pylint: disable=C0415
+
+    tables = []
+    texts = {"max-age=31536000; includeSubDomains; preload": None}
+
+    for no_colors in [False, True]:
+        baseline = he.load_baseline(
+            os.path.join(old_tree, "headerexposer", "baseline.json"),
+            no_colors,
+        )
+
+        for index, headers in enumerate(HEADER_SETS):
+            # The detailed findings are long, one set of them is enough.
+            for short in [True, False] if index == 2 else [True]:
+                findings = [
+                    {
+                        key: finding[key]
+                        for key in [
+                            "header",
+                            "value",
+                            "rating",
+                            "explanations",
+                            "references",
+                        ]
+                    }
+                    for finding in he.analyse_headers(headers, baseline, short)
+                ]
+
+                tables += [
+                    {
+                        "findings": findings,
+                        "tables": [
+                            [width, he.tabulate_findings(findings, width)]
+                            for width in TABLE_WIDTHS
+                        ],
+                    }
+                ]
+
+                texts.update(
+                    dict.fromkeys(
+                        finding["explanations"][-1]
+                        for finding in findings
+                        if finding["explanations"]
+                    )
+                )
+
+    wraps = [
+        {
+            "text": text,
+            "width": width,
+            "sep": sep,
+            "wrapped": he.wrap_and_join(text, width, sep),
+        }
+        for text in texts
+        for width in WRAP_WIDTHS
+        for sep in WRAP_SEPARATORS
+    ]
+
+    path = os.path.join(os.path.dirname(__file__), "layout.json")
+
+    with open(path, "w", encoding="utf-8") as fixtures:
+        json.dump({"tables": tables, "wraps": wraps}, fixtures, indent=1)
+        fixtures.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Check the reading of HAR and WARC archives."""
+
+import gzip
+import io
+import json
+
+from headerexposer.archive import (
+    detect_format,
+    iter_har_responses,
+    iter_warc_responses,
+    open_archive,
+)
+
+
+def warc_record(http_message, record_type=b"response"):
+    """Return a WARC record holding an HTTP message."""
+    return (
+        b"WARC/1.0\r\n"
+        b"WARC-Type: %s\r\n"
+        b"WARC-Target-URI: https://example.com/\r\n"
+        b"Content-Type: application/http; msgtype=response\r\n"
+        b"Content-Length: %d\r\n"
+        b"\r\n"
+        b"%s\r\n"
+        b"\r\n" % (record_type, len(http_message), http_message)
+    )
+
+
+def read_warc(data):
+    return list(iter_warc_responses(io.BufferedReader(io.BytesIO(data))))
+
+
+def read_har(entries):
+    har = json.dumps({"log": {"entries": entries}}).encode()
+
+    return list(iter_har_responses(io.BufferedReader(io.BytesIO(har))))
+
+
+def test_warc_responses():
+    results = read_warc(
+        warc_record(b"HTTP/1.1 200 OK\r\nX-Frame-Options: DENY\r\n\r\nbody")
+    )
+
+    assert len(results) == 1
+    assert results[0]["url"] == "https://example.com/"
+    assert results[0]["status_code"] == 200
+    assert results[0]["reason"] == "OK"
+    assert results[0]["length"] == 4
+    assert dict(results[0]["headers"]) == {"X-Frame-Options": "DENY"}
+    assert results[0]["error"] is None
+
+
+def test_invalid_warc_status_line_does_not_end_the_stream():
+    results = read_warc(
+        warc_record(b"HTTP/1.1 abc OK\r\nX-Frame-Options: DENY\r\n\r\n")
+        + warc_record(b"HTTP/1.1\r\n\r\n")
+        + warc_record(b"HTTP/1.1 204 No Content\r\n\r\n")
+    )
+
+    assert [result["status_code"] for result in results] == [None, None, 204]
+    assert results[0]["error"].startswith("Invalid HTTP status line")
+    assert results[1]["error"].startswith("Invalid HTTP status line")
+    assert results[0]["url"] == "https://example.com/"
+    assert results[2]["error"] is None
+
+
+def test_har_responses():
+    results = read_har(
+        [
+            {
+                "request": {"url": "https://example.com/"},
+                "response": {
+                    "status": 200,
+                    "statusText": "OK",
+                    "headers": [
+                        {"name": ":status", "value": "200"},
+                        {"name": "X-Frame-Options", "value": "DENY"},
+                    ],
+                    "content": {"size": 4},
+                },
+            },
+            {"request": {"url": "https://example.com/blocked"}},
+        ]
+    )
+
+    assert results[0]["status_code"] == 200
+    assert results[0]["length"] == 4
+    assert dict(results[0]["headers"]) == {"X-Frame-Options": "DENY"}
+    assert results[0]["error"] is None
+    assert results[1]["error"] == "No response was recorded."
+
+
+def test_invalid_har_entries_do_not_end_the_stream():
+    results = read_har(
+        [
+            {
+                "request": {"url": "https://example.com/a"},
+                "response": {"status": 200, "headers": [{"name": "A"}]},
+            },
+            {"request": {"url": "https://example.com/b"}, "response": "none"},
+            "not an entry",
+            {
+                "request": {"url": "https://example.com/c"},
+                "response": {
+                    "status": 200,
+                    "headers": [{"name": "A", "value": "b"}],
+                },
+            },
+        ]
+    )
+
+    assert [result["url"] for result in results] == [
+        "https://example.com/a",
+        "https://example.com/b",
+        None,
+        "https://example.com/c",
+    ]
+    assert results[0]["error"].startswith("Entry 1: ")
+    assert results[1]["error"].startswith("Entry 2: ")
+    assert results[2]["error"].startswith("Entry 3: ")
+    assert results[3]["error"] is None
+    assert dict(results[3]["headers"]) == {"A": "b"}
+
+
+def test_closing_a_gzipped_archive_closes_the_file(tmp_path):
+    path = tmp_path / "archive.warc.gz"
+    path.write_bytes(gzip.compress(warc_record(b"HTTP/1.1 200 OK\r\n\r\n")))
+
+    with open_archive(str(path)) as stream:
+        assert detect_format(stream) == "warc"
+        raw_stream = stream._stream
+
+        assert len(list(iter_warc_responses(stream))) == 1
+
+    assert stream.closed
+    assert raw_stream.closed
@@ -0,0 +1,58 @@
+"""Check the batch analysis of header maps."""
+
+import argparse
+import io
+import json
+import os
+
+import pytest
+
+import headerexposer as he
+from headerexposer.__main__ import positive_int
+from headerexposer.batch import analyse_header_maps
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(he.__file__), "baseline_short.json"
+)
+
+
+def analyse(lines, jobs=1):
+    baseline = he.load_baseline(BASELINE_PATH, compiled=True)
+    output = io.StringIO()
+    analyse_header_maps(
+        io.BytesIO("".join(lines).encode()), output, baseline, jobs=jobs
+    )
+
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_records_are_analysed_in_order():
+    records = analyse(
+        [
+            '{"id": 1, "headers": {"X-Frame-Options": "DENY"}}\n',
+            "not json\n",
+            '{"id": 3, "headers": {}}\n',
+        ]
+    )
+
+    assert [record.get("id") for record in records] == [1, None, 3]
+    assert records[0]["error"] is None
+    assert records[1]["error"].startswith("Line 2: ")
+    assert records[2]["findings"]
+
+
+@pytest.mark.parametrize("jobs", [0, -1])
+def test_jobs_must_be_positive(jobs):
+    with pytest.raises(ValueError):
+        analyse(['{"headers": {}}\n'], jobs=jobs)
+
+
+def test_jobs_option_must_be_positive():
+    assert positive_int("4") == 4
+
+    for value in ("0", "-2"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(value)
+
+    with pytest.raises(ValueError):
+        positive_int("x")
@@ -0,0 +1,112 @@
+"""Check the findings and value caches of the analyses."""
+
+import os
+import time
+
+import headerexposer as he
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(he.__file__), "baseline_short.json"
+)
+
+HEADERS = he.Headers(
+    [
+        ("X-Frame-Options", "DENY"),
+        ("X-Content-Type-Options", "nosniff"),
+        ("Referrer-Policy", "no-referrer"),
+    ]
+)
+
+
+def test_dict_baselines_leave_the_caches_unchanged():
+    baseline = he.load_baseline(BASELINE_PATH)
+    he.clear_value_cache()
+    he.clear_findings_cache()
+
+    findings = he.analyse_headers(HEADERS, baseline)
+    findings += list(he.iter_findings(HEADERS, baseline))
+
+    assert findings
+    assert he.value_cache_info() == (0, 0, he.VALUE_CACHE_SIZE, 0)
+    assert he.findings_cache_info() == (0, 0, he.FINDINGS_CACHE_SIZE, 0)
+
+
+def test_compiled_baselines_use_the_caches():
+    baseline = he.load_baseline(BASELINE_PATH, compiled=True)
+    he.clear_value_cache()
+    he.clear_findings_cache()
+
+    findings = he.analyse_headers(HEADERS, baseline)
+
+    assert he.value_cache_info().misses == len(HEADERS)
+    assert he.value_cache_info().currsize == len(HEADERS)
+    assert he.analyse_headers(HEADERS, baseline) == findings
+    assert he.findings_cache_info().hits == 1
+
+
+def test_dict_and_compiled_baselines_agree():
+    baseline = he.load_baseline(BASELINE_PATH)
+
+    assert he.analyse_headers(HEADERS, baseline) == he.analyse_headers(
+        HEADERS, he.compile_baseline(baseline)
+    )
+
+
+# A pattern backtracking catastrophically on HOSTILE_VALUE, and a value
+# it matches quickly.
+SLOW_BASELINE = he.guard_baseline(
+    he.compile_baseline(
+        {
+            "headers": [
+                {
+                    "name": "X-Slow",
+                    "validation_pattern": "^(a+)+$",
+                    "default_rating": "good",
+                    "invalid_explanation": "The header is invalid.",
+                }
+            ]
+        }
+    ),
+    he.MatchLimits(match_timeout=0.05),
+)
+HOSTILE_VALUE = "a" * 40 + "b"
+
+
+def analyse_slow_header(value):
+    """Return the analysis of an X-Slow value, and its duration."""
+    start = time.perf_counter()
+    findings = he.analyse_headers({"X-Slow": value}, SLOW_BASELINE)
+
+    return he.plain_finding(findings[0]), time.perf_counter() - start
+
+
+def test_timed_out_analyses_are_not_cached(monkeypatch):
+    he.clear_value_cache()
+    he.clear_findings_cache()
+
+    finding, _ = analyse_slow_header(HOSTILE_VALUE)
+
+    assert finding["rating"] == "bad"
+    assert "longer than 0.05 seconds" in finding["explanations"][-1]
+    assert he.value_cache_info().currsize == 0
+    assert he.findings_cache_info().currsize == 0
+
+    # A repeated hostile value only costs the timeout once in a while.
+    assert analyse_slow_header(HOSTILE_VALUE)[1] < 0.05
+
+    monkeypatch.setattr(he, "TIMEOUT_CACHE_SECONDS", 0.0)
+    he.clear_value_cache()
+
+    analyse_slow_header(HOSTILE_VALUE)
+    assert analyse_slow_header(HOSTILE_VALUE)[1] >= 0.05
+
+
+def test_completed_analyses_are_cached():
+    he.clear_value_cache()
+    he.clear_findings_cache()
+
+    finding, _ = analyse_slow_header("aaaa")
+
+    assert finding["rating"] == "good"
+    assert he.value_cache_info().currsize == 1
+    assert he.findings_cache_info().currsize == 1
@@ -0,0 +1,133 @@
+"""Check the layout engine against the output of ansiwrap and tabulate.
+
+The fixtures were rendered by ansiwrap and tabulate, see
+fixtures/make_layout_fixtures.py. The outputs are compared as a terminal
+displays them: the same characters, with the same colors. Two changes
+are intentional: wrapped lines no longer keep a trailing space before
+the reset code closing them (hence before the separator), and styles
+are no longer reset where none is active.
+"""
+
+import json
+import os
+import re
+
+import pytest
+
+import headerexposer as he
+
+with open(
+    os.path.join(os.path.dirname(__file__), "fixtures", "layout.json"),
+    encoding="utf-8",
+) as fixtures_file:
+    FIXTURES = json.load(fixtures_file)
+
+SGR_PATTERN = re.compile(r"\033\[([\d;]*)m")
+
+
+def _apply_sgr(style, parameter):
+    """Return the style resulting from an SGR parameter."""
+    if parameter in ("", "0"):
+        return frozenset()
+
+    # A color replaces the previous one.
+    if len(parameter) == 2 and parameter[0] in "39":
+        style = {p for p in style if not (len(p) == 2 and p[0] in "39")}
+
+    return frozenset(style) | {parameter}
+
+
+def displayed(text, sep="\n"):
+    """Return the lines of text as displayed: (character, style) cells.
+
+    Trailing spaces are dropped, as well as trailing empty lines.
+    """
+    lines = []
+    style = frozenset()
+
+    for line in text.split(sep):
+        cells = []
+        position = 0
+
+        for sgr in SGR_PATTERN.finditer(line):
+            cells += [(char, style) for char in line[position : sgr.start()]]
+
+            for parameter in sgr.group(1).split(";"):
+                style = _apply_sgr(style, parameter)
+
+            position = sgr.end()
+
+        cells += [(char, style) for char in line[position:]]
+
+        while cells and cells[-1][0] == " ":
+            cells.pop()
+
+        lines += [cells]
+
+    while lines and not lines[-1]:
+        lines.pop()
+
+    return lines
+
+
+@pytest.mark.parametrize(
+    "case",
+    [
+        (fixture["findings"], width, table)
+        for fixture in FIXTURES["tables"]
+        for width, table in fixture["tables"]
+    ],
+)
+def test_tabulate_findings(case):
+    findings, width, table = case
+
+    assert displayed(he.tabulate_findings(findings, width)) == displayed(table)
+
+
+@pytest.mark.parametrize("wrap", FIXTURES["wraps"])
+def test_wrap_and_join(wrap):
+    wrapped = he.wrap_and_join(wrap["text"], wrap["width"], wrap["sep"])
+
+    assert displayed(wrapped, wrap["sep"]) == displayed(
+        wrap["wrapped"], wrap["sep"]
+    )
+
+
+def test_trailing_space_is_dropped():
+    wrapped = he.wrap_and_join("\033[91mThe header is absent. \033[0m", 25)
+
+    assert wrapped == "\033[91mThe header is absent.\033[0m"
+
+
+def test_uncolored_tables_are_identical():
+    # Without colored explanations, there is no reset code to drop a
+    # space before, so the tables are identical byte for byte.
+    uncolored = [
+        fixture
+        for fixture in FIXTURES["tables"]
+        if not any(
+            "\033" in explanation
+            for finding in fixture["findings"]
+            for explanation in finding["explanations"]
+        )
+    ]
+
+    assert uncolored
+
+    for fixture in uncolored:
+        for width, table in fixture["tables"]:
+            assert he.tabulate_findings(fixture["findings"], width) == table
+
+
+def test_numeric_columns_are_right_aligned():
+    table = he.tabulate_rows(
+        [["a", "1", "986.55", "1.5x"], ["bb", "42", "3.10", "2"]],
+        ["Name", "Count", "Time", "Other"],
+    )
+
+    assert table.splitlines() == [
+        "Name      Count    Time  Other",
+        "------  -------  ------  -------",
+        "a             1  986.55  1.5x",
+        "bb           42    3.10  2",
+    ]
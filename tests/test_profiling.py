@@ -0,0 +1,94 @@
+"""Check the profiling of a baseline's patterns."""
+
+import headerexposer as he
+from headerexposer.profiling import PatternProfiler, tabulate_profile
+
+BASELINE = he.compile_baseline(
+    {
+        "headers": [
+            {
+                "name": "X-Slow",
+                "validation_pattern": "^(a+)+$",
+                "default_rating": "good",
+                "explanation_patterns": [
+                    {"pattern": "^a{4}$", "present": "Four."}
+                ],
+            }
+        ]
+    }
+)
+
+
+def test_patterns_are_profiled():
+    profiler = PatternProfiler(
+        he.guard_baseline(
+            BASELINE, he.MatchLimits(max_length=100, match_timeout=0.05)
+        )
+    )
+    he.clear_value_cache()
+
+    for value in ["aaaa", "aaaa", "a" * 40 + "b", "a" * 101]:
+        profiler.add({"X-Slow": value})
+
+    profiler.add_lines([b'{"headers": {"X-Slow": "aa"}}\n', b"invalid\n"])
+    report = profiler.report()
+
+    assert report["values"] == 5
+    assert report["too_long"] == 1
+    assert report["errors"] == 1
+
+    validation, explanation = sorted(
+        report["patterns"], key=lambda pattern: pattern["pattern"]
+    )
+
+    # Every value is matched, as the value cache is not used.
+    assert validation["pattern"] == "^(a+)+$"
+    assert validation["calls"] == 4
+    assert validation["timeouts"] == 1
+    assert validation["max_length"] == 41
+    assert validation["max_seconds"] >= 0.05
+    # The matches of "aaaa" and "aa", and the substitutions of "aaaa".
+    assert explanation["calls"] == 5
+    assert explanation["timeouts"] == 0
+    assert he.value_cache_info().currsize == 0
+
+
+def test_numeric_columns_are_right_aligned():
+    report = {
+        "values": 2,
+        "too_long": 0,
+        "errors": 0,
+        "patterns": [
+            {
+                "header": "X-Slow",
+                "pattern": "^(a+)+$",
+                "calls": 1200,
+                "seconds": 0.98655,
+                "max_seconds": 0.5,
+                "max_length": 41,
+                "timeouts": 1,
+            },
+            {
+                "header": "X-Slow",
+                "pattern": "^a{4}$",
+                "calls": 3,
+                "seconds": 0.00001,
+                "max_seconds": 0.00001,
+                "max_length": 4,
+                "timeouts": 0,
+            },
+        ],
+    }
+
+    assert tabulate_profile(report).splitlines() == [
+        "2 values, 0 too long to be matched, 0 errors",
+        "",
+        "Header    Pattern      Calls    Total (ms)    Max (ms)    Max length"
+        "    Timeouts",
+        "--------  ---------  -------  ------------  ----------  ------------"
+        "  ----------",
+        "X-Slow    ^(a+)+$       1200        986.55      500.00            41"
+        "           1",
+        "X-Slow    ^a{4}$           3          0.01        0.01             4"
+        "           0",
+    ]
@@ -0,0 +1,281 @@
+"""Check the scan scheduler against a local stub server.
+
+The stub server answers GET /<behaviour>/<id>, where the behaviour is:
+    delay-<ms>: answer 200 after ms milliseconds;
+    429-<n>: answer 429 (with Retry-After: 0) to the first n requests of
+             the url, then 200;
+    503-<n>: answer 503 to the first n requests of the url, then 200;
+    404: answer 404.
+It counts the requests of each url, records when they were received,
+and the peak number of requests in flight.
+"""
+
+import collections
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+import headerexposer as he
+import headerexposer.scan
+from headerexposer.scan import INITIAL_HOST_CONCURRENCY, _Host, iter_scan
+
+# The scheduler only needs the baseline to analyse the responses.
+BASELINE = he.compile_baseline(
+    {
+        "headers": [
+            {
+                "name": "X-Frame-Options",
+                "validation_pattern": ".*",
+                "default_rating": "good",
+                "absent_explanation": "The header is absent.",
+            }
+        ]
+    }
+)
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answer the requests as described in the module's docstring."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, headers=()):
+        self.send_response(status)
+
+        for name, value in [("X-Frame-Options", "DENY"), *headers]:
+            self.send_header(name, value)
+
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def do_GET(self):  # pylint: disable=C0103
+        stats = self.server.stats
+        behaviour = self.path.split("/")[1]
+
+        with stats.lock:
+            stats.requests[self.path] += 1
+            stats.times[self.path].append(time.monotonic())
+            stats.in_flight += 1
+            stats.peak = max(stats.peak, stats.in_flight)
+            count = stats.requests[self.path]
+
+        try:
+            kind, _, argument = behaviour.partition("-")
+
+            if kind == "delay":
+                time.sleep(int(argument) / 1000)
+                self.reply(200)
+
+            elif kind == "429" and count <= int(argument):
+                self.reply(429, [("Retry-After", "0")])
+
+            elif kind == "503" and count <= int(argument):
+                self.reply(503)
+
+            elif kind == "404":
+                self.reply(404)
+
+            else:
+                self.reply(200)
+
+        finally:
+            with stats.lock:
+                stats.in_flight -= 1
+
+
+class Stats:
+    """The requests received by the stub server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.times = collections.defaultdict(list)
+        self.in_flight = 0
+        self.peak = 0
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    """Run a stub server, yielding its base url and its Stats."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 128
+    server.stats = Stats()
+    thread = threading.Thread(
+        target=server.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}", server.stats
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name="fast_backoff")
+def fixture_fast_backoff(monkeypatch):
+    """Retry after a few milliseconds rather than after seconds."""
+    monkeypatch.setattr(headerexposer.scan, "BACKOFF_BASE", 0.01)
+
+
+def scan(urls, **kwargs):
+    """Scan urls, returning their results by url."""
+    return {
+        result["url"]: result
+        for result in iter_scan(urls, BASELINE, short=True, **kwargs)
+    }
+
+
+def test_per_host_limit(server):
+    base_url, stats = server
+    urls = [f"{base_url}/delay-20/{i}" for i in range(60)]
+
+    results = scan(urls, concurrency=20, per_host=4)
+
+    assert sorted(results) == sorted(urls)
+    assert all(result["status_code"] == 200 for result in results.values())
+    assert all(result["findings"] for result in results.values())
+    assert stats.peak <= 4
+    assert sum(stats.requests.values()) == len(urls)
+
+
+def test_host_limit_adapts_to_latency():
+    host = _Host("example.com", 8)
+    assert host.limit == INITIAL_HOST_CONCURRENCY
+
+    # Quick answers open the limit, up to the maximum.
+    for _ in range(100):
+        host.succeeded(0.01)
+
+    assert host.limit == 8
+
+    # Queuing requests close it.
+    for _ in range(20):
+        host.succeeded(1.0)
+
+    assert host.limit < 8
+
+    # Failures halve it, and keep the host alone for a while.
+    limit = host.limit
+    host.failed(now=10.0, delay=2.0)
+
+    assert host.limit == max(1.0, limit / 2)
+    assert host.ready_at == 12.0
+    host.queue.append(("https://example.com/", 0))
+    assert not host.can_send(11.0)
+    assert host.can_send(12.0)
+
+
+@pytest.mark.usefixtures("fast_backoff")
+@pytest.mark.parametrize("behaviour", ["429-2", "503-2"])
+def test_retried_statuses(server, behaviour):
+    base_url, stats = server
+    url = f"{base_url}/{behaviour}/1"
+
+    results = scan([url], retries=2)
+
+    assert results[url]["status_code"] == 200
+    assert stats.requests[f"/{behaviour}/1"] == 3
+
+
+@pytest.mark.usefixtures("fast_backoff")
+def test_retries_are_bounded(server):
+    base_url, stats = server
+    url = f"{base_url}/503-5/1"
+
+    results = scan([url], retries=1)
+
+    assert results[url]["status_code"] == 503
+    assert stats.requests["/503-5/1"] == 2
+
+
+@pytest.mark.usefixtures("fast_backoff")
+def test_other_statuses_are_not_retried(server):
+    base_url, stats = server
+    url = f"{base_url}/404/1"
+
+    results = scan([url], retries=2)
+
+    assert results[url]["status_code"] == 404
+    assert stats.requests["/404/1"] == 1
+
+
+def test_retries_wait_for_the_backoff(server, monkeypatch):
+    base_url, stats = server
+    monkeypatch.setattr(headerexposer.scan, "BACKOFF_BASE", 0.3)
+    monkeypatch.setattr(headerexposer.scan.random, "uniform", lambda a, b: 1)
+
+    # With a single request in flight, the host is still waiting for its
+    # turn, with a second url, when the first one fails.
+    results = scan(
+        [f"{base_url}/503-1/1", f"{base_url}/delay-0/2"], concurrency=1
+    )
+
+    assert results[f"{base_url}/503-1/1"]["status_code"] == 200
+    assert results[f"{base_url}/delay-0/2"]["status_code"] == 200
+
+    # Nothing is sent to the host during the backoff.
+    failed_at = stats.times["/503-1/1"][0]
+    next_requests = stats.times["/503-1/1"][1:] + stats.times["/delay-0/2"]
+
+    assert min(next_requests) - failed_at >= 0.3
+
+
+def test_deadline(server):
+    base_url, stats = server
+    urls = [f"{base_url}/delay-200/{i}" for i in range(20)]
+
+    start = time.monotonic()
+    results = scan(urls, concurrency=2, per_host=2, deadline=0.5)
+    elapsed = time.monotonic() - start
+
+    expired = [
+        url
+        for url, result in results.items()
+        if result["error"] == "Deadline exceeded, the url was not scanned."
+    ]
+
+    # Every url is reported, the ones not sent in time with an error.
+    assert sorted(results) == sorted(urls)
+    assert expired
+    assert sum(stats.requests.values()) + len(expired) == len(urls)
+    # The requests in flight at the deadline are awaited, not more.
+    assert elapsed < 2.0
+
+
+def test_created_session_is_closed(server, monkeypatch):
+    base_url, _ = server
+    sessions = []
+
+    class RecordingSession(requests.Session):
+        def __init__(self):
+            super().__init__()
+            self.closed = False
+            sessions.append(self)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    monkeypatch.setattr(
+        headerexposer.scan.requests, "Session", RecordingSession
+    )
+
+    scan([f"{base_url}/delay-0/1"])
+
+    assert len(sessions) == 1
+    assert sessions[0].closed
+
+    # A session passed by the caller is left open.
+    session = RecordingSession()
+    scan([f"{base_url}/delay-0/2"], session=session)
+
+    assert not session.closed
+    session.close()
@@ -0,0 +1,141 @@
+"""Check the state of the urls kept between incremental scans."""
+
+import os
+import sqlite3
+
+import headerexposer as he
+from headerexposer.state import ScanState
+
+BASELINE = he.load_baseline(
+    os.path.join(os.path.dirname(he.__file__), "baseline.json"),
+    compiled=True,
+)
+
+URL = "https://example.com/"
+HEADERS = he.Headers([("X-Frame-Options", "DENY"), ("ETag", '"v1"')])
+
+
+def scanned(headers=HEADERS, short=False, redirects=None):
+    """Return the result of a scan of URL, as scan_url() does."""
+    result = {
+        "url": URL,
+        "status_code": 200,
+        "reason": "OK",
+        "length": 0,
+        "headers": headers,
+        "findings": he.analyse_headers(headers, BASELINE, short),
+        "error": None,
+    }
+
+    if redirects is not None:
+        result["redirects"] = redirects
+
+    return result
+
+
+def test_unchanged_headers_are_not_analysed_again(tmp_path):
+    with ScanState(str(tmp_path / "state.sqlite3")) as state:
+        assert state.update(scanned(), None, BASELINE)
+        previous = state.get(URL)
+
+        assert previous.etag == '"v1"'
+        assert previous.conditional_headers() == {"If-None-Match": '"v1"'}
+        assert previous.is_unchanged(HEADERS, BASELINE)
+        assert not previous.is_unchanged(
+            he.Headers([("X-Frame-Options", "SAMEORIGIN")]), BASELINE
+        )
+
+        assert not state.update(scanned(), previous, BASELINE)
+        assert state.counts == {
+            "new": 1,
+            "changed": 0,
+            "unchanged": 1,
+            "error": 0,
+        }
+
+
+def test_analysis_options_are_part_of_the_state(tmp_path):
+    with ScanState(str(tmp_path / "state.sqlite3")) as state:
+        state.update(scanned(short=True), None, BASELINE, short=True)
+        previous = state.get(URL)
+
+        assert previous.is_unchanged(HEADERS, BASELINE, short=True)
+        assert not previous.is_unchanged(HEADERS, BASELINE, short=False)
+
+        # The detailed findings are reported, as they differ.
+        assert state.update(scanned(short=False), previous, BASELINE)
+        assert state.get(URL).is_unchanged(HEADERS, BASELINE, short=False)
+
+
+def test_redirects_are_part_of_the_findings(tmp_path):
+    def redirects(value):
+        headers = he.Headers([("X-Frame-Options", value)])
+
+        return [
+            {
+                "url": "http://example.com/",
+                "status_code": 301,
+                "reason": "Moved Permanently",
+                "headers": headers,
+                "findings": he.analyse_headers(headers, BASELINE),
+            }
+        ]
+
+    with ScanState(str(tmp_path / "state.sqlite3")) as state:
+        state.update(
+            scanned(redirects=redirects("DENY")),
+            None,
+            BASELINE,
+            redirect_chain=True,
+        )
+        previous = state.get(URL)
+
+        # The redirects' headers are not stored, so the final response's
+        # headers are always analysed.
+        assert not previous.is_unchanged(
+            HEADERS, BASELINE, redirect_chain=True
+        )
+        assert not state.update(
+            scanned(redirects=redirects("DENY")),
+            previous,
+            BASELINE,
+            redirect_chain=True,
+        )
+        assert state.update(
+            scanned(redirects=redirects("SAMEORIGIN")),
+            previous,
+            BASELINE,
+            redirect_chain=True,
+        )
+
+
+def test_states_without_options_are_analysed_again(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    # The schema of the databases created before the options were
+    # stored.
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE targets (url TEXT PRIMARY KEY, etag TEXT,"
+        " last_modified TEXT, headers TEXT NOT NULL, baseline_version TEXT,"
+        " findings_hash TEXT NOT NULL, scanned_at REAL NOT NULL)"
+    )
+    connection.execute(
+        "INSERT INTO targets VALUES (?, NULL, NULL, ?, ?, 'hash', 0)",
+        (
+            URL,
+            '{"X-Frame-Options": "DENY"}',
+            BASELINE.version,
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+    with ScanState(path) as state:
+        previous = state.get(URL)
+
+        assert previous.options is None
+        assert not previous.is_unchanged(HEADERS, BASELINE)
+
+        state.update(scanned(), previous, BASELINE)
+        assert state.get(URL).is_unchanged(HEADERS, BASELINE)
@@ -0,0 +1,77 @@
+"""Check the timing of the network phases of a request."""
+
+import http.server
+import threading
+
+import pytest
+import requests
+
+from headerexposer.timings import TimedHTTPAdapter, Timings, recording
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):  # pylint: disable=C0103
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+@pytest.fixture(name="base_url")
+def fixture_base_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+
+    yield f"http://localhost:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name="session")
+def fixture_session():
+    with requests.Session() as session:
+        session.mount("http://", TimedHTTPAdapter())
+        yield session
+
+
+def test_phases_are_timed(base_url, session):
+    timings = Timings()
+
+    with recording(timings):
+        response = session.get(f"{base_url}/")
+
+    assert response.status_code == 200
+    assert set(timings) == {"dns", "connect", "ttfb"}
+
+    # The pooled connection is reused: it is neither resolved nor
+    # established again.
+    timings = Timings()
+
+    with recording(timings):
+        session.get(f"{base_url}/")
+
+    assert set(timings) == {"ttfb"}
+
+
+def test_connections_are_not_timed_outside_of_recording(base_url, session):
+    assert session.get(f"{base_url}/").status_code == 200
+
+
+def test_unresolvable_hosts_are_connection_errors(session):
+    timings = Timings()
+
+    with recording(timings), pytest.raises(requests.ConnectionError):
+        session.get("http://unresolvable.invalid/")
+
+    assert "dns" in timings
+    assert "connect" not in timings